@@ -1,5 +1,9 @@
 import holepunch.server
 import holepunch.client
+import holepunch.shard
+import holepunch.bench
+import holepunch.trace
+import holepunch.tuning
 
 
 def parse_args():
@@ -9,7 +13,7 @@ def parse_args():
 
         parser.add_argument("application",
                 type=str,
-                choices=["server", "client"],
+                choices=["server", "client", "bench"],
                 help="application type"
                 )
 
@@ -17,7 +21,7 @@ def parse_args():
                 nargs="?",
                 default=None,
                 type=str,
-                choices=["udp", "tcp"],
+                choices=["udp", "tcp", "any"],
                 help="destination host"
                 )
 
@@ -28,24 +32,154 @@ def parse_args():
                 help="destination host"
                 )
 
+        parser.add_argument("--workers",
+                default=None,
+                type=int,
+                help="number of server worker processes, of the tuning profile by default"
+                )
+
+        parser.add_argument("--profile",
+                default=None,
+                type=str,
+                choices=sorted(holepunch.tuning.PRESETS),
+                help="socket tuning profile"
+                )
+
+        parser.add_argument("--tuning-file",
+                default=None,
+                type=str,
+                help="socket tuning json file"
+                )
+
+        parser.add_argument("--tune",
+                default=[],
+                action="append",
+                type=str,
+                metavar="OPTION=VALUE",
+                help="socket tuning option overriding the profile"
+                )
+
+        parser.add_argument("--udp",
+                action="store_true",
+                help="also accept server requests as UDP datagrams"
+                )
+
+        parser.add_argument("--datagram",
+                action="store_true",
+                help="send client requests to the server as UDP datagrams"
+                )
+
+        parser.add_argument("--relay",
+                action="store_true",
+                help="relay clients whose punch failed"
+                )
+
+        parser.add_argument("--metrics",
+                action="store_true",
+                help="export server metrics over http"
+                )
+
+        parser.add_argument("--log-level",
+                default=None,
+                type=str.upper,
+                choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                help="logging level, INFO traces server events"
+                )
+
+        parser.add_argument("--trace-sample",
+                default=None,
+                type=int,
+                help="trace one server event of every sample"
+                )
+
+        parser.add_argument("--pairs",
+                default=1000,
+                type=int,
+                help="number of benchmark listen/connect client pairs"
+                )
+
+        parser.add_argument("--concurrency",
+                default=100,
+                type=int,
+                help="number of benchmark connect requests in flight"
+                )
+
+        parser.add_argument("--transport",
+                action="store_true",
+                help="benchmark reliable UDP transport instead of the server"
+                )
+
+        parser.add_argument("--size",
+                default=16777216,
+                type=int,
+                help="number of bytes sent per transport benchmark transfer"
+                )
+
+        parser.add_argument("--loss",
+                default=[0, 0.01, 0.05],
+                nargs="+",
+                type=float,
+                help="transport benchmark datagram loss rates"
+                )
+
+        parser.add_argument("--delay",
+                default=0.005,
+                type=float,
+                help="transport benchmark one way delay in seconds"
+                )
+
+        parser.add_argument("--json",
+                action="store_true",
+                help="print benchmark report as json"
+                )
+
         args = parser.parse_args()
 
         if args.application == "client" and args.protocol is None:
                 parser.error("the following arguments are required: protocol, destination")
 
+        try:
+                overrides = dict(option.split("=", 1) for option in args.tune)
+                holepunch.tuning.load(args.profile, args.tuning_file, overrides)
+        except (ValueError, OSError) as e:
+                parser.error("tuning: {0}".format(e))
+
         return args
 
 
 def main():
     args = parse_args()
 
+    holepunch.trace.TRACER.open()
+    holepunch.trace.TRACER.configure(level=args.log_level, sample=args.trace_sample)
+
     if args.application == "server":
-        holepunch.server.Server().run()
+        workers = holepunch.tuning.PROFILE.workers if args.workers is None else args.workers
+
+        if workers > 1:
+            holepunch.shard.Broker(workers, udp=args.udp, relay=args.relay, metrics=args.metrics).run()
+        else:
+            holepunch.server.Server(udp=args.udp, relay=args.relay, metrics=args.metrics).run()
     elif args.application == "client":
+        server = holepunch.client.DatagramServer() if args.datagram else None
+
         if args.protocol == "udp":
-            holepunch.client.TCPClient().open(args.destination)
+            holepunch.client.UDPClient(server).open(args.destination)
         elif args.protocol == "tcp":
-            holepunch.client.TCPClient().open(args.destination)
+            holepunch.client.TCPClient(server).open(args.destination)
+        elif args.protocol == "any":
+            holepunch.client.HybridClient(server).open(args.destination)
+    elif args.application == "bench":
+        if args.transport:
+            report = holepunch.bench.TransportBenchmark(args.size, args.loss, args.delay).run()
+        else:
+            report = holepunch.bench.Benchmark(args.pairs, args.concurrency).run()
+
+        if args.json:
+            print(__import__("json").dumps(report))
+        else:
+            for key, value in report.items():
+                print("{0}: {1}".format(key, value))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,723 @@
+"""Asyncio client for P2P communication across NAT/Firewall.
+
+Asyncio counterpart of holepunch.client. Awaiting open will send a listen or
+connect request to a holepunch server and punch a hole to the destination
+without blocking the event loop, so one event loop can drive many introductions
+and punched sessions concurrently.
+
+Example:
+    Listening client::
+
+        client1 = holepunch.aio.client.TCPClient()
+        await client1.open() # Wait for holepunch response
+        await client1.send(b"OK")
+
+    Connecting client::
+
+        client2 = holepunch.aio.client.TCPClient()
+        await client2.open(client1_host) # Wait for holepunch response
+        data = await client2.recv()
+"""
+
+
+import asyncio
+import collections
+import logging
+import socket
+
+import holepunch.client
+import holepunch.config
+import holepunch.message
+import holepunch.nat
+import holepunch.tuning
+
+
+class Client:
+    """Asyncio wrapper for P2P communication across NAT/Firewall.
+
+    Asyncio wrapper for P2P communication across NAT/Firewall opened by
+    requesting the holepunching server to introduce source to dest. On holepunch
+    (*) server response each client will send UDP/TCP packet with source address
+    and destination address.
+
+    Attributes:
+        _server: Holepunch server connection.
+        _addr:  Client host and port address tuple.
+    """
+
+    @property
+    def addr(self):
+        """Addr accessor."""
+        return self._addr
+
+    @addr.setter
+    def addr(self, value):
+        """Addr mutator."""
+        self._addr = value
+
+    def __init__(self):
+        """Initialise client."""
+
+        self._server = Server()
+        self._addr = None
+
+    async def _holepunch(self, source_addr, dest_addr, ports):
+        """Punch hole on NAT/Firewall.
+
+        Args:
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            ports: Destination ports punched in parallel.
+
+        Returns:
+            addr: Tuple of dest host address and dest port address punched.
+        """
+
+        raise NotImplementedError
+
+    async def open(self, dest_host=None):
+        """Open client-client connection.
+
+        Open connection between source_host and dest_host on source_port and
+        dest_port received by server. Source port is the port of the
+        client-server connection and destination ports predicted from the
+        delta received are punched in parallel.
+
+        Args:
+            dest_host: Destination host address. If dest_host is None then client will receive a connect request else will send a connect request.
+
+        Raises:
+            Exception: Excpetion if connection cannot open because response is not holepunch.
+        """
+
+        # Handle request
+        if dest_host is None:
+            # Listen (<) request
+            response = await self._server.listen_request()
+        else:
+            # Connect (>dest_host) request
+            response = await self._server.connect_request(dest_host)
+
+        # Handle response
+        if response.method == "*":
+            # Holepunch (*(dest_host, dest_port, delta, token)) response
+            source_addr = holepunch.client.source(self._server, response)
+            dest_addr = response.body[:2]
+            self._addr = await self._holepunch(source_addr, dest_addr, holepunch.nat.predict(*response.body[1:3]))
+        else:
+            # NotFound (?), Close (.) response
+            raise Exception(response)
+
+        logging.info("Open client-client connection %s", self._addr)
+
+    def close(self):
+        """Close client-client connection."""
+
+        raise NotImplementedError
+
+    async def send(self, data):
+        """Send client-client data.
+
+        Args:
+            data: Data as bytes sent to client.
+        """
+
+        raise NotImplementedError
+
+    async def recv(self):
+        """Receive client-client data.
+
+        Returns:
+            data: Data as bytes received from client.
+        """
+
+        raise NotImplementedError
+
+
+class UDPClient(Client):
+    """Asyncio wrapper for UDP P2P communication across NAT/Firewall.
+
+    Attributes:
+        _server: Holepunch server connection.
+        _addr:  Client host and port address tuple.
+        _transport: Client-client datagram transport.
+        _protocol: Client-client datagram protocol.
+    """
+
+    def __init__(self):
+        """Initialise UDPClient."""
+
+        super().__init__()
+
+        self._transport = None
+        self._protocol = None
+
+    async def _probe(self, dest_addr, ports):
+        """Probe destination until punched.
+
+        Probes are retransmitted after each delay of the retry schedule, the
+        last delay is repeated.
+
+        Args:
+            dest_addr: Tuple of dest host address and dest port address.
+            ports: Destination ports probed in parallel.
+
+        Returns:
+            addr: Tuple of dest host address and dest port address observed.
+        """
+
+        schedule = holepunch.config.PUNCH_RETRY
+        sequence = 0
+
+        while not self._protocol.punched.done():
+            self._protocol.probe(sequence, [(dest_addr[0], port) for port in ports])
+
+            await asyncio.wait({self._protocol.punched}, timeout=schedule[min(sequence, len(schedule) - 1)])
+            sequence += 1
+
+        return self._protocol.punched.result()
+
+    async def _holepunch(self, source_addr, dest_addr, ports):
+        """Punch hole on NAT/Firewall with UDP packet.
+
+        Open datagram endpoint on source address and send probe (*) packets
+        to each destination port answered by ack (+) packets, as UDPPunch of
+        holepunch.client, until both directions are confirmed.
+
+        Args:
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            ports: Destination ports punched in parallel.
+
+        Returns:
+            addr: Tuple of dest host address and dest port address observed.
+
+        Raises:
+            TimeoutError: If punch is not confirmed before the holepunch
+            timeout configured in the config file.
+        """
+
+        # Open UDP socket for P2P communication
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holepunch.tuning.PROFILE.datagram(sock)
+
+        # Bind socket to source_addr received by holepunch server
+        sock.bind(source_addr)
+
+        loop = asyncio.get_running_loop()
+        self._transport, self._protocol = await loop.create_datagram_endpoint(
+            lambda: DatagramProtocol(dest_addr[0]),
+            sock=sock
+        )
+
+        # Send UDP holepunch packets
+        try:
+            return await asyncio.wait_for(self._probe(dest_addr, ports), holepunch.config.PUNCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._transport.close()
+            raise TimeoutError("Holepunch to {0} timed out".format(dest_addr)) from None
+
+    def close(self):
+        """Close client-client datagram transport."""
+
+        self._transport.close()
+        self._addr = None
+
+        logging.info("Close client-client transport %s", self._transport)
+
+    async def send(self, data):
+        """Send client-client data.
+
+        Args:
+            data: Data as bytes sent to client.
+        """
+
+        self._transport.sendto(data, self._addr)
+
+    async def recv(self):
+        """Receive client-client data.
+
+        Returns:
+            data: Data as bytes received from client.
+        """
+
+        return await self._protocol.queue.get()
+
+
+class TCPClient(Client):
+    """Asyncio wrapper for TCP P2P communication across NAT/Firewall.
+
+    Attributes:
+        _server: Holepunch server connection.
+        _addr:  Client host and port address tuple.
+        _reader: Client-client stream reader.
+        _writer: Client-client stream writer.
+    """
+
+    def __init__(self):
+        """Initialise TCPClient."""
+
+        super().__init__()
+
+        self._reader = None
+        self._writer = None
+
+    async def _connect(self, source_addr, dest_addr):
+        """Connect TCP socket bound on source address to destination address.
+
+        Args:
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+
+        Returns:
+            sock: Connected socket or None if connect failed.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        # Open TCP socket for P2P communication
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holepunch.tuning.PROFILE.stream(sock)
+        sock.setblocking(False)
+
+        # Send TCP holepunch packet
+        try:
+            sock.bind(source_addr)
+            await loop.sock_connect(sock, dest_addr)
+        except OSError:
+            sock.close()
+            return None
+        except asyncio.CancelledError:
+            sock.close()
+            raise
+
+        return sock
+
+    def _listen(self, source_addr):
+        """Open TCP socket listening on source address.
+
+        Listening socket accepts the connect of the destination arriving
+        between connect attempts, so it is not refused.
+
+        Args:
+            source_addr: Tuple of source host address and source port address.
+
+        Returns:
+            sock: Listening socket.
+        """
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setblocking(False)
+
+        try:
+            sock.bind(source_addr)
+            holepunch.tuning.PROFILE.listen(sock)
+        except OSError:
+            sock.close()
+            raise
+
+        return sock
+
+    async def _accept(self, sock, host):
+        """Accept connect of destination host.
+
+        Args:
+            sock: Listening socket.
+            host: Destination host address.
+
+        Returns:
+            sock: Connected socket.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            conn, addr = await loop.sock_accept(sock)
+
+            if addr[0] == host:
+                return conn
+
+            conn.close()
+
+    async def _punch(self, accept, source_addr, dest_addr, ports):
+        """Connect to destination until connected or accepted.
+
+        Unanswered connect attempts are cancelled and retried on new sockets
+        after each delay of the retry schedule, the last delay is repeated.
+        Failed connect attempts are not retried before the delay elapses,
+        meanwhile only the accept is awaited.
+
+        Args:
+            accept: Task accepting the connect of destination.
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            ports: Destination ports connected in parallel.
+
+        Returns:
+            sock: Connected socket.
+        """
+
+        loop = asyncio.get_running_loop()
+        schedule = holepunch.config.PUNCH_RETRY
+        attempt = 0
+
+        while True:
+            deadline = loop.time() + schedule[min(attempt, len(schedule) - 1)]
+            attempt += 1
+
+            attempts = {asyncio.ensure_future(self._connect(source_addr, (dest_addr[0], port))) for port in ports}
+            pending = attempts | {accept}
+            sock = None
+
+            try:
+                while sock is None:
+                    done, pending = await asyncio.wait(pending, timeout=deadline - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+
+                    if not done: # Retry delay elapsed
+                        break
+
+                    if accept in done:
+                        sock = accept.result()
+
+                    for task in done - {accept}:
+                        sock = sock or task.result()
+            finally:
+                for task in attempts:
+                    discard(task, keep=sock)
+
+            if sock is not None:
+                return sock
+
+    async def _holepunch(self, source_addr, dest_addr, ports):
+        """Punch hole on NAT/Firewall with TCP packet.
+
+        Send TCP (SYN) packets from source address to each destination port
+        until one is connected or the connect of destination is accepted on
+        source address, as TCPPunch of holepunch.client.
+
+        Args:
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            ports: Destination ports punched in parallel.
+
+        Returns:
+            addr: Tuple of dest host address and dest port address connected.
+
+        Raises:
+            TimeoutError: If no connection is established before the holepunch
+            timeout configured in the config file.
+        """
+
+        listener = self._listen(source_addr)
+        accept = asyncio.ensure_future(self._accept(listener, dest_addr[0]))
+        sock = None
+
+        try:
+            sock = await asyncio.wait_for(self._punch(accept, source_addr, dest_addr, ports), holepunch.config.PUNCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Holepunch to {0} timed out".format(dest_addr)) from None
+        finally:
+            discard(accept, keep=sock)
+            listener.close()
+
+        self._reader, self._writer = await asyncio.open_connection(sock=sock)
+
+        try:
+            # Follow the port mapped by the destination NAT
+            return sock.getpeername()
+        except OSError: # Connection reset, fails on first use
+            return dest_addr
+
+    def close(self):
+        """Close client-client stream."""
+
+        self._writer.close()
+        self._addr = None
+
+        logging.info("Close client-client stream %s", self._writer)
+
+    async def send(self, data):
+        """Send client-client data.
+
+        Args:
+            data: Data as bytes sent to client.
+        """
+
+        self._writer.write(data)
+        await self._writer.drain()
+
+    async def recv(self):
+        """Receive client-client data.
+
+        Returns:
+            data: Data as bytes received from client.
+        """
+
+        return await self._reader.read(65535)
+
+
+def discard(task, keep=None):
+    """Cancel connect or accept task, closing the socket it returned.
+
+    Args:
+        task: Task returning a socket or None.
+        keep: Socket kept open.
+    """
+
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled() and task.exception() is None:
+        sock = task.result()
+        if sock is not None and sock is not keep:
+            sock.close()
+
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    """Client-client datagram protocol.
+
+    Client-client datagram protocol answering punch probes (*) of destination
+    with acks (+) and queueing other received datagrams. Once punched, probes
+    retransmitted by destination because its ack was lost are still answered
+    and dropped until the first other datagram is received or the holepunch
+    timeout configured in the config file elapses, as destination has then
+    completed or failed its punch. From then on every datagram is queued,
+    including 5 bytes datagrams starting with (*) or (+).
+
+    Attributes:
+        queue: Received datagrams queue.
+        punched: Future of the destination address observed, done once an
+            ack has been received and a probe has been answered.
+        _host: Destination host address.
+        _transport: Client-client datagram transport.
+        _sent: Sequence numbers of probes sent.
+        _acked: True once an ack has been received.
+        _probed: True once a probe has been answered.
+        _until: Event loop time until which punch packets are answered and
+            dropped once punched.
+    """
+
+    def __init__(self, host):
+        """Initialise datagram protocol.
+
+        Args:
+            host: Destination host address.
+        """
+
+        self.queue = asyncio.Queue()
+        self.punched = asyncio.get_running_loop().create_future()
+        self._host = host
+        self._transport = None
+        self._sent = set()
+        self._acked = False
+        self._probed = False
+        self._until = None
+
+    def connection_made(self, transport):
+        """Keep datagram transport.
+
+        Args:
+            transport: Client-client datagram transport.
+        """
+
+        self._transport = transport
+
+    def probe(self, sequence, addrs):
+        """Send probe.
+
+        Args:
+            sequence: Probe sequence number.
+            addrs: Destination host and port address tuples.
+        """
+
+        self._sent.add(sequence)
+
+        data = holepunch.client.UDPPunch.PROBE + holepunch.client.UDPPunch.SEQUENCE.pack(sequence)
+
+        for addr in addrs:
+            self._transport.sendto(data, addr)
+
+    def punch(self, data, addr):
+        """Answer probe or match ack of destination.
+
+        Args:
+            data: Punch packet as bytes.
+            addr: Destination host and port address tuple.
+        """
+
+        if addr[0] != self._host:
+            return
+
+        kind, sequence = data[:1], holepunch.client.UDPPunch.SEQUENCE.unpack_from(data, 1)[0]
+
+        if kind == holepunch.client.UDPPunch.PROBE:
+            self._transport.sendto(holepunch.client.UDPPunch.ACK + data[1:], addr)
+            self._probed = True
+        elif sequence in self._sent:
+            self._acked = True
+        else:
+            return
+
+        if self._acked and self._probed and not self.punched.done():
+            self._until = asyncio.get_running_loop().time() + holepunch.config.PUNCH_TIMEOUT
+            self.punched.set_result(addr)
+
+    def datagram_received(self, data, addr):
+        """Handle punch packet or queue received datagram.
+
+        Args:
+            data: Data as bytes received from client.
+            addr: Client host and port address tuple.
+        """
+
+        punching = not self.punched.done() or asyncio.get_running_loop().time() < self._until
+
+        if punching and len(data) == holepunch.client.UDPPunch.SEQUENCE.size + 1 and data[:1] in (holepunch.client.UDPPunch.PROBE, holepunch.client.UDPPunch.ACK):
+            self.punch(data, addr)
+            return
+
+        if self.punched.done(): # Destination punched
+            self._until = 0
+
+        self.queue.put_nowait(data)
+
+
+class Server:
+    """Asyncio holepunch server connection for client-client P2P communication.
+
+    Asyncio holepunch server connection for client-client P2P communication
+    handling of request. Response will be either an error (NotFound (?), Close
+    (.)) or holepunch (Holepunch (*)).
+
+    Attributes:
+        _reader: Client-server stream reader.
+        _writer: Client-server stream writer.
+        _addr: Server host address and port address tuple.
+        _codec: Request message codec as configured in the config file.
+        _decoder: Incremental response decoder.
+        _messages: Decoded responses not yet received.
+        _port: Local port of the client-server connection last opened or None.
+    """
+
+    @property
+    def port(self):
+        """Port accessor."""
+        return self._port
+
+    def __init__(self):
+        """Initialise server."""
+
+        self._reader = None
+        self._writer = None
+        self._addr = (holepunch.config.SERVER_HOST, holepunch.config.SERVER_PORT)
+        self._port = None
+        self._decoder = None
+        self._messages = collections.deque()
+
+        if holepunch.config.PROTOCOL == "text":
+            self._codec = holepunch.message.TEXT
+        else:
+            self._codec = holepunch.message.BINARY
+
+    async def open(self):
+        """Open client-server connection.
+
+        Connect from a new port shared with the punch sockets.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holepunch.tuning.PROFILE.stream(sock, fastopen=True)
+        sock.setblocking(False)
+
+        try:
+            sock.bind(("", 0))
+            await loop.sock_connect(sock, self._addr)
+        except OSError:
+            sock.close()
+            raise
+
+        self._port = sock.getsockname()[1]
+        self._reader, self._writer = await asyncio.open_connection(sock=sock)
+        self._decoder = holepunch.message.Decoder(holepunch.config.RECV_BUFFER_SIZE)
+
+        logging.info("Open client-server connection %s", self._addr)
+
+    def close(self):
+        """Close client-server connection."""
+
+        self._writer.close()
+
+        logging.info("Close client-server connection %s", self._addr)
+
+    async def send(self, message):
+        """Send client-server data.
+
+        Args:
+            message: Message sent to server.
+        """
+
+        self._writer.write(self._codec.encode(message))
+        await self._writer.drain()
+
+    async def recv(self):
+        """Receive client-server data.
+
+        Returns:
+            message: Parsed data received from server.
+        """
+
+        while not self._messages:
+            data = await self._reader.read(holepunch.config.RECV_BUFFER_SIZE)
+
+            if not data: # Close (.) on end of file
+                return holepunch.message.Message(method=".")
+
+            self._messages.extend(self._decoder.feed(data))
+
+        return self._messages.popleft()
+
+    async def listen_request(self):
+        """Send listen request to server.
+
+        Send listen request (<) to server and wait for response.
+
+        Returns:
+            response: Server response.
+        """
+
+        await self.open()
+
+        try:
+            await self.send(holepunch.message.Message(method="<"))
+            return await self.recv()
+        finally:
+            self.close()
+
+    async def connect_request(self, dest_host):
+        """Send connect request to server.
+
+        Send connect request (>dest_host) to server and wait for response.
+
+        Args:
+            dest_host: Destination host address.
+
+        Returns:
+            response: Server response.
+        """
+
+        await self.open()
+
+        try:
+            await self.send(holepunch.message.Message(method=">", body=dest_host))
+            return await self.recv()
+        finally:
+            self.close()
@@ -0,0 +1,417 @@
+"""Asyncio holepunch server for P2P communication across NAT/Firewall.
+
+Asyncio counterpart of holepunch.server. Holepunch server is an asyncio server
+and each server-client is an asyncio protocol, so the server can be embedded in
+an asyncio application and share its event loop. Request/response exchange is
+the same as holepunch.server.
+
+Example:
+    Server::
+
+        server = holepunch.aio.server.Server()
+        await server.run()
+"""
+
+
+import asyncio
+import logging
+import socket
+
+import holepunch.config
+import holepunch.message
+import holepunch.nat
+import holepunch.registry
+import holepunch.trace
+import holepunch.tuning
+
+
+class Server:
+    """Asyncio holepunch server for P2P communication across NAT/Firewall.
+
+    Asyncio holepunch server is listening for client and will introduce clients
+    from its client registry. Each accepted connection is handled by a Client
+    protocol instance.
+
+    Attributes:
+        _server: Asyncio server.
+        _addr:  Server host and port address tuple.
+        _registry: Server-client registry.
+        _nat: NAT behaviour classifiers by client host.
+    """
+
+    @property
+    def addr(self):
+        """Addr accessor."""
+        return self._addr
+
+    @addr.setter
+    def addr(self, value):
+        """Addr mutator."""
+        self._addr = value
+
+    @property
+    def registry(self):
+        """Registry accessor."""
+        return self._registry
+
+    def __init__(self):
+        """Initialise server."""
+
+        self._server = None
+        self._addr = (holepunch.config.SERVER_HOST, holepunch.config.SERVER_PORT)
+
+        self._registry = holepunch.registry.Registry()
+        self._nat = holepunch.nat.Table()
+
+    async def open(self):
+        """Open listening socket.
+
+        Open asyncio server, bind on host and port as configured in the config
+        file and start listening for clients with the tuning profile.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        try:
+            sock.bind(self._addr)
+            holepunch.tuning.PROFILE.listen(sock)
+        except OSError:
+            sock.close()
+            raise
+
+        self._server = await loop.create_server(
+            lambda: Client(self),
+            sock=sock,
+            backlog=holepunch.tuning.PROFILE.backlog
+        )
+
+        logging.info("Open server %s", self._server)
+
+    def close(self):
+        """Close listening socket.
+
+        Close asyncio server and all server-client transports.
+        """
+
+        self._server.close()
+
+        for client in self._registry:
+            client.close()
+
+        logging.info("Close server %s", self._server)
+
+    def find_client(self, sock=None, host=None, port=None, transport="tcp"):
+        """Find client from client registry.
+
+        Find client in client registry by socket file descriptor or host
+        address or transport and host and port address in constant time.
+
+        Args:
+            sock: Client socket file descriptor.
+            host: Client host address.
+            port: Client port address.
+            transport: Client transport ("tcp" or "udp").
+
+        Returns:
+            client: Client found or None.
+        """
+
+        return self._registry.find(sock=sock, host=host, port=port, transport=transport)
+
+    def append_client(self, client):
+        """Append client to client registry.
+
+        Observe client address mapped by its NAT.
+
+        Args:
+            client: Client to append in client registry.
+        """
+
+        self._nat.observe(client.addr[0], client.addr[1])
+        self._registry.add(client)
+
+    def remove_client(self, client):
+        """Remove client from client registry.
+
+        Args:
+            client: Client to remove in client registry.
+        """
+
+        self._registry.remove(client)
+
+    def mapping(self, addr):
+        """Get holepunch response body of client address.
+
+        Args:
+            addr: Client host and port address tuple.
+
+        Returns:
+            body: Client host address, observed port address and port delta of
+            client NAT.
+        """
+
+        return (addr[0], addr[1], self._nat.delta(addr[0]))
+
+    async def run(self):
+        """Run holepunch server.
+
+        Open server and serve clients until cancelled.
+        """
+
+        await self.open()
+
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.close()
+
+
+class Client(asyncio.Protocol):
+    """Server-client protocol.
+
+    Server-client protocol handling request/response. Its client represents a
+    server-client endpoint.
+
+    Attributes:
+        _server: Holepunch server.
+        _transport: Server-client transport.
+        _addr: Client host and port address tuple.
+        _decoder: Incremental request decoder.
+        _listen_id: Listen request id.
+        _listening: True if client is listening.
+        _deadline: Event loop time after which client expires.
+        _timer: Expiry timer handle.
+    """
+
+    @property
+    def transport(self):
+        """Transport accessor."""
+        return self._transport
+
+    @property
+    def addr(self):
+        """Addr accessor."""
+        return self._addr
+
+    @addr.setter
+    def addr(self, value):
+        """Addr mutator."""
+        self._addr = value
+
+    @property
+    def listen_id(self):
+        """Listen id accessor."""
+        return self._listen_id
+
+    @property
+    def listening(self):
+        """Listening accessor."""
+        return self._listening
+
+    @property
+    def transport(self):
+        """Transport accessor."""
+        return "tcp"
+
+    def __init__(self, server):
+        """Initialise client."""
+
+        self._server = server
+        self._transport = None
+        self._addr = None
+        self._decoder = holepunch.message.Decoder(holepunch.config.RECV_BUFFER_SIZE, methods=holepunch.message.REQUESTS)
+        self._listen_id = 0
+        self._listening = False
+        self._deadline = None
+        self._timer = None
+
+    def fileno(self):
+        """Get server-client socket file descriptor.
+
+        Returns:
+            file_descriptor: Server-client socket file descriptor.
+        """
+
+        return self._transport.get_extra_info("socket").fileno()
+
+    def connection_made(self, transport):
+        """Open server-client transport.
+
+        Append self to server client registry.
+
+        Args:
+            transport: Server-client transport.
+        """
+
+        self._transport = transport
+        self._transport.set_write_buffer_limits(high=holepunch.config.WRITE_BUFFER_HIGH, low=holepunch.config.WRITE_BUFFER_LOW)
+        self._addr = transport.get_extra_info("peername")
+
+        # Append to server client registry
+        self._server.append_client(self)
+
+        # Schedule idle expiry
+        loop = asyncio.get_running_loop()
+        self._deadline = loop.time() + holepunch.config.IDLE_TIMEOUT
+        self._timer = loop.call_at(self._deadline, self.expire)
+
+        holepunch.trace.event("Open server-client", addr=self._addr)
+
+    def connection_lost(self, exc):
+        """Close server-client transport.
+
+        Remove self from server client registry.
+
+        Args:
+            exc: Exception or None on end of file.
+        """
+
+        # Cancel expiry
+        self._timer.cancel()
+
+        # Remove from server client registry
+        self._server.remove_client(self)
+
+        holepunch.trace.event("Close server-client", addr=self._addr)
+
+        self._addr = None
+
+    def data_received(self, data):
+        """Receive server-client data.
+
+        Args:
+            data: Data as bytes received from client.
+        """
+
+        try:
+            for message in self._decoder.feed(data):
+                self.handle(message)
+
+                if self._addr is None or self._transport.is_closing(): # Client closed
+                    return
+        except ValueError: # Close client on malformed request
+            self.handle(holepunch.message.Message(method="."))
+            return
+
+        self.touch()
+
+    def touch(self):
+        """Postpone server-client expiry.
+
+        Postpone expiry by the listen TTL if client is listening else by the
+        idle timeout.
+        """
+
+        ttl = holepunch.config.LISTEN_TTL if self._listening else holepunch.config.IDLE_TIMEOUT
+        self._deadline = asyncio.get_running_loop().time() + ttl
+
+    def expire(self):
+        """Expire server-client.
+
+        Reschedule expiry timer if deadline has been postponed else send close
+        (.) response and close client.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        if self._deadline > loop.time():
+            self._timer = loop.call_at(self._deadline, self.expire)
+            return
+
+        holepunch.trace.event("Expire server-client", addr=self._addr)
+
+        # Send close response to client
+        self.send(holepunch.message.Message(method=".", id=self._listen_id))
+
+        self.close()
+
+    def pause_writing(self):
+        """Stop reading requests while outbound buffer is above high watermark."""
+
+        self._transport.pause_reading()
+
+    def resume_writing(self):
+        """Resume reading requests when outbound buffer is below low watermark."""
+
+        self._transport.resume_reading()
+
+    def eof_received(self):
+        """Receive server-client end of file.
+
+        Handle end of file as a close (.) request.
+        """
+
+        self.handle(holepunch.message.Message(method="."))
+
+    def close(self):
+        """Close server-client transport."""
+
+        self._transport.close()
+
+    def send(self, message):
+        """Send server-client data.
+
+        Send message to client encoded by the negotiated codec. Client is
+        aborted if outbound buffer exceeds its limit.
+
+        Args:
+            message: Message sent to client.
+        """
+
+        if self._transport.is_closing(): # Client closed
+            return
+
+        # Listening client is introduced once
+        if message.method == "*" and self._listening and message.id == self._listen_id:
+            self._listening = False
+            self._server.registry.unlisten(self)
+
+        codec = self._decoder.codec or holepunch.message.TEXT
+        self._transport.write(codec.encode(holepunch.message.downgrade(message, codec)))
+
+        if self._transport.get_write_buffer_size() > holepunch.config.WRITE_BUFFER_LIMIT:
+            logging.info("Overflow server-client transport %s", self._addr)
+            self._transport.abort()
+
+    def handle(self, request):
+        """Handle server-client request.
+
+        Depending on the request method the appropriate respond will be send to
+        client.
+
+        Args:
+            request: Message received from client.
+        """
+
+        if request.method == ">": # Handle connect request
+            # Find listening client in server client registry
+            client = self._server.find_client(host=request.body)
+
+            if client:
+                # Send holepunch response to connect client
+                response = holepunch.message.Message(method="*", body=self._server.mapping(client.addr), id=request.id)
+                self.send(response)
+
+                # Send holepunch response to listen client
+                response = holepunch.message.Message(method="*", body=self._server.mapping(self._addr), id=client.listen_id)
+                client.send(response)
+            else:
+                # Send client not found response
+                response = holepunch.message.Message(method="?", id=request.id)
+                self.send(response)
+
+        elif request.method == "<": # Handle listen request
+            # Client is listening for holepunch response
+            self._listen_id = request.id
+            self._listening = True
+            self._server.registry.listen(self)
+
+        elif request.method == ".": # Handle close request
+            # Close client
+            self.close()
@@ -0,0 +1,708 @@
+"""Benchmark of the holepunch server.
+
+Benchmark runs a holepunch server in a child process and drives simulated
+listen/connect client pairs against it from the parent process. Listening
+clients are parked first, each bound on its own loopback host address, then
+connecting clients, each bound on another loopback host address, request an
+introduction to each listening host with a bounded number of requests in
+flight. An introduction completes when both the connecting and the listening
+client receive their holepunch (*) response.
+
+Report:
+
+    +-----------------------+----------------------------------------------+
+    | Field                 | Description                                  |
+    +=======================+==============================================+
+    | pairs                 | listen/connect client pairs introduced       |
+    +-----------------------+----------------------------------------------+
+    | concurrency           | connect requests in flight                   |
+    +-----------------------+----------------------------------------------+
+    | introductions_per_sec | introductions completed per second           |
+    +-----------------------+----------------------------------------------+
+    | latency_p50/p99/p999  | seconds from connect to both responses       |
+    +-----------------------+----------------------------------------------+
+    | memory_per_listener   | server resident bytes per parked listener    |
+    +-----------------------+----------------------------------------------+
+    | cpu_per_introduction  | server user and system seconds per           |
+    |                       | introduction                                 |
+    +-----------------------+----------------------------------------------+
+
+Transport benchmark sends bulk data over a reliable UDP connection
+(holepunch.rudp) through a relay child process dropping datagrams at random
+with each loss rate and delaying them, received in another child process, and
+over a kernel TCP loopback connection as a reference. Kernel TCP cannot be made
+lossy from user space, so the TCP reference runs on the plain loopback and the
+throughput of TCP on the lossy link is estimated with the Mathis model
+(segment size / round trip time * 1.22 / sqrt(loss)).
+
+Transport report:
+
+    +-----------------------+----------------------------------------------+
+    | Field                 | Description                                  |
+    +=======================+==============================================+
+    | size                  | bytes sent per transfer                      |
+    +-----------------------+----------------------------------------------+
+    | delay                 | seconds each datagram is delayed one way     |
+    +-----------------------+----------------------------------------------+
+    | tcp_loopback          | TCP bytes per second on plain loopback       |
+    +-----------------------+----------------------------------------------+
+    | rudp_loss_<rate>      | reliable UDP bytes per second with loss rate |
+    +-----------------------+----------------------------------------------+
+    | tcp_model_loss_<rate> | modelled TCP bytes per second with loss rate |
+    +-----------------------+----------------------------------------------+
+
+Example:
+    Benchmark::
+
+        report = holepunch.bench.Benchmark(pairs=1000, concurrency=100).run()
+        print(json.dumps(report))
+
+    Transport benchmark::
+
+        report = holepunch.bench.TransportBenchmark(losses=(0, 0.01)).run()
+        print(json.dumps(report))
+"""
+
+
+import errno
+import heapq
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import selectors
+import socket
+import threading
+import time
+
+import holepunch.client
+import holepunch.config
+import holepunch.loop
+import holepunch.message
+import holepunch.rudp
+import holepunch.server
+import holepunch.trace
+
+
+def rss():
+    """Get resident set size of current process.
+
+    Returns:
+        size: Resident bytes, peak resident bytes if /proc is unavailable.
+    """
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, p):
+    """Get nearest-rank percentile.
+
+    Args:
+        values: Sorted values.
+        p: Percentile in [0, 1].
+
+    Returns:
+        value: Percentile value or None if values is empty.
+    """
+
+    if not values:
+        return None
+
+    return values[max(math.ceil(p * len(values)) - 1, 0)]
+
+
+def serve(conn):
+    """Run holepunch server in benchmark child process.
+
+    Run holepunch server and answer stats requests received over conn with the
+    number of listening clients, resident bytes and cpu seconds until a stop
+    request is received.
+
+    Args:
+        conn: Child end of multiprocessing pipe.
+    """
+
+    holepunch.trace.TRACER.configure(level=logging.WARNING)
+
+    server = holepunch.server.Server()
+    server.open()
+
+    def handle(events):
+        command = conn.recv()
+
+        if command == "stats":
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            conn.send({
+                "listening": sum(1 for client in server.registry if client.listening),
+                "rss": rss(),
+                "cpu": usage.ru_utime + usage.ru_stime,
+            })
+        elif command == "stop":
+            server.loop.stop()
+
+    server.loop.register(conn, holepunch.loop.EVENT_READ, handle)
+    conn.send("ready")
+
+    try:
+        server.loop.run()
+    finally:
+        server.loop.unregister(conn)
+        server.close()
+
+
+def relay(left, right, loss, delay):
+    """Relay datagrams over a lossy link in benchmark child process.
+
+    Forward datagrams received on each socket out of the other one, dropping
+    each datagram with probability loss and delaying the others by delay
+    seconds.
+
+    Args:
+        left: UDP socket connected to the sending end.
+        right: UDP socket connected to the receiving end.
+        loss: Datagram loss probability.
+        delay: One way delay in seconds.
+    """
+
+    peers = {left: right, right: left}
+    pending = []
+    order = 0
+
+    selector = selectors.DefaultSelector()
+    for sock in peers:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+
+    while True:
+        timeout = max(pending[0][0] - time.monotonic(), 0) if pending else None
+
+        for key, _ in selector.select(timeout):
+            for _ in range(holepunch.config.DATAGRAM_BATCH):
+                try:
+                    data = key.fileobj.recv(65535)
+                except BlockingIOError:
+                    break
+                except ConnectionRefusedError: # End closed
+                    continue
+
+                if random.random() >= loss:
+                    order += 1
+                    heapq.heappush(pending, (time.monotonic() + delay, order, peers[key.fileobj], data))
+
+        now = time.monotonic()
+
+        while pending and pending[0][0] <= now:
+            _, _, sock, data = heapq.heappop(pending)
+
+            try:
+                sock.send(data)
+            except (BlockingIOError, ConnectionRefusedError): # Datagram lost
+                pass
+
+
+def receive(sock, conn):
+    """Receive reliable UDP stream in benchmark child process.
+
+    Receive until end of stream and send the number of bytes received over
+    conn.
+
+    Args:
+        sock: Connected UDP socket.
+        conn: Child end of multiprocessing pipe.
+    """
+
+    client = holepunch.client.UDPClient()
+    client.sock = sock
+    stream = holepunch.rudp.Connection(client)
+
+    size = 0
+    data = stream.recv()
+
+    while data:
+        size += len(data)
+        data = stream.recv()
+
+    conn.send(size)
+    stream.close()
+
+
+class Session:
+    """Simulated client of a benchmark.
+
+    Simulated client sending one request to the holepunch server over a
+    non-blocking socket bound on its own host address and waiting for its
+    holepunch response.
+
+    Attributes:
+        _bench: Benchmark.
+        _index: Client pair index.
+        _host: Client host address.
+        _request: Request message.
+        _callback: Callable receiving session and response, None on end of file.
+        _sock: Client-server socket.
+        _decoder: Incremental message decoder.
+    """
+
+    @property
+    def index(self):
+        """Index accessor."""
+        return self._index
+
+    def __init__(self, bench, index, host, request, callback):
+        """Initialise session.
+
+        Args:
+            bench: Benchmark.
+            index: Client pair index.
+            host: Client host address.
+            request: Request message.
+            callback: Callable receiving session and response.
+        """
+
+        self._bench = bench
+        self._index = index
+        self._host = host
+        self._request = request
+        self._callback = callback
+        self._sock = None
+        self._decoder = holepunch.message.Decoder(holepunch.config.RECV_BUFFER_SIZE, self._bench.codec)
+
+    def fileno(self):
+        """Get client-server socket file descriptor.
+
+        Returns:
+            file_descriptor: Client-server socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def open(self):
+        """Open client-server socket.
+
+        Bind socket on host address, start a non-blocking connect to the server
+        and register session in event loop.
+        """
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind((self._host, 0))
+        self._sock.setblocking(False)
+
+        error = self._sock.connect_ex(self._bench.addr)
+        if error not in (0, errno.EINPROGRESS):
+            raise OSError(error, os.strerror(error))
+
+        self._bench.loop.register(self, holepunch.loop.EVENT_WRITE, self.handle)
+
+    def close(self):
+        """Close client-server socket."""
+
+        if self._sock is None: # Session closed
+            return
+
+        self._bench.loop.unregister(self)
+        self._sock.close()
+        self._sock = None
+
+    def handle(self, events):
+        """Handle client-server socket file descriptor.
+
+        Send request once connected and decode responses when readable.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        if events & holepunch.loop.EVENT_WRITE:
+            error = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                raise OSError(error, os.strerror(error))
+
+            self._sock.send(self._bench.codec.encode(self._request))
+            self._bench.loop.modify(self, holepunch.loop.EVENT_READ, self.handle)
+            return
+
+        if not self._decoder.recv_into(self._sock):
+            self._callback(self, None)
+            return
+
+        for message in self._decoder:
+            self._callback(self, message)
+
+
+class Benchmark:
+    """Holepunch server benchmark.
+
+    Attributes:
+        _pairs: Number of listen/connect client pairs.
+        _concurrency: Maximum connect requests in flight.
+        _addr: Server host and port address tuple.
+        _codec: Request message codec as configured in the config file.
+        _loop: Event loop of simulated clients.
+        _process: Server child process.
+        _conn: Parent end of multiprocessing pipe.
+        _listeners: Listening sessions by pair index.
+        _started: Connect request clock time by pair index.
+        _responses: Holepunch responses received by pair index.
+        _latencies: Introduction latencies in seconds.
+        _pending: Index of next pair to connect.
+        _inflight: Connect requests in flight.
+    """
+
+    @property
+    def addr(self):
+        """Addr accessor."""
+        return self._addr
+
+    @property
+    def codec(self):
+        """Codec accessor."""
+        return self._codec
+
+    @property
+    def loop(self):
+        """Loop accessor."""
+        return self._loop
+
+    def __init__(self, pairs=1000, concurrency=100):
+        """Initialise benchmark.
+
+        Args:
+            pairs: Number of listen/connect client pairs.
+            concurrency: Maximum connect requests in flight.
+        """
+
+        self._pairs = pairs
+        self._concurrency = concurrency
+        self._addr = ("127.0.0.1", holepunch.config.SERVER_PORT)
+        self._loop = None
+        self._process = None
+        self._conn = None
+        self._listeners = {}
+        self._started = {}
+        self._responses = {}
+        self._latencies = []
+        self._pending = 0
+        self._inflight = 0
+
+        if holepunch.config.PROTOCOL == "text":
+            self._codec = holepunch.message.TEXT
+        else:
+            self._codec = holepunch.message.BINARY
+
+    def host(self, index):
+        """Get loopback host address of client pair.
+
+        Args:
+            index: Client pair index, listening clients of pairs 0..pairs-1
+            and connecting clients of pairs pairs..2*pairs-1.
+
+        Returns:
+            host: Distinct 127.x.x.x host address, listening clients are found
+            by host address.
+        """
+
+        index += 1
+        return "127.{0}.{1}.{2}".format(index >> 16 & 255, index >> 8 & 255, index & 255)
+
+    def open(self):
+        """Open benchmark.
+
+        Start server child process and wait until it is ready.
+        """
+
+        # Raise open file descriptor limit to hold many clients
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+        self._loop = holepunch.loop.Loop()
+        self._conn, conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=serve, args=(conn,), daemon=True)
+        self._process.start()
+
+        if self._conn.recv() != "ready":
+            raise RuntimeError("Server failed to start")
+
+    def close(self):
+        """Close benchmark.
+
+        Close sessions, stop server child process and wait for it to exit.
+        """
+
+        for session in self._listeners.values():
+            session.close()
+
+        self._conn.send("stop")
+        self._process.join()
+        self._conn.close()
+        self._loop.close()
+
+    def stats(self):
+        """Get server stats.
+
+        Returns:
+            stats: Listening clients, resident bytes and cpu seconds.
+        """
+
+        self._conn.send("stats")
+        return self._conn.recv()
+
+    def park(self):
+        """Park listening clients.
+
+        Open a listening client per pair and wait until all are registered.
+        """
+
+        for index in range(self._pairs):
+            host = self.host(index)
+            request = holepunch.message.Message(method="<", id=index + 1)
+
+            session = Session(self, index, host, request, self.respond)
+            session.open()
+            self._listeners[index] = session
+
+            # Bound connection setup in flight
+            if index % self._concurrency == self._concurrency - 1:
+                self._loop.run_once(0)
+
+        while self.stats()["listening"] < self._pairs:
+            self._loop.run_once(0.01)
+
+    def connect(self):
+        """Connect next client pair."""
+
+        index = self._pending
+        request = holepunch.message.Message(method=">", body=self.host(index), id=index + 1)
+
+        self._pending += 1
+        self._inflight += 1
+
+        self._started[index] = time.monotonic()
+        Session(self, index, self.host(self._pairs + index), request, self.respond).open()
+
+    def respond(self, session, response):
+        """Handle response of a session.
+
+        Complete introduction of a pair once both sessions of the pair received
+        their holepunch response.
+
+        Args:
+            session: Session which received response.
+            response: Response received or None on end of file.
+        """
+
+        if response is None or response.method != "*":
+            raise RuntimeError("Unexpected response {0} to pair {1}".format(response, session.index))
+
+        session.close()
+
+        index = session.index
+        self._responses[index] = self._responses.get(index, 0) + 1
+
+        if self._responses[index] == 2:
+            self._latencies.append(time.monotonic() - self._started.pop(index))
+            del self._responses[index]
+            del self._listeners[index]
+            self._inflight -= 1
+
+            if self._pending < self._pairs:
+                self.connect()
+
+    def introduce(self):
+        """Introduce client pairs.
+
+        Connect every pair keeping concurrency connect requests in flight.
+        """
+
+        while self._pending < min(self._concurrency, self._pairs):
+            self.connect()
+
+        while self._inflight:
+            self._loop.run_once()
+
+    def run(self):
+        """Run benchmark.
+
+        Returns:
+            report: Benchmark report.
+        """
+
+        self.open()
+
+        try:
+            idle = self.stats()
+            self.park()
+            parked = self.stats()
+
+            start = time.monotonic()
+            self.introduce()
+            elapsed = time.monotonic() - start
+
+            done = self.stats()
+        finally:
+            self.close()
+
+        latencies = sorted(self._latencies)
+
+        return {
+            "pairs": self._pairs,
+            "concurrency": self._concurrency,
+            "protocol": holepunch.config.PROTOCOL,
+            "elapsed": elapsed,
+            "introductions_per_sec": len(latencies) / elapsed if elapsed else None,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p99": percentile(latencies, 0.99),
+            "latency_p999": percentile(latencies, 0.999),
+            "memory_per_listener": (parked["rss"] - idle["rss"]) / self._pairs,
+            "cpu_per_introduction": (done["cpu"] - parked["cpu"]) / self._pairs,
+        }
+
+
+class TransportBenchmark:
+    """Reliable UDP transport benchmark.
+
+    Attributes:
+        _size: Bytes sent per transfer.
+        _losses: Datagram loss rates.
+        _delay: One way delay in seconds.
+    """
+
+    def __init__(self, size=16777216, losses=(0, 0.01, 0.05), delay=0.005):
+        """Initialise transport benchmark.
+
+        Args:
+            size: Bytes sent per transfer.
+            losses: Datagram loss rates.
+            delay: One way delay in seconds.
+        """
+
+        self._size = size
+        self._losses = losses
+        self._delay = delay
+
+    def tcp(self):
+        """Transfer over kernel TCP loopback connection.
+
+        Returns:
+            throughput: Bytes per second.
+        """
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+
+        sender = socket.create_connection(listener.getsockname())
+        receiver, _ = listener.accept()
+        listener.close()
+
+        data = memoryview(bytearray(self._size))
+        buf = bytearray(65536)
+        size = 0
+
+        def send():
+            sender.sendall(data)
+            sender.close()
+
+        start = time.monotonic()
+        thread = threading.Thread(target=send)
+        thread.start()
+
+        received = receiver.recv_into(buf)
+        while received:
+            size += received
+            received = receiver.recv_into(buf)
+
+        elapsed = time.monotonic() - start
+        thread.join()
+        receiver.close()
+
+        return size / elapsed
+
+    def rudp(self, loss):
+        """Transfer over reliable UDP connection through a lossy relay.
+
+        Args:
+            loss: Datagram loss probability.
+
+        Returns:
+            throughput: Bytes per second.
+
+        Raises:
+            RuntimeError: If fewer bytes are received than sent.
+        """
+
+        socks = []
+        for _ in range(4):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.1", 0))
+            socks.append(sock)
+
+        sender, receiver, left, right = socks
+        sender.connect(left.getsockname())
+        receiver.connect(right.getsockname())
+        left.connect(sender.getsockname())
+        right.connect(receiver.getsockname())
+
+        conn, child = multiprocessing.Pipe()
+        processes = [
+            multiprocessing.Process(target=relay, args=(left, right, loss, self._delay), daemon=True),
+            multiprocessing.Process(target=receive, args=(receiver, child), daemon=True),
+        ]
+
+        for process in processes:
+            process.start()
+
+        for sock in (receiver, left, right):
+            sock.close()
+
+        client = holepunch.client.UDPClient()
+        client.sock = sender
+        stream = holepunch.rudp.Connection(client)
+
+        try:
+            start = time.monotonic()
+            stream.send(bytearray(self._size))
+
+            # Wait for the receiver to end the transfer
+            stream.close()
+            size = conn.recv()
+            elapsed = time.monotonic() - start
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()
+
+        if size != self._size:
+            raise RuntimeError("Received {0} of {1} bytes".format(size, self._size))
+
+        return size / elapsed
+
+    def run(self):
+        """Run transport benchmark.
+
+        Returns:
+            report: Transport benchmark report.
+        """
+
+        holepunch.trace.TRACER.configure(level=logging.WARNING)
+
+        report = {
+            "size": self._size,
+            "delay": self._delay,
+            "tcp_loopback": self.tcp(),
+        }
+
+        for loss in self._losses:
+            report["rudp_loss_{0}".format(loss)] = self.rudp(loss)
+
+            if loss:
+                rate = holepunch.config.RUDP_SEGMENT_SIZE / (2 * self._delay) * 1.22 / math.sqrt(loss)
+                report["tcp_model_loss_{0}".format(loss)] = rate if self._delay else None
+
+        return report
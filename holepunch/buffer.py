@@ -0,0 +1,197 @@
+"""Buffers for zero-copy i/o of client-client P2P sockets.
+
+Client-client data is received with recv_into into preallocated buffers and
+handed to the application as memoryviews, and sent with vectored sendmsg, so
+payloads are neither allocated per read nor copied to be joined with their
+header.
+
+Frame:
+
+    +----------+----------------------------+
+    | length   | payload                    |
+    +==========+============================+
+    | 4 bytes  | length bytes               |
+    +----------+----------------------------+
+
+Example:
+    BufferPool::
+
+        pool = holepunch.buffer.BufferPool()
+        view = pool.acquire()
+        size = sock.recv_into(view)
+        handle(view[:size])
+        pool.release(view)
+"""
+
+
+import collections
+import struct
+
+import holepunch.config
+
+
+FRAME = struct.Struct("!I")
+
+
+class BufferPool:
+    """Pool of fixed size receive buffers.
+
+    Pool keeping released buffers for reuse, so a steady stream of reads
+    allocates no buffer. Buffers are handed out as memoryviews of bytearrays.
+    At most count released buffers are kept; a buffer acquired from an empty
+    pool is allocated.
+
+    Attributes:
+        _size: Buffer size in bytes.
+        _count: Maximum number of released buffers kept.
+        _free: Released buffers.
+    """
+
+    @property
+    def size(self):
+        """Size accessor."""
+        return self._size
+
+    def __init__(self, size=None, count=None):
+        """Initialise buffer pool.
+
+        Args:
+            size: Buffer size in bytes. If size is None then the size
+            configured in the config file is used.
+            count: Maximum number of released buffers kept. If count is None
+            then the count configured in the config file is used.
+        """
+
+        self._size = holepunch.config.BUFFER_SIZE if size is None else size
+        self._count = holepunch.config.BUFFER_COUNT if count is None else count
+        self._free = collections.deque()
+
+    def __len__(self):
+        """__len__ overload."""
+        return len(self._free)
+
+    def acquire(self):
+        """Acquire buffer.
+
+        Returns:
+            view: Memoryview of a buffer of pool size.
+        """
+
+        try:
+            return self._free.pop()
+        except IndexError:
+            return memoryview(bytearray(self._size))
+
+    def release(self, view):
+        """Release buffer.
+
+        Args:
+            view: Memoryview acquired from pool or a slice of it.
+        """
+
+        buf = view.obj
+
+        if len(buf) == self._size and len(self._free) < self._count:
+            self._free.append(memoryview(buf))
+
+
+class FrameReader:
+    """Incremental frame reader of a stream socket.
+
+    Incremental frame reader receiving with recv_into into its buffer and
+    returning complete frame payloads as memoryviews of the buffer without
+    copying. A payload view is valid until the next read; a frame larger than
+    the buffer grows it up to the maximum frame size.
+
+    Attributes:
+        _buf: Receive buffer.
+        _view: Memoryview of receive buffer.
+        _start: Offset of first unread byte.
+        _end: Offset after last received byte.
+    """
+
+    def __init__(self, size=None):
+        """Initialise frame reader.
+
+        Args:
+            size: Initial receive buffer size. If size is None then the buffer
+            size configured in the config file is used.
+        """
+
+        self._buf = bytearray(holepunch.config.BUFFER_SIZE if size is None else size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+
+    def _reserve(self, size):
+        """Reserve space for size bytes from the first unread byte.
+
+        Move unread data to the start of receive buffer, or to a new larger
+        buffer if it does not fit, when buffer end is reached.
+
+        Args:
+            size: Bytes needed from the first unread byte.
+        """
+
+        if self._start + size <= len(self._buf):
+            return
+
+        length = self._end - self._start
+
+        if size > len(self._buf):
+            buf = bytearray(size)
+            buf[:length] = self._view[self._start:self._end]
+            self._buf = buf
+            self._view = memoryview(buf)
+        else:
+            self._buf[:length] = self._view[self._start:self._end]
+
+        self._start = 0
+        self._end = length
+
+    def frame(self):
+        """Get next complete frame.
+
+        Returns:
+            payload: Memoryview of next complete frame payload or None.
+
+        Raises:
+            ValueError: If frame exceeds the maximum frame size.
+        """
+
+        length = self._end - self._start
+
+        if length < FRAME.size:
+            self._reserve(FRAME.size)
+            return None
+
+        size, = FRAME.unpack_from(self._buf, self._start)
+
+        if size > holepunch.config.FRAME_MAX:
+            raise ValueError("Frame exceeds maximum frame size")
+
+        if length < FRAME.size + size:
+            self._reserve(FRAME.size + size)
+            return None
+
+        payload = self._view[self._start + FRAME.size:self._start + FRAME.size + size]
+
+        self._start += FRAME.size + size
+        if self._start == self._end:
+            self._start = self._end = 0
+
+        return payload
+
+    def recv_into(self, sock):
+        """Receive data from socket into receive buffer.
+
+        Args:
+            sock: Stream socket.
+
+        Returns:
+            size: Number of bytes received, 0 on end of file.
+        """
+
+        size = sock.recv_into(self._view[self._end:])
+        self._end += size
+        return size
@@ -0,0 +1,166 @@
+"""Cache of successful punch results.
+
+Client caches, for each peer host, the source address it punched from, the
+destination address observed once punched, the transport which won and the
+round trip time measured. Peers reopening each other (see
+holepunch.client.Client.reopen) re-punch the cached addresses and transport
+directly, falling back to the server only on failure. A server introduction
+punches the cached destination port before the ports predicted (see
+holepunch.nat), and a race initiator selects UDP without grace delay when UDP
+won the cached race (see holepunch.client.HybridPunch). Entries expire after a
+time to live and the least recently used entry is evicted once the cache is
+full.
+
+Example:
+    PunchCache::
+
+        cache = holepunch.cache.PunchCache()
+        cache.put("127.0.0.2", holepunch.cache.Entry(("", 20001), ("127.0.0.2", 20001), "udp", 0.01))
+        entry = cache.get("127.0.0.2")
+"""
+
+
+import collections
+import time
+
+import holepunch.config
+
+
+class Entry:
+    """Punch cache entry.
+
+    Attributes:
+        _source_addr: Source host and port address tuple punched from.
+        _dest_addr: Destination host and port address tuple observed.
+        _protocol: Transport which punched ("tcp" or "udp").
+        _rtt: Round trip time in seconds or None if not measured.
+    """
+
+    @property
+    def source_addr(self):
+        """Source addr accessor."""
+        return self._source_addr
+
+    @property
+    def dest_addr(self):
+        """Dest addr accessor."""
+        return self._dest_addr
+
+    @property
+    def protocol(self):
+        """Protocol accessor."""
+        return self._protocol
+
+    @property
+    def rtt(self):
+        """Rtt accessor."""
+        return self._rtt
+
+    def __init__(self, source_addr, dest_addr, protocol, rtt=None):
+        """Initialise entry.
+
+        Args:
+            source_addr: Source host and port address tuple punched from.
+            dest_addr: Destination host and port address tuple observed.
+            protocol: Transport which punched ("tcp" or "udp").
+            rtt: Round trip time in seconds or None if not measured.
+        """
+
+        self._source_addr = source_addr
+        self._dest_addr = dest_addr
+        self._protocol = protocol
+        self._rtt = rtt
+
+    def __repr__(self):
+        """__repr__ overload."""
+        return "Entry({0}, {1}, {2}, {3})".format(self._source_addr, self._dest_addr, self._protocol, self._rtt)
+
+
+class PunchCache:
+    """Punch cache with time to live and least recently used eviction.
+
+    Attributes:
+        _ttl: Seconds an entry is kept.
+        _size: Maximum number of entries.
+        _clock: Callable returning clock time in seconds.
+        _entries: Entry and expiry clock time by peer host, least recently
+        used first.
+    """
+
+    def __init__(self, ttl=None, size=None, clock=time.monotonic):
+        """Initialise punch cache.
+
+        Args:
+            ttl: Seconds an entry is kept. If ttl is None then the time to live
+            configured in the config file is used.
+            size: Maximum number of entries. If size is None then the size
+            configured in the config file is used.
+            clock: Callable returning clock time in seconds.
+        """
+
+        self._ttl = holepunch.config.PUNCH_CACHE_TTL if ttl is None else ttl
+        self._size = holepunch.config.PUNCH_CACHE_SIZE if size is None else size
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        """__len__ overload."""
+        return len(self._entries)
+
+    def get(self, host):
+        """Get entry of peer host.
+
+        Args:
+            host: Peer host address.
+
+        Returns:
+            entry: Entry or None if not cached or expired.
+        """
+
+        item = self._entries.get(host)
+        if item is None:
+            return None
+
+        entry, expiry = item
+
+        if expiry <= self._clock():
+            del self._entries[host]
+            return None
+
+        self._entries.move_to_end(host)
+        return entry
+
+    def put(self, host, entry):
+        """Put entry of peer host.
+
+        Replace entry of peer host and evict least recently used entries over
+        the maximum number of entries.
+
+        Args:
+            host: Peer host address.
+            entry: Entry.
+        """
+
+        self._entries.pop(host, None)
+        self._entries[host] = (entry, self._clock() + self._ttl)
+
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def remove(self, host):
+        """Remove entry of peer host.
+
+        Args:
+            host: Peer host address.
+        """
+
+        self._entries.pop(host, None)
+
+    def clear(self):
+        """Remove every entry."""
+
+        self._entries.clear()
+
+
+# Cache shared by clients
+CACHE = PunchCache()
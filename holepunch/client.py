@@ -23,11 +23,62 @@ Example:
 """
 
 
+import collections
+import errno
 import logging
+import random
 import socket
+import struct
+import time
 
+import holepunch.buffer
+import holepunch.cache
 import holepunch.config
+import holepunch.loop
 import holepunch.message
+import holepunch.nat
+import holepunch.relay
+import holepunch.transfer
+import holepunch.tuning
+
+
+def source(server, response):
+    """Get source address of holepunch response.
+
+    Args:
+        server: Holepunch server socket wrapper.
+        response: Holepunch (*) response.
+
+    Returns:
+        source_addr: Source host and port address tuple, the port of the
+        client-server connection, or the holepunch port of a text response.
+    """
+
+    if len(response.body) > 2:
+        return ("", server.port)
+
+    # Text response (*(dest_host, holepunch_port))
+    return ("", response.body[1])
+
+
+def ports(response, entry=None):
+    """Get destination ports of holepunch response.
+
+    Args:
+        response: Holepunch (*) response.
+        entry: Punch cache entry of destination or None.
+
+    Returns:
+        ports: Port observed by the last punch of destination if cached,
+        followed by the observed port and the ports predicted from the delta.
+    """
+
+    predicted = holepunch.nat.predict(*response.body[1:3])
+
+    if entry is None or entry.dest_addr[1] in predicted:
+        return predicted
+
+    return [entry.dest_addr[1]] + predicted
 
 
 class Client:
@@ -40,10 +91,18 @@ class Client:
 
     Attributes:
         _server: Holepunch server socket wrapper.
+        _own_server: True if server wrapper is owned, its connection is closed
+            once the response is received.
         _sock:  Client-client socket.
         _addr:  Client host and port address tuple.
+        _pool: Receive buffer pool.
+        _frames: Incremental frame reader or None.
+        _cache: Punch cache.
     """
 
+    # Transports a client punches ("tcp", "udp")
+    PROTOCOLS = ()
+
     @property
     def sock(self):
         """Sock accessor."""
@@ -64,14 +123,95 @@ class Client:
         """Addr mutator."""
         self._addr = value
 
-    def __init__(self):
-        """Initialise client."""
+    @property
+    def cache(self):
+        """Cache accessor."""
+        return self._cache
+
+    @property
+    def protocol(self):
+        """Protocol accessor."""
+
+        if self._sock is None:
+            return None
+
+        return "tcp" if self._sock.type == socket.SOCK_STREAM else "udp"
+
+    def __init__(self, server=None, cache=None):
+        """Initialise client.
+
+        Args:
+            server: Holepunch server wrapper, Server or DatagramServer to send
+            requests as UDP datagrams. A server wrapper shared by many
+            clients keeps one persistent connection for all their requests.
+            If server is None then a TCP server wrapper (Server) of the client
+            own is used.
+            cache: Punch cache. If cache is None then the cache shared by all
+            clients (holepunch.cache.CACHE) is used.
+        """
 
-        self._server = Server()
+        self._server = Server() if server is None else server
+        self._own_server = server is None
         self._sock = None
         self._addr = None
+        self._pool = holepunch.buffer.BufferPool()
+        self._frames = None
+        self._cache = holepunch.cache.CACHE if cache is None else cache
+
+    @classmethod
+    def connect_many(cls, dest_hosts, concurrency=None, server=None):
+        """Open client-client sockets to many destination hosts concurrently.
+
+        Send all connect requests over one server connection and punch holes
+        in one event loop, keeping at most concurrency destinations in
+        progress, so opening many clients takes about as long as the slowest
+        instead of the sum of all.
+
+        Example:
+            Mesh::
+
+                for dest_host, client in holepunch.client.TCPClient.connect_many(hosts):
+                    if client is not None:
+                        client.send(b"OK")
+
+        Args:
+            dest_hosts: Iterable of destination host addresses.
+            concurrency: Maximum destinations in progress. If concurrency is
+            None then the concurrency configured in the config file is used.
+            server: Holepunch server wrapper shared by the clients. If server
+            is None then a server wrapper closed once done is used.
 
-    def _holepunch(self, source_addr, dest_addr):
+        Returns:
+            iterator: Iterator of destination host and open client, or None if
+            destination is not found or punch failed, in order of completion.
+        """
+
+        return iter(Connector(cls, dest_hosts, concurrency, server))
+
+    def _punch(self, loop, source_addr, dest_addr, callback, protocol=None, timeout=None, ports=None, entry=None):
+        """Create punch state machine.
+
+        Args:
+            loop: Event loop.
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            callback: Callable receiving punch and None, or punch and error on
+            failure.
+            protocol: Transport to punch among PROTOCOLS. If protocol is None
+            then every transport of the client is punched.
+            timeout: Seconds before punch fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports punched in parallel. If ports is None
+            then only the port of destination address is punched.
+            entry: Punch cache entry of destination or None.
+
+        Returns:
+            punch: Punch state machine (TCPPunch or UDPPunch) to open.
+        """
+
+        raise NotImplementedError
+
+    def _holepunch(self, source_addr, dest_addr, protocol=None, timeout=None, ports=None, entry=None):
         """Punch hole on NAT/Firewall.
 
         Punch hole on Nat/Firewall and open a socket by sending TCP or UDP
@@ -80,14 +220,46 @@ class Client:
         Args:
             source_addr: Tuple of source host address and source port address.
             dest_addr: Tuple of dest host address and dest port address.
+            protocol: Transport to punch among PROTOCOLS. If protocol is None
+            then every transport of the client is punched.
+            timeout: Seconds before punch fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports punched in parallel. If ports is None
+            then only the port of destination address is punched.
+            entry: Punch cache entry of destination or None.
 
         Returns:
             sock: Client-client (p2p) socket between endpoints behind
             NAT/Firewall.
             addr: Tuple of dest host address and dest port address.
+
+        Raises:
+            TimeoutError: If punch does not complete before the holepunch
+            timeout configured in the config file.
         """
 
-        raise NotImplementedError
+        loop = holepunch.loop.Loop()
+        errors = []
+
+        def done(punch, error):
+            errors.append(error)
+            loop.stop()
+
+        # Send holepunch packets until punched or deadline (blocking)
+        punch = self._punch(loop, source_addr, dest_addr, done, protocol, timeout, ports, entry)
+        punch.open()
+
+        try:
+            loop.run()
+        finally:
+            PunchPort.shutdown(loop)
+            loop.close()
+
+        if errors[0] is not None:
+            raise errors[0]
+
+        # Return socket, dest_addr tuple
+        return (punch.sock, punch.dest_addr)
 
     def fileno(self):
         """Get client-client socket file descriptor.
@@ -105,7 +277,14 @@ class Client:
         """Open client-client socket.
 
         Open socket between source_host and dest_host on source_port and
-        dest_port received by server.
+        dest_port received by server. Source port is the port of the
+        client-server connection, so a NAT reusing its mapping maps the punch
+        to the port observed by the server; destination ports predicted from
+        the delta received are punched in parallel. The punch result cached
+        for the destination adds the port it was punched on and picks the
+        transport of a race (see holepunch.cache); reopen punches a cached
+        destination without the server. If the punch fails the socket is
+        relayed by the server when it gave a relay token.
 
         Args:
             dest_host: Destination host address. If dest_host is None then client will receive a connect request else will send a connect request.
@@ -115,25 +294,127 @@ class Client:
         """
 
         # Handle request
-        if dest_host is None:
-            # Listen (<) request
-            response = self._server.listen_request()
-        else:
-            # Connect (>dest_host) request
-            response = self._server.connect_request(dest_host)
+        try:
+            if dest_host is None:
+                # Listen (<) request
+                response = self._server.listen_request()
+            else:
+                # Connect (>dest_host) request
+                response = self._server.connect_request(dest_host)
+        finally:
+            if self._own_server:
+                self._server.close()
 
         # Handle response
         if response.method == "*":
-            # Holepunch (*(dest_host, dest_port)) response
-            source_addr = ("", response.body[1])
-            dest_addr = response.body
-            self._sock, self._addr = self._holepunch(source_addr, dest_addr)
+            # Holepunch (*(dest_host, dest_port, delta, token)) response
+            source_addr = source(self._server, response)
+            dest_addr = response.body[:2]
+            entry = self._cache.get(dest_addr[0])
+
+            try:
+                self._sock, self._addr = self._holepunch(source_addr, dest_addr, ports=ports(response, entry), entry=entry)
+            except OSError as e:
+                logging.info("Punch to %s failed: %s", dest_addr, e)
+                self._cache.remove(dest_addr[0])
+
+                if not self.relay(response.body[3] if len(response.body) > 3 else 0):
+                    raise
+
+                return
         else:
             # NotFound (?), Close (.) response
             raise Exception(response)
 
+        self._cache.put(dest_addr[0], holepunch.cache.Entry(source_addr, self._addr, self.protocol, getattr(self, "rtt", None)))
+
         logging.info("Open client-client socket %s", self._sock)
 
+    def reopen(self, dest_host, listen=False):
+        """Reopen client-client socket to a peer punched before.
+
+        Punch the destination address and transport cached for destination
+        host directly, without a server introduction. Direct punch succeeds if
+        the destination reopens from its own cache at the same time, so both
+        peers reopen each other. The server is requested only if destination
+        host is not cached or the direct punch fails, in which case the failed
+        entry is removed from cache.
+
+        Args:
+            dest_host: Destination host address.
+            listen: True if the server fallback is a listen request, False if
+            it is a connect request to destination host.
+
+        Raises:
+            Exception: Excpetion if socket cannot open because response is not holepunch.
+        """
+
+        entry = self._cache.get(dest_host)
+
+        if entry is not None and entry.protocol in self.PROTOCOLS:
+            try:
+                self._sock, self._addr = self._holepunch(entry.source_addr, entry.dest_addr, entry.protocol, holepunch.config.PUNCH_CACHE_TIMEOUT)
+            except OSError as e:
+                logging.info("Reopen %s from cache failed: %s", dest_host, e)
+                self._cache.remove(dest_host)
+            else:
+                self._cache.put(dest_host, holepunch.cache.Entry(entry.source_addr, self._addr, entry.protocol, getattr(self, "rtt", None) or entry.rtt))
+
+                logging.info("Open client-client socket %s from cache", self._sock)
+                return
+
+        self.open(None if listen else dest_host)
+
+    def relay(self, token):
+        """Open client-client socket relayed by the server.
+
+        Connect to the relay port of the server, send the relay token and wait
+        until the peer connects with the same token. Relayed socket is a
+        stream socket, so only clients punching TCP are relayed.
+
+        Args:
+            token: Relay token of holepunch response, 0 if server does not
+            relay.
+
+        Returns:
+            opened: True if socket is open, False if client is not relayed or
+            peer did not connect before the relay timeout.
+        """
+
+        if not token or "tcp" not in self.PROTOCOLS:
+            return False
+
+        addr = (holepunch.config.SERVER_HOST, holepunch.config.RELAY_PORT)
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        holepunch.tuning.PROFILE.stream(sock)
+        sock.settimeout(holepunch.config.RELAY_TIMEOUT)
+
+        try:
+            sock.connect(addr)
+        except OSError as e:
+            logging.info("Relay %s failed: %s", addr, e)
+            sock.close()
+            return False
+
+        try:
+            sock.sendall(holepunch.relay.TOKEN.pack(token))
+            relayed = sock.recv(1) == holepunch.relay.RELAYED
+        except OSError as e:
+            logging.info("Relay %s failed: %s", addr, e)
+            relayed = False
+
+        if not relayed: # Peer not relayed
+            sock.close()
+            return False
+
+        sock.settimeout(None)
+        self._sock, self._addr = sock, addr
+
+        logging.info("Open client-client socket %s relayed", self._sock)
+
+        return True
+
     def close(self):
         """Close client-client socket.
 
@@ -171,221 +452,2076 @@ class Client:
 
         return self._sock.recv(65535)
 
+    def sendmsg(self, *buffers):
+        """Send client-client data from many buffers.
 
-class UDPClient(Client):
-    """Socket wrapper for UDP P2P communication across NAT/Firewall.
+        Send buffers as one contiguous data with vectored sendmsg, so a header
+        and its payload are sent without being joined. Empty buffers are
+        skipped.
 
-    Socket wrapper for UDP P2P communication across NAT/Firewall opened by
-    requesting the holepunching server to introduce source to dest. On holepunch
-    (*) server response each client will send UDP packet with source address
-    and destination address.
+        Args:
+            buffers: Bytes-like objects sent in order.
+        """
 
-    Attributes:
-        _server: Holepunch server socket wrapper.
-        _sock:  Client-client socket.
-        _addr:  Client host address and port address tuple.
-    """
+        views = [view for view in (memoryview(buf).cast("B") for buf in buffers) if view.nbytes]
+        index = 0
 
-    def __init__(self):
-        """ Initialise UDPClient."""
+        while index < len(views):
+            size = self._sock.sendmsg(views[index:index + 1024])
+
+            # Skip sent buffers and the sent part of a partially sent buffer
+            while size and size >= len(views[index]):
+                size -= len(views[index])
+                index += 1
 
-        super().__init__()
+            if size:
+                views[index] = views[index][size:]
 
-    def _holepunch(self, source_addr, dest_addr):
-        """Punch hole on NAT/Firewall with UDP packet.
+    def recv_into(self, buffer=None):
+        """Receive client-client data into buffer.
 
-        Punch hole on Nat/Firewall and open a socket by sending a UDP (*)
-        packet from source address to destination address.
+        Receive data into buffer without allocating. If buffer is None then a
+        buffer is acquired from the client buffer pool; release it once done.
 
         Args:
-            source_addr: Tuple of source host address and source port address.
-            dest_addr: Tuple of dest host address and dest port address.
+            buffer: Writable bytes-like object or None.
 
         Returns:
-            sock: Client-client (p2p) socket between endpoints behind
-            NAT/Firewall.
-            addr: Tuple of dest host address and dest port address.
+            view: Memoryview of the data received, empty on end of file.
         """
 
-        # Open UDP socket for P2P communication
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        view = self._pool.acquire() if buffer is None else memoryview(buffer).cast("B")
 
-        # Bind socket to source_addr received by holepunch server
-        sock.bind(source_addr)
+        size = self._sock.recv_into(view)
+        return view[:size]
 
-        # Send UDP holepunch packet (non-blocking)
-        sock.sendto(b"*", dest_addr)
+    def release(self, view):
+        """Release buffer returned by recv_into to the client buffer pool.
 
-        # Return socket, dest_addr tuple
-        return (sock, dest_addr)
+        Args:
+            view: Memoryview returned by recv_into.
+        """
 
+        self._pool.release(view)
 
-class TCPClient(Client):
-    """Socket wrapper for TCP P2P communication across NAT/Firewall.
+    def send_frame(self, *buffers):
+        """Send client-client frame.
 
-    Socket wrapper for TCP P2P communication across NAT/Firewall opened by
-    requesting the holepunching server to introduce source to dest. On holepunch
-    (*) server response each client will send TCP packet with source address
-    and destination address.
+        Send buffers as the payload of one length-prefixed frame with vectored
+        sendmsg.
 
-    Attributes:
-        _server: Holepunch server socket wrapper.
-        _sock:  Client-client socket.
-        _addr:  Client host address and port address tuple.
-    """
+        Args:
+            buffers: Bytes-like objects forming the payload in order.
+        """
 
-    def __init__(self):
-        """Intialise TCPClient."""
+        size = sum(memoryview(buf).nbytes for buf in buffers)
+        self.sendmsg(holepunch.buffer.FRAME.pack(size), *buffers)
+
+    def recv_frame(self):
+        """Receive client-client frame.
+
+        Receive data until a complete frame is read.
+
+        Returns:
+            payload: Memoryview of frame payload valid until the next
+            recv_frame or None on end of file.
+
+        Raises:
+            ValueError: If frame exceeds the maximum frame size.
+        """
+
+        if self._frames is None:
+            self._frames = holepunch.buffer.FrameReader()
+
+        payload = self._frames.frame()
+
+        while payload is None:
+            if not self._frames.recv_into(self._sock): # None on end of file
+                return None
 
-        super().__init__()
+            payload = self._frames.frame()
 
-    def _holepunch(self, source_addr, dest_addr):
-        """Punch hole on NAT/Firewall with TCP packet.
+        return payload
 
-        Punch hole on Nat/Firewall and open a socket by sending a TCP (SYN)
-        packet from source address to destination address.
+    def send_file(self, path):
+        """Send file to client-client peer.
+
+        Send file with sendfile from the offset the peer already holds. See
+        holepunch.transfer.
 
         Args:
-            source_addr: Tuple of source host address and source port address.
-            dest_addr: Tuple of dest host address and dest port address.
+            path: Path of file to send.
 
         Returns:
-            sock: Client-client (p2p) socket between endpoints behind
-            NAT/Firewall.
-            addr: Tuple of dest host address and dest port address.
+            report: Transfer report.
+
+        Raises:
+            ConnectionError: If transfer is interrupted or refused.
         """
 
-        # Open TCP socket for P2P communication
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return holepunch.transfer.send_file(self, path)
 
-        # Bind socket to source_addr received by holepunch server
-        sock.bind(source_addr)
+    def recv_file(self, path):
+        """Receive file from client-client peer.
 
-        # Send TCP holepunch packet (blocking)
-        while sock.connect_ex(dest_addr):
-            pass
+        Receive file into a memory mapping of the destination file, resuming
+        from the size of an existing destination file. See holepunch.transfer.
 
-        # Return socket, dest_addr tuple
-        return (sock, dest_addr)
+        Args:
+            path: Destination file path or directory.
 
+        Returns:
+            report: Transfer report.
 
-class Server:
-    """Holepunch server socket wrapper for client-client P2P communication.
+        Raises:
+            ConnectionError: If transfer is interrupted.
+        """
 
-    Holepunch server socket wrapper for client-client P2P communication
-    handling of request. Response will be either an error (NotFound (?), Close
-    (.)) or holepunch (Holepunch (*)).
+        return holepunch.transfer.recv_file(self, path)
+
+
+class Connector:
+    """Concurrent connector of many clients.
+
+    Concurrent connector opening clients to many destination hosts. Connect
+    requests are pipelined over one server connection and punches run in one
+    event loop. Use Client.connect_many.
 
     Attributes:
-        _sock:  Server - client socket.
-        _addr: Server host address and port address tuple.
+        _client_class: Client subclass (TCPClient or UDPClient) to open.
+        _hosts: Iterator of destination host addresses.
+        _concurrency: Maximum destinations in progress.
+        _server: Holepunch server wrapper.
+        _own_server: True if server wrapper is owned and closed once done.
+        _loop: Event loop, also scheduling reconnects of a pipelined server.
+        _watched: Server socket registered in event loop or None.
+        _requests: Destination host by outstanding request id.
+        _punches: Punches in progress.
+        _completed: Destination host and client pairs not yet yielded.
+        _inflight: Destinations in progress.
     """
 
-    def __init__(self):
-        """Initialise server."""
-
-        self._sock = None
-        self._addr = (holepunch.config.SERVER_HOST, holepunch.config.SERVER_PORT)
+    def __init__(self, client_class, dest_hosts, concurrency=None, server=None):
+        """Initialise connector.
 
-    def open(self):
-        """Open client-server socket.
+        Args:
+            client_class: Client subclass (TCPClient or UDPClient) to open.
+            dest_hosts: Iterable of destination host addresses.
+            concurrency: Maximum destinations in progress. If concurrency is
+            None then the concurrency configured in the config file is used.
+            server: Holepunch server wrapper shared by the clients. If server
+            is None then a server wrapper closed once done is used.
+        """
 
-        Open socket between source_host on source_port and server dest_host on
-        dest_port as configured in the config file.
+        self._client_class = client_class
+        self._hosts = iter(dest_hosts)
+        self._concurrency = holepunch.config.CONNECT_CONCURRENCY if concurrency is None else concurrency
+        self._server = Server() if server is None else server
+        self._own_server = server is None
+        self._loop = holepunch.loop.Loop()
+        self._watched = None
+        self._requests = {}
+        self._punches = set()
+        self._completed = collections.deque()
+        self._inflight = 0
+
+        if self._server.pipelined:
+            self._server.loop = self._loop
+
+    def __iter__(self):
+        """__iter__ overload.
+
+        Yields:
+            dest_host: Destination host address.
+            client: Open client or None.
         """
 
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            while True:
+                while self._inflight < self._concurrency and self.start():
+                    pass
 
-        self._sock.connect(self._addr)
+                while self._completed:
+                    yield self._completed.popleft()
 
+                if not self._inflight:
+                    break
 
-        logging.info("Open client-server socket %s", self._sock)
+                self._loop.run_once()
+                self.collect()
+        finally:
+            self.close()
 
     def close(self):
-        """Close client-server socket.
+        """Close connector.
 
-        Close socket between source_host on source_port and server dest_host on
-        dest_port as configured in the config file.
+        Stop punches in progress and close event loop and owned server
+        wrapper.
         """
 
-        self._sock.close()
+        for punch in self._punches:
+            punch.close()
+        self._punches.clear()
 
-        logging.info("Close client-server socket %s", self._sock)
+        self._requests.clear()
+        self.watch()
 
-    def send(self, message):
-        """Send client-client data.
+        if self._server.pipelined:
+            self._server.loop = None
+
+        PunchPort.shutdown(self._loop)
+        self._loop.close()
 
-        Send message to server.
+        if self._own_server:
+            self._server.close()
+
+    def start(self):
+        """Start next destination.
+
+        Returns:
+            started: False if there is no destination left.
+        """
+
+        dest_host = next(self._hosts, None)
+        if dest_host is None:
+            return False
+
+        self._inflight += 1
+        request = holepunch.message.Message(method=">", body=dest_host)
+
+        try:
+            if self._server.pipelined:
+                self._requests[self._server.submit(request)] = dest_host
+                self.watch()
+            else:
+                self.respond(dest_host, self._server.request(request))
+        except OSError as e:
+            logging.info("Connect %s failed: %s", dest_host, e)
+            self.complete(dest_host, None)
+
+        return True
+
+    def watch(self):
+        """Watch server socket.
+
+        Register server socket in event loop while requests are outstanding,
+        following the socket reopened by a reconnect.
+        """
+
+        sock = self._server.sock if self._requests else None
+
+        if sock is self._watched:
+            return
+
+        if self._watched is not None:
+            self._loop.unregister(self._watched)
+
+        if sock is not None:
+            self._loop.register(sock, holepunch.loop.EVENT_READ, self.poll)
+
+        self._watched = sock
+
+    def poll(self, events=holepunch.loop.EVENT_READ):
+        """Handle server socket file descriptor.
+
+        Receive responses and respond to the completed requests.
 
         Args:
-            message: Parsed data received from client.
+            events: Ready events mask.
         """
 
-        data = bytes(message)
-        self._sock.sendall(data)
+        try:
+            self._server.poll()
+        except OSError as e:
+            for dest_host in self._requests.values():
+                logging.info("Connect %s failed: %s", dest_host, e)
+                self.complete(dest_host, None)
+            self._requests.clear()
 
-    def recv(self):
-        """Receive client-client data.
+        self.collect()
 
-        Receive maximum data from sever.
+    def collect(self):
+        """Respond to completed requests.
 
-        Returns:
-            message: Parsed data received from client.
+        Collect responses received or failed by a reconnect, then watch the
+        server socket reopened by a reconnect.
         """
 
-        data = self._sock.recv(65535)
-        return holepunch.message.Message(data.decode("utf-8"))
+        for id in [id for id in self._requests if self._server.ready(id)]:
+            self.respond(self._requests.pop(id), self._server.result(id))
 
-    def listen_request(self):
-        """Send listen request to server.
+        self.watch()
 
-        Send listen request (<) to server and the block wait for response.
+    def respond(self, dest_host, response):
+        """Handle connect response.
 
-        Returns:
+        Start punch on holepunch (*) response.
+
+        Args:
+            dest_host: Destination host address.
             response: Server response.
         """
 
-        self.open()
-
-        # Send listen request to holepunch server
-        request = holepunch.message.Message("<")
-        self.send(request)
+        if response.method != "*":
+            # NotFound (?), Close (.) response
+            logging.info("Connect %s failed: %s", dest_host, response)
+            self.complete(dest_host, None)
+            return
 
-        # Receive holepunch or error response (blocking)
-        response = self.recv()
+        client = self._client_class(server=self._server)
+        source_addr = source(self._server, response)
+        entry = client.cache.get(dest_host)
 
-        self.close()
+        punch = client._punch(self._loop, source_addr, response.body[:2], lambda punch, error: self.punched(dest_host, client, source_addr, punch, error), ports=ports(response, entry), entry=entry)
+        self._punches.add(punch)
 
-        return response
+        try:
+            punch.open()
+        except OSError as e:
+            punch.close()
+            self.punched(dest_host, client, source_addr, punch, e)
 
-    def connect_request(self, dest_host):
-        """Send connect request to server.
+    def punched(self, dest_host, client, source_addr, punch, error):
+        """Handle punch completion.
 
-        Send connect request (>dest_host) to server and the block wait for
-        response.
+        Cache punch result of punched destination.
 
         Args:
             dest_host: Destination host address.
+            client: Client punching.
+            source_addr: Source host and port address tuple.
+            punch: Completed punch.
+            error: Error or None if punched.
+        """
 
-        Returns:
-            response: Server response.
+        self._punches.discard(punch)
+
+        if error is not None:
+            logging.info("Connect %s failed: %s", dest_host, error)
+            client.cache.remove(dest_host)
+            self.complete(dest_host, None)
+            return
+
+        client.sock, client.addr = punch.sock, punch.dest_addr
+        client.cache.put(dest_host, holepunch.cache.Entry(source_addr, client.addr, client.protocol, getattr(punch, "rtt", None)))
+
+        logging.info("Open client-client socket %s", client.sock)
+
+        self.complete(dest_host, client)
+
+    def complete(self, dest_host, client):
+        """Complete destination.
+
+        Args:
+            dest_host: Destination host address.
+            client: Open client or None.
         """
 
-        self.open()
+        self._inflight -= 1
+        self._completed.append((dest_host, client))
 
-        # Send connect request to holepunch server
-        request = holepunch.message.Message(">{0}".format(dest_host))
-        self.send(request)
 
-        # Receive holepunch or error response (blocking)
-        response = self.recv()
+class UDPClient(Client):
+    """Socket wrapper for UDP P2P communication across NAT/Firewall.
 
-        self.close()
+    Socket wrapper for UDP P2P communication across NAT/Firewall opened by
+    requesting the holepunching server to introduce source to dest. On holepunch
+    (*) server response each client will send UDP packet with source address
+    and destination address.
+
+    Attributes:
+        _server: Holepunch server socket wrapper.
+        _sock:  Client-client socket.
+        _addr:  Client host address and port address tuple.
+        _rtt: Round trip time in seconds measured by the punch handshake.
+    """
+
+    @property
+    def rtt(self):
+        """Rtt accessor."""
+        return self._rtt
+
+    PROTOCOLS = ("udp",)
+
+    def __init__(self, server=None, cache=None):
+        """ Initialise UDPClient."""
+
+        super().__init__(server, cache)
+
+        self._rtt = None
+
+    def _punch(self, loop, source_addr, dest_addr, callback, protocol=None, timeout=None, ports=None, entry=None):
+        """Create UDP punch state machine.
+
+        UDP punch exchanges probe (*) and ack (+) packets between source
+        address and destination address until reachability in both directions
+        is confirmed. Punched socket is connected to the destination address
+        observed from its packets and round trip time is measured.
+
+        Args:
+            loop: Event loop.
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            callback: Callable receiving punch and None, or punch and error on
+            failure.
+            protocol: Transport to punch, UDP only.
+            timeout: Seconds before punch fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports punched in parallel. If ports is None
+            then only the port of destination address is punched.
+            entry: Punch cache entry of destination or None.
+
+        Returns:
+            punch: UDP punch state machine.
+        """
+
+        def done(punch, error):
+            self._rtt = punch.rtt
+            callback(punch, error)
+
+        return UDPPunch(loop, source_addr, dest_addr, done, timeout=timeout, ports=ports)
+
+
+class UDPPunch:
+    """UDP punch handshake state machine.
+
+    UDP punch handshake state machine punching a hole on NAT/Firewall by
+    sending probe (*) packets from source address to destination address, and to
+    every destination port predicted (see holepunch.nat), in an event loop.
+    Probes are retransmitted after each delay of the retry schedule
+    and every probe received is answered with an ack (+) echoing its sequence
+    number. Punch completes once an ack has been received and a probe has been
+    answered, so both directions are confirmed, or fails when the deadline
+    expires. Many punches can share one event loop; punches sharing a source
+    address share its socket (PunchPort).
+
+    Packets:
+
+        +----------+----------+
+        | type     | sequence |
+        +==========+==========+
+        | 1 byte   | 4 bytes  |
+        +----------+----------+
+
+    A probe of the destination retransmitted after the punch completed, because
+    its ack was lost, is received by the application as a 5 bytes packet
+    starting with (*).
+
+    Attributes:
+        _loop: Event loop.
+        _source_addr: Source host and port address tuple.
+        _dest_addr: Destination host and port address tuple, updated to the
+            address observed from the packets of destination.
+        _callback: Callable receiving punch and None, or punch and error on
+            failure.
+        _schedule: Retry delays in seconds, the last delay is repeated.
+        _timeout: Seconds before punch fails.
+        _ports: Destination ports probed in parallel.
+        _port: Shared socket of source address.
+        _sock: Client-client socket connected to destination once punched.
+        _sent: Probe send clock time by sequence number.
+        _acked: True once an ack has been received.
+        _probed: True once a probe has been answered.
+        _rtt: Round trip time in seconds of the first ack.
+        _retry: Retransmit timer.
+        _deadline: Deadline timer.
+    """
+
+    PROBE = b"*"
+
+    ACK = b"+"
+
+    SEQUENCE = struct.Struct("!I")
+
+    @property
+    def sock(self):
+        """Sock accessor."""
+        return self._sock
+
+    @property
+    def dest_addr(self):
+        """Dest addr accessor."""
+        return self._dest_addr
+
+    @property
+    def rtt(self):
+        """Rtt accessor."""
+        return self._rtt
+
+    def __init__(self, loop, source_addr, dest_addr, callback, schedule=None, timeout=None, ports=None):
+        """Initialise punch.
+
+        Args:
+            loop: Event loop.
+            source_addr: Source host and port address tuple.
+            dest_addr: Destination host and port address tuple.
+            callback: Callable receiving punch and None, or punch and error on
+            failure.
+            schedule: Retransmit delays in seconds. If schedule is None then
+            the retry schedule configured in the config file is used.
+            timeout: Seconds before punch fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports probed in parallel. If ports is None then
+            only the port of destination address is probed.
+        """
+
+        self._loop = loop
+        self._source_addr = source_addr
+        self._dest_addr = dest_addr
+        self._callback = callback
+        self._schedule = holepunch.config.PUNCH_RETRY if schedule is None else schedule
+        self._timeout = holepunch.config.PUNCH_TIMEOUT if timeout is None else timeout
+        self._ports = [dest_addr[1]] if ports is None else ports
+        self._port = None
+        self._sock = None
+        self._sent = {}
+        self._acked = False
+        self._probed = False
+        self._rtt = None
+        self._retry = None
+        self._deadline = None
+
+    def open(self):
+        """Start punch.
+
+        Attach to the shared socket of source address, schedule deadline and
+        send first probe.
+        """
+
+        self._port = PunchPort.attach(self._loop, self._source_addr, socket.SOCK_DGRAM, self._dest_addr[0], self)
+
+        self._deadline = self._loop.call_later(self._timeout, self.expire)
+        self.probe()
+
+    def close(self):
+        """Stop punch.
+
+        Cancel timers and detach from the shared socket of source address.
+        """
+
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+
+        if self._port is not None:
+            self._port.detach(self._dest_addr[0], self)
+            self._port = None
+
+    def probe(self):
+        """Send probe.
+
+        Send probe with the next sequence number to each destination port and
+        schedule retransmit.
+        """
+
+        sequence = len(self._sent)
+
+        delay = self._schedule[min(sequence, len(self._schedule) - 1)]
+        self._retry = self._loop.call_later(delay, self.probe)
+
+        self._sent[sequence] = time.monotonic()
+
+        data = self.PROBE + self.SEQUENCE.pack(sequence)
+
+        for port in self._ports:
+            try:
+                self._port.sock.sendto(data, (self._dest_addr[0], port))
+            except OSError: # Probe lost, wait for retransmit
+                pass
+
+    def receive(self, data, addr):
+        """Receive packet of destination host.
+
+        Answer probe or match ack, complete punch once both directions are
+        confirmed.
+
+        Args:
+            data: Packet as bytes.
+            addr: Tuple of dest host address and dest port address.
+        """
+
+        if len(data) != self.SEQUENCE.size + 1:
+            return
+
+        kind, sequence = data[:1], self.SEQUENCE.unpack_from(data, 1)[0]
+
+        if kind == self.PROBE:
+            try:
+                self._port.sock.sendto(self.ACK + data[1:], addr)
+            except OSError: # Ack lost, peer retransmits probe
+                return
+
+            self._probed = True
+        elif kind == self.ACK and sequence in self._sent:
+            if not self._acked:
+                self._rtt = time.monotonic() - self._sent[sequence]
+
+            self._acked = True
+        else:
+            return
+
+        # Follow the port mapped by the destination NAT
+        self._dest_addr = addr
+
+        if self._acked and self._probed:
+            self.complete()
+
+    def complete(self):
+        """Complete punch.
+
+        Open client-client socket on source address connected to destination,
+        before detaching from the shared socket so no packet is refused.
+        """
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holepunch.tuning.PROFILE.datagram(sock)
+        sock.bind(self._source_addr)
+        sock.connect(self._dest_addr)
+
+        self.close()
+        self._sock = sock
+
+        logging.info("Punch %s to %s in rtt %.6f", self._source_addr, self._dest_addr, self._rtt)
+
+        self._callback(self, None)
+
+    def expire(self):
+        """Fail punch on deadline."""
+
+        self._deadline = None
+        self.close()
+
+        self._callback(self, TimeoutError("Holepunch to {0} timed out".format(self._dest_addr)))
+
+
+class TCPClient(Client):
+    """Socket wrapper for TCP P2P communication across NAT/Firewall.
+
+    Socket wrapper for TCP P2P communication across NAT/Firewall opened by
+    requesting the holepunching server to introduce source to dest. On holepunch
+    (*) server response each client will send TCP packet with source address
+    and destination address.
+
+    Attributes:
+        _server: Holepunch server socket wrapper.
+        _sock:  Client-client socket.
+        _addr:  Client host address and port address tuple.
+    """
+
+    PROTOCOLS = ("tcp",)
+
+    def __init__(self, server=None, cache=None):
+        """Intialise TCPClient."""
+
+        super().__init__(server, cache)
+
+    def _punch(self, loop, source_addr, dest_addr, callback, protocol=None, timeout=None, ports=None, entry=None):
+        """Create TCP punch state machine.
+
+        TCP punch sends TCP (SYN) packets from source address to destination
+        address until both endpoints are connected (simultaneous open).
+
+        Args:
+            loop: Event loop.
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            callback: Callable receiving punch and None, or punch and error on
+            failure.
+            protocol: Transport to punch, TCP only.
+            timeout: Seconds before punch fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports punched in parallel. If ports is None
+            then only the port of destination address is punched.
+            entry: Punch cache entry of destination or None.
+
+        Returns:
+            punch: TCP punch state machine.
+        """
+
+        return TCPPunch(loop, source_addr, dest_addr, callback, timeout=timeout, ports=ports)
+
+
+class TCPPunch:
+    """TCP simultaneous open state machine.
+
+    TCP simultaneous open state machine punching a hole on NAT/Firewall by
+    connecting non-blocking sockets bound on source address to destination
+    address in an event loop, one socket per destination port predicted (see
+    holepunch.nat). Failed or unanswered connect attempts are retried on new
+    sockets bound on the same source address after the next delay of the retry
+    schedule, until connected or the deadline expires. A socket
+    listening on source address accepts the connect of the destination, so a
+    connect from the destination arriving between attempts is not refused.
+    Many punches can share one event loop; punches sharing a source address
+    share its listening socket (PunchPort).
+
+    Example:
+        Parallel punches::
+
+            loop = holepunch.loop.Loop()
+            for dest_addr in dest_addrs:
+                holepunch.client.TCPPunch(loop, source_addr, dest_addr, callback).open()
+            loop.run()
+
+    Attributes:
+        _loop: Event loop.
+        _source_addr: Source host and port address tuple.
+        _dest_addr: Destination host and port address tuple, updated to the
+            address connected once punched.
+        _callback: Callable receiving punch and None, or punch and error on
+            failure.
+        _schedule: Retry delays in seconds, the last delay is repeated.
+        _timeout: Seconds before punch fails.
+        _ports: Destination ports connected in parallel.
+        _port: Shared listening socket of source address.
+        _sock: Connected socket once punched or None.
+        _attempts: Sockets of current connect attempt.
+        _attempt: Number of connect attempts.
+        _retry: Retry timer.
+        _deadline: Deadline timer.
+    """
+
+    @property
+    def sock(self):
+        """Sock accessor."""
+        return self._sock
+
+    @property
+    def dest_addr(self):
+        """Dest addr accessor."""
+        return self._dest_addr
+
+    def __init__(self, loop, source_addr, dest_addr, callback, schedule=None, timeout=None, ports=None):
+        """Initialise punch.
+
+        Args:
+            loop: Event loop.
+            source_addr: Source host and port address tuple.
+            dest_addr: Destination host and port address tuple.
+            callback: Callable receiving punch and None, or punch and error on
+            failure.
+            schedule: Retry delays in seconds. If schedule is None then the
+            retry schedule configured in the config file is used.
+            timeout: Seconds before punch fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports connected in parallel. If ports is None
+            then only the port of destination address is connected.
+        """
+
+        self._loop = loop
+        self._source_addr = source_addr
+        self._dest_addr = dest_addr
+        self._callback = callback
+        self._schedule = holepunch.config.PUNCH_RETRY if schedule is None else schedule
+        self._timeout = holepunch.config.PUNCH_TIMEOUT if timeout is None else timeout
+        self._ports = [dest_addr[1]] if ports is None else ports
+        self._port = None
+        self._sock = None
+        self._attempts = []
+        self._attempt = 0
+        self._retry = None
+        self._deadline = None
+
+    def open(self):
+        """Start punch.
+
+        Attach to the shared listening socket of source address, schedule
+        deadline and start first connect attempt.
+        """
+
+        self._port = PunchPort.attach(self._loop, self._source_addr, socket.SOCK_STREAM, self._dest_addr[0], self)
+
+        self._deadline = self._loop.call_later(self._timeout, self.expire)
+
+        # Connect of destination accepted before punch opened
+        sock = self._port.pop(self._dest_addr[0])
+        if sock is not None:
+            self.complete(sock)
+            return
+
+        self.connect()
+
+    def close(self):
+        """Stop punch.
+
+        Cancel timers, detach from the shared listening socket and close sockets
+        of current connect attempt.
+        """
+
+        if self._port is not None:
+            self._port.detach(self._dest_addr[0], self)
+            self._port = None
+
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+
+        self.abort()
+
+    def abort(self, sock=None):
+        """Abort connect attempt.
+
+        Args:
+            sock: Socket of connect attempt to abort. If sock is None then
+            every socket of current connect attempt is aborted.
+        """
+
+        for attempt in [sock] if sock is not None else self._attempts:
+            self._loop.unregister(attempt)
+            attempt.close()
+
+        if sock is not None:
+            self._attempts.remove(sock)
+        else:
+            self._attempts.clear()
+
+    def connect(self):
+        """Start connect attempt.
+
+        Abort unanswered connect attempt, start a non-blocking connect to each
+        destination port from new sockets bound on source address and schedule
+        next attempt.
+        """
+
+        self.abort()
+
+        delay = self._schedule[min(self._attempt, len(self._schedule) - 1)]
+        self._attempt += 1
+        self._retry = self._loop.call_later(delay, self.connect)
+
+        for port in self._ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            holepunch.tuning.PROFILE.stream(sock)
+            sock.setblocking(False)
+
+            try:
+                sock.bind(self._source_addr)
+                error = sock.connect_ex((self._dest_addr[0], port))
+            except OSError as e:
+                error = e.errno
+
+            if error not in (0, errno.EINPROGRESS):
+                # Attempt failed, wait for next attempt
+                sock.close()
+                continue
+
+            self._attempts.append(sock)
+            self._loop.register(sock, holepunch.loop.EVENT_WRITE, lambda events, sock=sock: self.handle(sock, events))
+
+    def handle(self, sock, events=holepunch.loop.EVENT_WRITE):
+        """Handle socket file descriptor of current connect attempt.
+
+        Complete punch if connected else abort socket and wait for next
+        attempt.
+
+        Args:
+            sock: Socket of connect attempt.
+            events: Ready events mask.
+        """
+
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            self.abort(sock)
+            return
+
+        self._loop.unregister(sock)
+        self._attempts.remove(sock)
+
+        self.complete(sock)
+
+    def complete(self, sock):
+        """Complete punch.
+
+        Args:
+            sock: Connected client-client socket.
+        """
+
+        self.close()
+
+        self._sock = sock
+        self._sock.setblocking(True)
+
+        try:
+            # Follow the port mapped by the destination NAT
+            self._dest_addr = sock.getpeername()
+        except OSError: # Connection reset, fails on first use
+            pass
+
+        logging.info("Punch %s to %s after %d attempts", self._source_addr, self._dest_addr, self._attempt)
+
+        self._callback(self, None)
+
+    def expire(self):
+        """Fail punch on deadline."""
+
+        self._deadline = None
+        self.close()
+
+        self._callback(self, TimeoutError("Holepunch to {0} timed out".format(self._dest_addr)))
+
+
+class HybridClient(Client):
+    """Socket wrapper racing TCP and UDP P2P communication across NAT/Firewall.
+
+    Socket wrapper opened by requesting the holepunching server to introduce
+    source to dest once, then punching TCP and UDP holes concurrently. The
+    client-client socket is the TCP socket if TCP punches within a grace delay
+    of UDP, else the UDP socket, so a NAT/Firewall refusing TCP costs the grace
+    delay instead of the holepunch timeout, and nothing on reconnect once UDP
+    winning is cached.
+
+    Attributes:
+        _server: Holepunch server socket wrapper.
+        _sock:  Client-client socket.
+        _addr:  Client host address and port address tuple.
+        _initiator: True if client connects, False if client listens.
+        _rtt: Round trip time in seconds measured by the UDP punch handshake.
+    """
+
+    PROTOCOLS = ("tcp", "udp")
+
+    @property
+    def rtt(self):
+        """Rtt accessor."""
+        return self._rtt
+
+    def __init__(self, server=None, cache=None):
+        """Initialise HybridClient."""
+
+        super().__init__(server, cache)
+
+        self._initiator = True
+        self._rtt = None
+
+    def open(self, dest_host=None):
+        """Open client-client socket.
+
+        Args:
+            dest_host: Destination host address. If dest_host is None then
+            client will receive a connect request else will send a connect
+            request.
+
+        Raises:
+            Exception: Excpetion if socket cannot open because response is not holepunch.
+        """
+
+        self._initiator = dest_host is not None
+
+        super().open(dest_host)
+
+    def _punch(self, loop, source_addr, dest_addr, callback, protocol=None, timeout=None, ports=None, entry=None):
+        """Create TCP and UDP punch race.
+
+        Args:
+            loop: Event loop.
+            source_addr: Tuple of source host address and source port address.
+            dest_addr: Tuple of dest host address and dest port address.
+            callback: Callable receiving punch and None, or punch and error on
+            failure.
+            protocol: Transport to punch ("tcp" or "udp"). If protocol is None
+            then TCP and UDP are raced.
+            timeout: Seconds before punch fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports punched in parallel. If ports is None
+            then only the port of destination address is punched.
+            entry: Punch cache entry of destination or None.
+
+        Returns:
+            punch: TCP and UDP punch race, or TCP or UDP punch.
+        """
+
+        def done(punch, error):
+            self._rtt = getattr(punch, "rtt", None)
+            callback(punch, error)
+
+        if protocol == "tcp":
+            return TCPPunch(loop, source_addr, dest_addr, done, timeout=timeout, ports=ports)
+
+        if protocol == "udp":
+            return UDPPunch(loop, source_addr, dest_addr, done, timeout=timeout, ports=ports)
+
+        # Select UDP without grace delay if TCP lost the cached race
+        grace = 0 if entry is not None and entry.protocol == "udp" else None
+
+        return HybridPunch(loop, source_addr, dest_addr, done, self._initiator, timeout, ports, grace)
+
+
+class HybridPunch:
+    """TCP and UDP punch race state machine.
+
+    TCP and UDP punch race state machine running a TCP punch and a UDP punch
+    from source address to destination address in an event loop. Both peers
+    must keep the same socket, so the connecting peer (initiator) selects the
+    winner and the listening peer follows its selection:
+
+    * The initiator selects TCP as soon as TCP punches, or UDP once the grace
+      delay elapsed after UDP punched or once TCP failed. The grace delay is
+      skipped when UDP won the race cached for the destination. It sends a select
+      marker on the selected socket and closes the other one.
+    * The listener selects TCP when the TCP select marker is received, or UDP
+      when the UDP select marker is received or once TCP failed or was closed
+      by the initiator.
+
+    Markers:
+
+        +----------+------------------------------------------+
+        | Protocol | Marker                                   |
+        +==========+==========================================+
+        | TCP      | 1 byte (T) stream prefix                 |
+        +----------+------------------------------------------+
+        | UDP      | 1 byte (=) packet, sent SELECT_COPIES    |
+        |          | times                                    |
+        +----------+------------------------------------------+
+
+    A select marker copy received by the listener after the race is received
+    by the application as a 1 byte packet (=).
+
+    Attributes:
+        _loop: Event loop.
+        _source_addr: Source host and port address tuple.
+        _dest_addr: Destination host and port address tuple.
+        _callback: Callable receiving punch and None, or punch and error on
+            failure.
+        _initiator: True if punch selects the winner.
+        _timeout: Seconds before race fails.
+        _tcp: TCP punch.
+        _udp: UDP punch.
+        _results: Error or None if punched by completed punch.
+        _watched: Sockets of completed punches read for select markers.
+        _winner: Selected punch or None.
+        _delay: Seconds initiator waits for TCP after UDP punched.
+        _grace: Grace timer or None.
+        _deadline: Deadline timer or None.
+    """
+
+    TCP_SELECT = b"T"
+
+    UDP_SELECT = b"="
+
+    SELECT_COPIES = 3
+
+    @property
+    def sock(self):
+        """Sock accessor, None until a punch wins."""
+        return None if self._winner is None else self._winner.sock
+
+    @property
+    def dest_addr(self):
+        """Dest addr accessor."""
+        return self._dest_addr if self._winner is None else self._winner.dest_addr
+
+    @property
+    def rtt(self):
+        """Rtt accessor."""
+        return getattr(self._winner, "rtt", None)
+
+    def __init__(self, loop, source_addr, dest_addr, callback, initiator, timeout=None, ports=None, grace=None):
+        """Initialise punch race.
+
+        Args:
+            loop: Event loop.
+            source_addr: Source host and port address tuple.
+            dest_addr: Destination host and port address tuple.
+            callback: Callable receiving punch and None, or punch and error on
+            failure.
+            initiator: True on the connecting peer, False on the listening
+            peer.
+            timeout: Seconds before race fails. If timeout is None then the
+            timeout configured in the config file is used.
+            ports: Destination ports punched in parallel. If ports is None
+            then only the port of destination address is punched.
+            grace: Seconds initiator waits for TCP after UDP punched. If grace
+            is None then the grace delay configured in the config file is
+            used.
+        """
+
+        self._loop = loop
+        self._source_addr = source_addr
+        self._dest_addr = dest_addr
+        self._callback = callback
+        self._initiator = initiator
+        self._timeout = holepunch.config.PUNCH_TIMEOUT if timeout is None else timeout
+        self._tcp = TCPPunch(loop, source_addr, dest_addr, self.punched, timeout=self._timeout, ports=ports)
+        self._udp = UDPPunch(loop, source_addr, dest_addr, self.punched, timeout=self._timeout, ports=ports)
+        self._results = {}
+        self._watched = {}
+        self._winner = None
+        self._delay = holepunch.config.PUNCH_GRACE if grace is None else grace
+        self._grace = None
+        self._deadline = None
+
+    def open(self):
+        """Start punch race.
+
+        Start TCP and UDP punches and schedule deadline.
+        """
+
+        self._deadline = self._loop.call_later(self._timeout, self.expire)
+
+        for punch in (self._tcp, self._udp):
+            try:
+                punch.open()
+            except OSError as e:
+                punch.close()
+                self.punched(punch, e)
+
+            if self._deadline is None: # Race over
+                return
+
+    def close(self):
+        """Stop punch race.
+
+        Cancel timers and stop or close both punches.
+        """
+
+        if self._grace is not None:
+            self._grace.cancel()
+            self._grace = None
+
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+
+        for sock in self._watched:
+            self._loop.unregister(sock)
+        self._watched.clear()
+
+        for punch in (self._tcp, self._udp):
+            if punch is self._winner:
+                continue
+
+            if punch not in self._results:
+                punch.close()
+            elif self._results[punch] is None:
+                punch.sock.close()
+                self._results[punch] = ConnectionError("Punch lost race")
+
+    def punched(self, punch, error):
+        """Handle punch completion.
+
+        Args:
+            punch: Completed TCP or UDP punch.
+            error: Error or None if punched.
+        """
+
+        self._results[punch] = error
+
+        if error is None and not self._initiator:
+            self._watched[punch.sock] = punch
+            self._loop.register(punch.sock, holepunch.loop.EVENT_READ, lambda events: self.handle(punch))
+
+        self.decide()
+
+    def decide(self):
+        """Decide race from punch results."""
+
+        tcp_done, udp_done = self._tcp in self._results, self._udp in self._results
+        tcp_punched = tcp_done and self._results[self._tcp] is None
+        udp_punched = udp_done and self._results[self._udp] is None
+
+        if tcp_done and udp_done and not tcp_punched and not udp_punched:
+            self.fail(self._results[self._tcp])
+        elif not self._initiator:
+            # Listener follows select markers, or UDP once TCP failed
+            if udp_punched and tcp_done and not tcp_punched:
+                self.select(self._udp)
+        elif tcp_punched:
+            self.select(self._tcp)
+        elif udp_punched and tcp_done:
+            self.select(self._udp)
+        elif udp_punched and self._grace is None:
+            self._grace = self._loop.call_later(self._delay, self.elapse)
+
+    def handle(self, punch):
+        """Handle socket of completed punch of listener.
+
+        Select punch on its select marker, drop TCP closed by the initiator.
+
+        Args:
+            punch: Completed TCP or UDP punch.
+        """
+
+        try:
+            data = punch.sock.recv(1 if punch is self._tcp else 65535)
+        except OSError as e:
+            data = e
+
+        if punch is self._tcp and data == self.TCP_SELECT:
+            self.select(punch)
+        elif punch is self._udp and data == self.UDP_SELECT:
+            self.select(punch)
+        elif punch is self._tcp:
+            # TCP closed by initiator
+            self._loop.unregister(punch.sock)
+            del self._watched[punch.sock]
+            punch.sock.close()
+
+            self._results[punch] = data if isinstance(data, OSError) else ConnectionError("Punch lost race")
+            self.decide()
+
+    def elapse(self):
+        """Select UDP once grace delay elapsed."""
+
+        self._grace = None
+        self.select(self._udp)
+
+    def select(self, punch):
+        """Select winner.
+
+        Send select marker if initiator, close the other punch and complete
+        race.
+
+        Args:
+            punch: Winning punch.
+        """
+
+        self._winner = punch
+        self.close()
+
+        if self._initiator:
+            try:
+                if punch is self._tcp:
+                    punch.sock.sendall(self.TCP_SELECT)
+                else:
+                    for _ in range(self.SELECT_COPIES):
+                        punch.sock.send(self.UDP_SELECT)
+            except OSError as e:
+                punch.sock.close()
+                self._callback(self, e)
+                return
+
+        else:
+            self.drain(punch)
+
+        logging.info("Punch %s to %s won by %s", self._source_addr, self._dest_addr, punch.sock.type.name)
+
+        self._callback(self, None)
+
+    def drain(self, punch):
+        """Drain select marker copies already received by listener.
+
+        Args:
+            punch: Winning punch.
+        """
+
+        if punch is not self._udp:
+            return
+
+        try:
+            while punch.sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == self.UDP_SELECT:
+                punch.sock.recv(1)
+        except OSError: # No packet left
+            pass
+
+    def fail(self, error):
+        """Fail race.
+
+        Args:
+            error: Error of failed punch.
+        """
+
+        self.close()
+        self._callback(self, error)
+
+    def expire(self):
+        """Fail race on deadline."""
+
+        self._deadline = None
+        self.fail(TimeoutError("Holepunch to {0} timed out".format(self._dest_addr)))
+
+
+class PunchPort:
+    """Shared punch socket of a source address.
+
+    Punches of one event loop sharing a source address share one socket bound
+    on it: a listening socket for TCP punches, a datagram socket for UDP
+    punches. Connects accepted and packets received are dispatched to the punch
+    of their host. A connect accepted from a host no punch is punching yet is
+    kept for the punch opened next for it until the holepunch timeout. Socket
+    is closed once no punch is attached and no connect is kept, closing it
+    earlier would reset the connects queued on it.
+
+    Attributes:
+        _loop: Event loop.
+        _key: Event loop, source address and socket type tuple.
+        _sock: Shared socket.
+        _punches: Punches by destination host address.
+        _accepted: Connected socket and expiry timer by host address.
+    """
+
+    _ports = {}
+
+    @property
+    def sock(self):
+        """Sock accessor."""
+        return self._sock
+
+    @classmethod
+    def attach(cls, loop, source_addr, type, host, punch):
+        """Attach punch to the shared socket of source address.
+
+        Args:
+            loop: Event loop.
+            source_addr: Source host and port address tuple.
+            type: Socket type, SOCK_STREAM or SOCK_DGRAM.
+            host: Destination host address of punch.
+            punch: Punch receiving connects or packets of host.
+
+        Returns:
+            port: Shared socket of source address.
+        """
+
+        key = (loop, source_addr, type)
+
+        port = cls._ports.get(key)
+        if port is None:
+            port = cls(loop, source_addr, type)
+            cls._ports[key] = port
+
+        port._punches[host] = punch
+
+        return port
+
+    @classmethod
+    def shutdown(cls, loop):
+        """Close shared sockets and kept connects of event loop.
+
+        Args:
+            loop: Event loop.
+        """
+
+        for port in [port for key, port in cls._ports.items() if key[0] is loop]:
+            for sock, timer in port._accepted.values():
+                timer.cancel()
+                sock.close()
+
+            port._punches.clear()
+            port._accepted.clear()
+            port.release()
+
+    def __init__(self, loop, source_addr, type):
+        """Initialise and open shared socket.
+
+        Args:
+            loop: Event loop.
+            source_addr: Source host and port address tuple.
+            type: Socket type, SOCK_STREAM or SOCK_DGRAM.
+        """
+
+        self._loop = loop
+        self._key = (loop, source_addr, type)
+        self._punches = {}
+        self._accepted = {}
+
+        self._sock = socket.socket(socket.AF_INET, type)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._sock.setblocking(False)
+
+        try:
+            self._sock.bind(source_addr)
+            if type == socket.SOCK_STREAM:
+                holepunch.tuning.PROFILE.listen(self._sock)
+            else:
+                holepunch.tuning.PROFILE.datagram(self._sock)
+        except OSError:
+            self._sock.close()
+            raise
+
+        self._loop.register(self, holepunch.loop.EVENT_READ, self.handle)
+
+    def fileno(self):
+        """Get shared socket file descriptor.
+
+        Returns:
+            file_descriptor: Shared socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def detach(self, host, punch):
+        """Detach punch of host.
+
+        Args:
+            host: Destination host address of punch.
+            punch: Punch to detach.
+        """
+
+        if self._punches.get(host) is punch:
+            del self._punches[host]
+
+        self.release()
+
+    def release(self):
+        """Close shared socket once no punch is attached and no connect kept."""
+
+        if self._punches or self._accepted:
+            return
+
+        del self._ports[self._key]
+        self._loop.unregister(self)
+        self._sock.close()
+
+    def pop(self, host):
+        """Take connect accepted from host before its punch opened.
+
+        Args:
+            host: Destination host address.
+
+        Returns:
+            sock: Connected socket or None.
+        """
+
+        if host not in self._accepted:
+            return None
+
+        sock, timer = self._accepted.pop(host)
+        timer.cancel()
+
+        return sock
+
+    def expire(self, host):
+        """Close connect kept for host on holepunch timeout.
+
+        Args:
+            host: Host address.
+        """
+
+        sock, timer = self._accepted.pop(host)
+        sock.close()
+
+        self.release()
+
+    def handle(self, events=holepunch.loop.EVENT_READ):
+        """Handle shared socket file descriptor.
+
+        Dispatch connects accepted or packets received to the punch of their
+        host.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        while self._ports.get(self._key) is self: # Socket open
+            try:
+                if self._key[2] == socket.SOCK_STREAM:
+                    data, (sock, addr) = None, self._sock.accept()
+                else:
+                    data, addr = self._sock.recvfrom(64)
+            except (BlockingIOError, ConnectionError):
+                break
+
+            punch = self._punches.get(addr[0])
+
+            if data is not None:
+                if punch is not None:
+                    punch.receive(data, addr)
+            elif punch is not None:
+                punch.complete(sock)
+            elif addr[0] not in self._accepted:
+                timer = self._loop.call_later(holepunch.config.PUNCH_TIMEOUT, lambda host=addr[0]: self.expire(host))
+                self._accepted[addr[0]] = (sock, timer)
+            else:
+                sock.close()
+
+
+class Server:
+    """Holepunch server socket wrapper for client-client P2P communication.
+
+    Holepunch server socket wrapper for client-client P2P communication
+    handling of request. Response will be either an error (NotFound (?), Close
+    (.)) or holepunch (Holepunch (*)).
+
+    With the binary protocol the client-server connection is persistent and
+    requests are pipelined: each request is sent with a unique id and matched
+    to the response carrying the same id, so many requests can be outstanding
+    over one connection. The connection is opened by the first request and is
+    reopened transparently, resending outstanding requests, when the server
+    closes it. Text requests have no id and text responses no framing, so each
+    text request uses a connection of its own. Server is not thread safe.
+
+    Example:
+        Pipelined requests::
+
+            server = holepunch.client.Server()
+            ids = [server.submit(holepunch.message.Message(method=">", body=host)) for host in hosts]
+            responses = [server.result(id) for id in ids]
+
+    Attributes:
+        _sock:  Server - client socket.
+        _addr: Server host address and port address tuple.
+        _codec: Request message codec as configured in the config file.
+        _decoder: Incremental response decoder.
+        _id: Last request id.
+        _pending: Outstanding requests by id.
+        _responses: Responses by id not yet collected.
+        _failures: Consecutive reconnects without a response.
+        _port: Local port of the client-server socket last opened or None.
+        _loop: Event loop scheduling reconnects or None to sleep.
+        _retry: Reconnect timer or None.
+    """
+
+    def __init__(self):
+        """Initialise server."""
+
+        self._sock = None
+        self._addr = (holepunch.config.SERVER_HOST, holepunch.config.SERVER_PORT)
+        self._port = None
+        self._decoder = None
+        self._id = 0
+        self._pending = {}
+        self._responses = {}
+        self._failures = 0
+        self._loop = None
+        self._retry = None
+
+        if holepunch.config.PROTOCOL == "text":
+            self._codec = holepunch.message.TEXT
+        else:
+            self._codec = holepunch.message.BINARY
+
+    @property
+    def sock(self):
+        """Sock accessor."""
+        return self._sock
+
+    @property
+    def pipelined(self):
+        """Pipelined accessor, True if requests can be pipelined."""
+        return self._codec is holepunch.message.BINARY
+
+    @property
+    def port(self):
+        """Port accessor."""
+        return self._port
+
+    @property
+    def loop(self):
+        """Loop accessor."""
+        return self._loop
+
+    @loop.setter
+    def loop(self, value):
+        """Loop mutator, a scheduled reconnect is cancelled."""
+
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+
+        self._loop = value
+
+    def fileno(self):
+        """Get client-server socket file descriptor.
+
+        Returns:
+            file_descriptor: Client-server socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def open(self):
+        """Open client-server socket.
+
+        Open socket between source_host on source_port and server dest_host on
+        dest_port as configured in the config file. Source port is shared with
+        the punch sockets, so their NAT mapping follows the one observed by the
+        server. Opening an open socket has no effect.
+        """
+
+        if self._sock is not None: # Socket open
+            return
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holepunch.tuning.PROFILE.stream(sock, fastopen=True)
+
+        try:
+            sock.bind(("", 0))
+            sock.connect(self._addr)
+        except OSError:
+            sock.close()
+            raise
+
+        self._sock = sock
+        self._port = sock.getsockname()[1]
+        self._decoder = holepunch.message.Decoder(holepunch.config.RECV_BUFFER_SIZE)
+
+        logging.info("Open client-server socket %s", self._sock)
+
+    def close(self):
+        """Close client-server socket.
+
+        Close socket between source_host on source_port and server dest_host on
+        dest_port as configured in the config file and cancel a scheduled
+        reconnect. Closing a closed socket has no effect.
+        """
+
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+
+        if self._sock is None: # Socket closed
+            return
+
+        self._sock.close()
+
+        logging.info("Close client-server socket %s", self._sock)
+
+        self._sock = None
+
+    def reconnect(self):
+        """Reopen client-server socket.
+
+        Reopen socket after the reconnect delay of consecutive failures as
+        configured in the config file and resend outstanding requests. The
+        delay is slept, or scheduled on the event loop of the server if it has
+        one so the requests of other destinations keep being handled.
+        Reconnecting while a reconnect is scheduled has no effect.
+
+        Raises:
+            ConnectionError: If the server closed the socket more times in a
+            row than there are reconnect delays. With an event loop outstanding
+            requests receive a close (.) response instead.
+        """
+
+        if self._retry is not None: # Reconnect scheduled
+            return
+
+        self.close()
+
+        if self._loop is not None:
+            self.schedule()
+            return
+
+        while True:
+            time.sleep(self.delay())
+
+            if self.resend():
+                return
+
+    def delay(self):
+        """Get reconnect delay of consecutive failures.
+
+        Returns:
+            delay: Seconds before next reconnect.
+
+        Raises:
+            ConnectionError: If the server closed the socket more times in a
+            row than there are reconnect delays.
+        """
+
+        schedule = holepunch.config.RECONNECT_RETRY
+
+        if self._failures >= len(schedule):
+            self._failures = 0
+            raise ConnectionError("Holepunch server {0} unreachable".format(self._addr))
+
+        self._failures += 1
+
+        return schedule[self._failures - 1]
+
+    def resend(self):
+        """Reopen client-server socket and resend outstanding requests.
+
+        Returns:
+            reopened: True if socket is open, False if reopen failed.
+        """
+
+        try:
+            self.open()
+
+            for request in self._pending.values():
+                self.send(request)
+        except OSError:
+            self.close()
+            return False
+
+        return True
+
+    def schedule(self):
+        """Schedule reconnect on the event loop.
+
+        Outstanding requests receive a close (.) response once the reconnect
+        delays are exhausted.
+        """
+
+        try:
+            delay = self.delay()
+        except ConnectionError as e:
+            logging.info("Reconnect failed: %s", e)
+
+            for id in self._pending:
+                self._responses[id] = holepunch.message.Message(method=".", id=id)
+            self._pending.clear()
+            return
+
+        self._retry = self._loop.call_later(delay, self.elapse)
+
+    def elapse(self):
+        """Reconnect once the delay scheduled elapsed."""
+
+        self._retry = None
+
+        if not self.resend():
+            self.schedule()
+
+    def send(self, message):
+        """Send client-client data.
+
+        Send message to server encoded by the configured codec.
+
+        Args:
+            message: Message sent to server.
+        """
+
+        data = self._codec.encode(message)
+        self._sock.sendall(data)
+
+    def recv(self):
+        """Receive client-client data.
+
+        Receive data from sever into the receive buffer until a complete
+        message is decoded. Response is decoded by the codec negotiated from
+        the received data.
+
+        Returns:
+            message: Parsed data received from client. Close (.) on end of
+            file.
+        """
+
+        message = self._decoder.decode()
+
+        while message is None:
+            if not self._decoder.recv_into(self._sock): # Close (.) on end of file
+                return holepunch.message.Message(method=".")
+
+            message = self._decoder.decode()
+
+        return message
+
+    def submit(self, request):
+        """Submit request to server without waiting for response.
+
+        Assign request the next request id and send it over the persistent
+        client-server socket.
+
+        Args:
+            request: Request message.
+
+        Returns:
+            id: Request id, pass it to result to wait for response.
+        """
+
+        self._id = self._id % 0xffffffff + 1
+        request.id = self._id
+        self._pending[request.id] = request
+
+        if self._retry is not None: # Sent once reconnected
+            return request.id
+
+        try:
+            self.open()
+            self.send(request)
+        except OSError:
+            self.reconnect()
+
+        return request.id
+
+    def poll(self):
+        """Receive available responses.
+
+        Receive data from server, blocking until some is available, and collect
+        the responses of outstanding requests. Reconnect if server closed the
+        socket.
+        """
+
+        if self._sock is None: # Socket closed by failed or scheduled reconnect
+            self.reconnect()
+            return
+
+        try:
+            size = self._decoder.recv_into(self._sock)
+        except (ConnectionError, socket.timeout):
+            size = 0
+
+        if not size:
+            self.reconnect()
+            return
+
+        for response in self._decoder:
+            if self._pending.pop(response.id, None) is not None:
+                self._responses[response.id] = response
+                self._failures = 0
+
+    def ready(self, id):
+        """Check if response of submitted request has been received.
+
+        Args:
+            id: Request id returned by submit.
+
+        Returns:
+            ready: True if result returns without blocking.
+        """
+
+        return id in self._responses
+
+    def result(self, id):
+        """Wait for response of submitted request.
+
+        Run the event loop of the server while a reconnect is scheduled.
+
+        Args:
+            id: Request id returned by submit.
+
+        Returns:
+            response: Server response.
+        """
+
+        while id not in self._responses:
+            if self._retry is not None:
+                self._loop.run_once()
+            else:
+                self.poll()
+
+        return self._responses.pop(id)
+
+    def request(self, request):
+        """Send request to server and the block wait for response.
+
+        Args:
+            request: Request message.
+
+        Returns:
+            response: Server response.
+        """
+
+        if not self.pipelined:
+            self.open()
+
+            try:
+                self.send(request)
+                return self.recv()
+            finally:
+                self.close()
+
+        return self.result(self.submit(request))
+
+    def listen_request(self):
+        """Send listen request to server.
+
+        Send listen request (<) to server and the block wait for response.
+
+        Returns:
+            response: Server response.
+        """
+
+        return self.request(holepunch.message.Message(method="<"))
+
+    def connect_request(self, dest_host):
+        """Send connect request to server.
+
+        Send connect request (>dest_host) to server and the block wait for
+        response.
+
+        Args:
+            dest_host: Destination host address.
+
+        Returns:
+            response: Server response.
+        """
+
+        return self.request(holepunch.message.Message(method=">", body=dest_host))
+
+
+class DatagramServer:
+    """Holepunch server datagram wrapper for client-client P2P communication.
+
+    Holepunch server datagram wrapper sending requests to the UDP rendezvous
+    endpoint of the server. A request is retransmitted with exponential backoff
+    until its response arrives; a listen request keeps being retransmitted as
+    a heartbeat while waiting for the holepunch response. Each request uses a
+    socket of its own, whose port the punch sockets then share, so requests
+    are not pipelined.
+
+    Example:
+        Datagram requests::
+
+            client = holepunch.client.UDPClient(server=holepunch.client.DatagramServer())
+            client.open("127.0.0.2")
+
+    Attributes:
+        _sock:  Client-server datagram socket.
+        _addr: Server host address and port address tuple.
+        _codec: Request message codec as configured in the config file.
+        _buf: Receive buffer.
+        _port: Local port of the client-server socket last opened or None.
+    """
+
+    def __init__(self):
+        """Initialise datagram server."""
+
+        self._sock = None
+        self._addr = (holepunch.config.SERVER_HOST, holepunch.config.SERVER_PORT)
+        self._port = None
+        self._buf = bytearray(holepunch.config.RECV_BUFFER_SIZE)
+
+        if holepunch.config.PROTOCOL == "text":
+            self._codec = holepunch.message.TEXT
+        else:
+            self._codec = holepunch.message.BINARY
+
+    @property
+    def sock(self):
+        """Sock accessor."""
+        return self._sock
+
+    @property
+    def pipelined(self):
+        """Pipelined accessor, True if requests can be pipelined."""
+        return False
+
+    @property
+    def port(self):
+        """Port accessor."""
+        return self._port
+
+    def open(self):
+        """Open client-server datagram socket.
+
+        Bind socket on a new port shared with the punch sockets.
+        """
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holepunch.tuning.PROFILE.datagram(self._sock)
+        self._sock.bind(("", 0))
+        self._port = self._sock.getsockname()[1]
+
+        logging.info("Open client-server datagram socket %s", self._sock)
+
+    def close(self):
+        """Close client-server datagram socket."""
+
+        if self._sock is None: # Socket closed
+            return
+
+        self._sock.close()
+
+        logging.info("Close client-server datagram socket %s", self._sock)
+
+        self._sock = None
+
+    def request(self, request, timeout=None):
+        """Send request to server and wait for response.
+
+        Open a socket of the request own and retransmit request with
+        exponential backoff until its response is received or timeout expires.
+        Binary request is assigned a random request id if it has none, text
+        requests and responses have no id.
+
+        Args:
+            request: Request message.
+            timeout: Maximum seconds to wait. If timeout is None then a listen
+            request waits until response is received and other requests wait
+            the request timeout configured in the config file.
+
+        Returns:
+            response: Server response. Close (.) if timeout expires.
+        """
+
+        if not request.id and self._codec is holepunch.message.BINARY:
+            request.id = random.getrandbits(32) or 1
+
+        if timeout is None and request.method != "<":
+            timeout = holepunch.config.REQUEST_TIMEOUT
+
+        self.open()
+
+        try:
+            return self.exchange(request, timeout)
+        finally:
+            self.close()
+
+    def exchange(self, request, timeout):
+        """Retransmit request over the open socket until its response.
+
+        Args:
+            request: Request message.
+            timeout: Maximum seconds to wait or None to wait until response is
+            received.
+
+        Returns:
+            response: Server response. Close (.) if timeout expires.
+        """
+
+        data = self._codec.encode(request)
+        view = memoryview(self._buf)
+
+        retransmit = holepunch.config.RETRANSMIT_TIMEOUT
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            self._sock.sendto(data, self._addr)
+
+            wait = retransmit
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return holepunch.message.Message(method=".", id=request.id)
+
+            self._sock.settimeout(wait)
+
+            try:
+                while True:
+                    size, addr = self._sock.recvfrom_into(self._buf)
+
+                    if addr != self._addr:
+                        continue
+
+                    response, _ = holepunch.message.negotiate(view[:size]).decode(view[:size])
+
+                    if response is not None and response.id == request.id:
+                        return response
+            except socket.timeout:
+                retransmit = min(retransmit * 2, holepunch.config.RETRANSMIT_MAX)
+            except ValueError: # Drop malformed response
+                continue
+
+    def listen_request(self):
+        """Send listen request to server.
+
+        Send listen request (<) to server and the block wait for response.
+
+        Returns:
+            response: Server response.
+        """
+
+        return self.request(holepunch.message.Message(method="<"))
+
+    def connect_request(self, dest_host):
+        """Send connect request to server.
+
+        Send connect request (>dest_host) to server and the block wait for
+        response.
+
+        Args:
+            dest_host: Destination host address.
+
+        Returns:
+            response: Server response.
+        """
 
-        return response
+        return self.request(holepunch.message.Message(method=">", body=dest_host))
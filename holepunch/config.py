@@ -1,15 +1,147 @@
-import logging
+# Logging level of the holepunch application
+LOG_LEVEL = "INFO"
 
-
-logging.basicConfig(
-    filename=None,
-    format="%(asctime)s %(levelname)s: %(message)s",
-    level=logging.DEBUG
-)
+# Trace records buffered before the oldest is dropped, one trace event of
+# every TRACE_SAMPLE recorded and seconds the trace listener sleeps while idle
+TRACE_BUFFER = 65536
+TRACE_SAMPLE = 1
+TRACE_FLUSH = 0.05
 
 # Holepunch server host and port
 SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 20000
 
-# Holepunch port for P2P communication behind NAT/Firewall
+# Holepunch port for P2P communication behind NAT/Firewall of text protocol
+# clients
 HOLEPUNCH_PORT = 20001
+
+# Holepunch server relay port for clients whose punch failed
+RELAY_PORT = 20002
+
+# Seconds a relay client waits for its peer
+RELAY_TIMEOUT = 10
+
+# Seconds an issued relay token is accepted, covering the punch of both clients
+# and their wait for each other
+RELAY_TOKEN_TTL = 30
+
+# Relay pipe size in bytes, the maximum bytes buffered per relayed direction
+RELAY_PIPE_SIZE = 1048576
+
+# Metrics exporter host and port, the port of a sharded server worker is
+# offset by its slot
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 20090
+
+# Seconds before a metrics scrape connection is closed
+METRICS_TIMEOUT = 5
+
+# Metrics histogram bucket upper bounds in seconds
+METRICS_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# Server listening socket backlog of pending connections
+LISTEN_BACKLOG = 1024
+
+# Seconds the server stops accepting once file descriptors or memory run out
+ACCEPT_BACKOFF = 0.1
+
+# Socket tuning profile preset ("default", "low-latency" or "high-fanout")
+TUNING_PROFILE = "default"
+
+# Client request protocol ("binary" or "text")
+PROTOCOL = "binary"
+
+# Control connection receive buffer size (maximum message size)
+RECV_BUFFER_SIZE = 1024
+
+# Control connection outbound buffer watermarks and limit in bytes
+WRITE_BUFFER_LOW = 16384
+WRITE_BUFFER_HIGH = 65536
+WRITE_BUFFER_LIMIT = 1048576
+
+# Seconds before a client that sends no request is closed
+IDLE_TIMEOUT = 30
+
+# Seconds a listening client stays listening after its last listen request
+LISTEN_TTL = 300
+
+# Maximum datagrams handled per wakeup of the UDP rendezvous endpoint
+DATAGRAM_BATCH = 64
+
+# Seconds a UDP rendezvous reply is cached for retransmitted requests
+REPLY_TTL = 5
+
+# Initial and maximum seconds before a UDP request is retransmitted
+RETRANSMIT_TIMEOUT = 0.25
+RETRANSMIT_MAX = 4.0
+
+# Seconds before a UDP connect request is abandoned
+REQUEST_TIMEOUT = 10
+
+# Seconds between holepunch connect attempts or probes, the last is repeated
+PUNCH_RETRY = (0.1, 0.2, 0.4, 0.8, 1.6)
+
+# Seconds before a holepunch fails
+PUNCH_TIMEOUT = 10
+
+# Seconds a UDP punch waits for the TCP punch it races before being preferred
+PUNCH_GRACE = 0.25
+
+# Ports punched after the observed port of a symmetric NAT allocating ports
+# sequentially
+PUNCH_PREDICT = 8
+
+# Observed ports kept per host, maximum port step of a sequential NAT and
+# maximum hosts classified
+NAT_OBSERVATIONS = 4
+NAT_DELTA_MAX = 16
+NAT_TABLE_SIZE = 65536
+
+# Seconds a punch result is cached, maximum cached peers and seconds before a
+# direct punch from cache falls back to the server
+PUNCH_CACHE_TTL = 60
+PUNCH_CACHE_SIZE = 1024
+PUNCH_CACHE_TIMEOUT = 1
+
+# Seconds before each consecutive reconnect of the client-server connection
+RECONNECT_RETRY = (0, 0.1, 0.5, 1, 2)
+
+# Maximum destinations in progress of Client.connect_many
+CONNECT_CONCURRENCY = 64
+
+# Client-client receive buffer size and number of pooled buffers
+BUFFER_SIZE = 65536
+BUFFER_COUNT = 16
+
+# Maximum client-client frame payload size
+FRAME_MAX = 16777216
+
+# Multiplexed stream receive window and maximum data frame size in bytes
+MUX_WINDOW = 262144
+MUX_FRAME = 16384
+
+# Reliable UDP segment size, receive window and initial congestion window
+RUDP_SEGMENT_SIZE = 1200
+RUDP_WINDOW = 1024
+RUDP_INITIAL_WINDOW = 10
+
+# Reliable UDP retransmission timeout bounds and initial value in seconds
+RUDP_RTO_MIN = 0.2
+RUDP_RTO_MAX = 60
+RUDP_RTO_INITIAL = 1
+
+# Reliable UDP minimum reordering window in seconds before a segment is lost
+RUDP_REORDERING = 0.001
+
+# Reliable UDP congestion window reduction factor on loss
+RUDP_BETA = 0.7
+
+# Reliable UDP pacing rate over congestion window per round trip and burst
+RUDP_PACING_GAIN = 1.25
+RUDP_BURST = 16
+
+# Reliable UDP selective acknowledgement blocks per acknowledgement
+RUDP_SACK_BLOCKS = 4
+
+# Seconds a closing reliable UDP connection waits for acknowledgements
+RUDP_LINGER = 10
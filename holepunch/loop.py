@@ -0,0 +1,180 @@
+"""Event loop for asynchronous i/o of holepunch server.
+
+Event loop is a thin wrapper over the selectors module. Every endpoint (server
+listening socket, server-client socket) is registered once with the events it
+is interested in and a callback. When the endpoint is ready the callback is
+called with the ready events mask, so the cost of a wakeup depends only on the
+number of ready endpoints and not on the number of registered endpoints.
+
+The selector backend is pluggable; by default selectors.DefaultSelector is used
+which is epoll on Linux, kqueue on BSD and select elsewhere. Timers are kept in
+a hierarchical timer wheel advanced after every iteration.
+
+Example:
+    Loop::
+
+        loop = holepunch.loop.Loop()
+        loop.register(server, holepunch.loop.EVENT_READ, server.accept_client)
+        loop.run()
+"""
+
+
+import errno
+import selectors
+
+import holepunch.timer
+
+
+EVENT_READ = selectors.EVENT_READ
+EVENT_WRITE = selectors.EVENT_WRITE
+
+# Accept errors once file descriptors or memory run out, accepting again fails
+# until some are freed
+EXHAUSTED = frozenset((errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM))
+
+
+class Loop:
+    """Readiness event loop.
+
+    Readiness event loop dispatching ready events of registered file objects to
+    their callbacks. A file object is anything with a fileno method.
+
+    Attributes:
+        _selector: Selector backend.
+        _timers: Timer wheel.
+        _running: True while loop is running.
+    """
+
+    @property
+    def selector(self):
+        """Selector accessor."""
+        return self._selector
+
+    @property
+    def timers(self):
+        """Timers accessor."""
+        return self._timers
+
+    def __init__(self, selector=None, timers=None):
+        """Initialise loop.
+
+        Args:
+            selector: Selector class (selectors.BaseSelector subclass). If
+            selector is None then selectors.DefaultSelector is used.
+            timers: Timer wheel. If timers is None then a timer wheel with
+            default resolution is used.
+        """
+
+        if selector is None:
+            selector = selectors.DefaultSelector
+
+        self._selector = selector()
+        self._timers = holepunch.timer.TimerWheel() if timers is None else timers
+        self._running = False
+
+    def __len__(self):
+        """__len__ overload."""
+        return len(self._selector.get_map())
+
+    def register(self, fileobj, events, callback):
+        """Register file object.
+
+        Register file object for events. Callback is called with the ready
+        events mask when file object is ready.
+
+        Args:
+            fileobj: File object with fileno method.
+            events: Mask of EVENT_READ and EVENT_WRITE.
+            callback: Callable receiving ready events mask.
+        """
+
+        self._selector.register(fileobj, events, callback)
+
+    def modify(self, fileobj, events, callback):
+        """Modify registered file object.
+
+        Modify events and callback of registered file object.
+
+        Args:
+            fileobj: File object with fileno method.
+            events: Mask of EVENT_READ and EVENT_WRITE.
+            callback: Callable receiving ready events mask.
+        """
+
+        self._selector.modify(fileobj, events, callback)
+
+    def unregister(self, fileobj):
+        """Unregister file object.
+
+        Unregister file object. File object must be unregistered before its
+        file descriptor is closed.
+
+        Args:
+            fileobj: File object with fileno method.
+        """
+
+        self._selector.unregister(fileobj)
+
+    def call_later(self, delay, callback):
+        """Schedule callback.
+
+        Args:
+            delay: Seconds until callback is called.
+            callback: Callable without arguments.
+
+        Returns:
+            timer: Scheduled timer, cancel it to cancel callback.
+        """
+
+        return self._timers.schedule(delay, callback)
+
+    def run_once(self, timeout=None):
+        """Run one loop iteration.
+
+        Wait for ready file objects and call their callbacks, then call
+        callbacks of expired timers. A file object unregistered by an earlier
+        callback of the same iteration is skipped.
+
+        Args:
+            timeout: Maximum seconds to wait. If timeout is None then block
+            until a file object is ready or the next timer tick.
+        """
+
+        ticks = self._timers.timeout()
+        if ticks is not None and (timeout is None or ticks < timeout):
+            timeout = ticks
+
+        keys = self._selector.get_map()
+
+        for key, mask in self._selector.select(timeout):
+            if getattr(keys.get(key.fd), "fileobj", None) is key.fileobj:
+                key.data(mask)
+
+        self._timers.advance()
+
+    def run(self):
+        """Run loop.
+
+        Run loop iterations until stop is called.
+        """
+
+        self._running = True
+
+        while self._running:
+            self.run_once()
+
+    def stop(self):
+        """Stop loop.
+
+        Stop loop after current iteration.
+        """
+
+        self._running = False
+
+    def close(self):
+        """Close loop.
+
+        Close selector backend.
+        """
+
+        self._selector.close()
@@ -12,15 +12,49 @@ Messages:
     +---------------------------+-------------------+--------------------------------------+
     | <                         | request           | listen                               |
     +---------------------------+-------------------+--------------------------------------+
-    | \*(dest_host, dest_port)  | response          | holepunch to (dest_host, dest_port)  |
+    | \\*(dest_host, dest_port,  | response          | holepunch to (dest_host, dest_port)  |
+    | delta, token)             |                   | and ports predicted by delta, relay  |
+    |                           |                   | by token if punch fails              |
     +---------------------------+-------------------+--------------------------------------+
-    | !                         | response          | not found                            |
+    | ?                         | response          | not found                            |
     +---------------------------+-------------------+--------------------------------------+
     | .                         | request/response  | close socket                         |
     +---------------------------+-------------------+--------------------------------------+
+
+Messages are encoded either by the text codec (the method character followed by
+the body) or by the binary codec. Binary frames start with a version byte which
+can never be the first byte of a text message, so a peer negotiates the codec
+from the first byte received and responds with the same codec.
+
+Binary frame:
+
+    +----------+----------+----------+----------+----------------------------+
+    | version  | opcode   | length   | id       | body                       |
+    +==========+==========+==========+==========+============================+
+    | 1 byte   | 1 byte   | 2 bytes  | 4 bytes  | length bytes               |
+    +----------+----------+----------+----------+----------------------------+
+
+Body of connect (>) is a packed address and body of holepunch (*) is a packed
+address followed by a 2 bytes port, a 2 bytes signed port delta (see
+holepunch.nat) and an 8 bytes relay token (see holepunch.relay); delta and
+token are optional and 0 if missing, a token of 0 means no relay. Text clients
+predate observed ports, deltas and relay tokens, so a holepunch (*) response
+sent by the text codec is downgraded to \*(dest_host, holepunch_port), the port
+of the holepunch config both clients bind and punch. Packed
+address is a 1 byte family (4 or 6) followed by the 4 or 16 bytes IPv4/IPv6
+address. Integers are big endian. Id is the request id; a response carries the
+id of the request it answers. A server decodes requests only (REQUESTS), a
+response method received from a client is malformed.
 """
 
 
+import ast
+import socket
+import struct
+
+import holepunch.config
+
+
 class Message:
     """Request/Response message for client - server communication.
 
@@ -29,6 +63,7 @@ class Message:
     Attributes:
         _method: Request/Response method.
         _body: Request/Response body.
+        _id: Request id.
     """
 
     @property
@@ -51,12 +86,32 @@ class Message:
         """Body mutator."""
         self._body = value
 
-    def __init__(self, data):
-        """Message intialisation."""
-        self._method = None
-        self._body = None
+    @property
+    def id(self):
+        """Id accessor."""
+        return self._id
 
-        self.parse(data)
+    @id.setter
+    def id(self, value):
+        """Id mutator."""
+        self._id = value
+
+    def __init__(self, data=None, method=None, body="", id=0):
+        """Message intialisation.
+
+        Args:
+            data: String data to be parsed. If data is None then message is
+            built from method and body.
+            method: Request/Response method.
+            body: Request/Response body.
+            id: Request id.
+        """
+        self._method = method
+        self._body = body
+        self._id = id
+
+        if data is not None:
+            self.parse(data)
 
     def __repr__(self):
         """__repr__ overload."""
@@ -89,12 +144,391 @@ class Message:
             elif data[0] == "<": # <
                 self._method = data[0]
                 self._body = ""
-            elif data[0] == "*": # *dest_host, dest_port)
+            elif data[0] == "*": # *(dest_host, dest_port, delta, token)
                 self._method = data[0]
-                self._body = eval(data[1:])
+                self._body = ast.literal_eval(data[1:])
             elif data[0] == "?": # ?
                 self._method = data[0]
                 self._body = ""
+            elif data[0] == ".": # .
+                self._method = data[0]
+                self._body = ""
         else: # .
             self._method = "."
             self._body = ""
+
+
+class TextCodec:
+    """Text message codec.
+
+    Text codec encodes message as its method character followed by its body.
+    Text messages are not delimited, so all received data is decoded as a single
+    message.
+    """
+
+    def encode(self, message):
+        """Encode message.
+
+        Args:
+            message: Message to encode.
+
+        Returns:
+            data: Message as bytes.
+        """
+
+        return bytes(message)
+
+    def decode(self, view, methods=None):
+        """Decode message.
+
+        Args:
+            view: Memoryview of received data.
+            methods: Methods expected. If methods is None then any method is
+            decoded.
+
+        Returns:
+            message: Message decoded or None if view is empty.
+            size: Number of bytes consumed.
+
+        Raises:
+            ValueError: If message is malformed or its method is not expected.
+        """
+
+        if not view:
+            return (None, 0)
+
+        data = str(view, "utf-8")
+
+        if methods is not None and data[0] not in methods:
+            raise ValueError("Unexpected method")
+
+        try:
+            message = Message(data)
+        except (SyntaxError, TypeError):
+            raise ValueError("Malformed message")
+
+        if message.method == "*" and not (isinstance(message.body, tuple) and len(message.body) >= 2 and isinstance(message.body[0], str) and isinstance(message.body[1], int)):
+            raise ValueError("Malformed message")
+
+        return (message, len(view))
+
+
+class BinaryCodec:
+    """Binary message codec.
+
+    Binary codec encodes message as a length-prefixed frame with a fixed opcode
+    per method and packed addresses. Decoding unpacks directly from a memoryview
+    of the received data without intermediate copies.
+    """
+
+    VERSION = 1
+
+    HEADER = struct.Struct("!BBHI")
+
+    PORT = struct.Struct("!H")
+
+    DELTA = struct.Struct("!h")
+
+    TOKEN = struct.Struct("!Q")
+
+    OPCODES = {">": 1, "<": 2, "*": 3, "?": 4, ".": 5}
+
+    METHODS = {opcode: method for method, opcode in OPCODES.items()}
+
+    FAMILIES = {4: (socket.AF_INET, 4), 6: (socket.AF_INET6, 16)}
+
+    def _pack_addr(self, host):
+        """Pack host address.
+
+        Args:
+            host: IPv4 or IPv6 host address.
+
+        Returns:
+            data: Family and packed address as bytes.
+        """
+
+        if ":" in host:
+            return b"\x06" + socket.inet_pton(socket.AF_INET6, host)
+        return b"\x04" + socket.inet_pton(socket.AF_INET, host)
+
+    def _unpack_addr(self, view, offset):
+        """Unpack host address.
+
+        Args:
+            view: Memoryview of received data.
+            offset: Offset of packed address.
+
+        Returns:
+            host: IPv4 or IPv6 host address.
+            offset: Offset after packed address.
+
+        Raises:
+            ValueError: If family is unknown.
+        """
+
+        family, size = self.FAMILIES[view[offset]]
+        offset += 1
+        return (socket.inet_ntop(family, view[offset:offset + size]), offset + size)
+
+    def encode(self, message):
+        """Encode message.
+
+        Args:
+            message: Message to encode.
+
+        Returns:
+            data: Message as bytes.
+        """
+
+        if message.method == ">":
+            body = self._pack_addr(message.body)
+        elif message.method == "*":
+            body = self._pack_addr(message.body[0]) + self.PORT.pack(message.body[1])
+            if len(message.body) > 2:
+                body += self.DELTA.pack(message.body[2])
+            if len(message.body) > 3:
+                body += self.TOKEN.pack(message.body[3])
+        else:
+            body = b""
+
+        header = self.HEADER.pack(self.VERSION, self.OPCODES[message.method], len(body), message.id)
+        return header + body
+
+    def decode(self, view, methods=None):
+        """Decode message.
+
+        Args:
+            view: Memoryview of received data.
+            methods: Methods expected. If methods is None then any method is
+            decoded.
+
+        Returns:
+            message: Message decoded or None if view holds no complete frame.
+            size: Number of bytes consumed.
+
+        Raises:
+            ValueError: If frame is malformed or its method is not expected.
+        """
+
+        if len(view) < self.HEADER.size:
+            return (None, 0)
+
+        version, opcode, length, id = self.HEADER.unpack_from(view)
+        size = self.HEADER.size + length
+
+        if version != self.VERSION or opcode not in self.METHODS:
+            raise ValueError("Malformed frame")
+
+        if len(view) < size:
+            return (None, 0)
+
+        method = self.METHODS[opcode]
+        offset = self.HEADER.size
+
+        if methods is not None and method not in methods:
+            raise ValueError("Unexpected method")
+
+        # Body must not be read past the frame
+        view = view[:size]
+
+        try:
+            if method == ">":
+                body, offset = self._unpack_addr(view, offset)
+            elif method == "*":
+                host, offset = self._unpack_addr(view, offset)
+                port, = self.PORT.unpack_from(view, offset)
+                offset += self.PORT.size
+                delta, = self.DELTA.unpack_from(view, offset) if offset < size else (0,)
+                offset += self.DELTA.size
+                token, = self.TOKEN.unpack_from(view, offset) if offset < size else (0,)
+                body = (host, port, delta, token)
+            else:
+                body = ""
+        except (KeyError, IndexError, struct.error):
+            raise ValueError("Malformed frame")
+
+        return (Message(method=method, body=body, id=id), size)
+
+
+TEXT = TextCodec()
+
+BINARY = BinaryCodec()
+
+REQUESTS = frozenset((">", "<", "."))
+
+
+def downgrade(message, codec):
+    """Downgrade holepunch response for the codec of its recipient.
+
+    Args:
+        message: Message sent.
+        codec: Message codec of recipient.
+
+    Returns:
+        message: Holepunch (*(dest_host, holepunch_port)) response if codec is
+        TEXT and message is a holepunch response, else message.
+    """
+
+    if codec is not TEXT or message.method != "*" or len(message.body) <= 2:
+        return message
+
+    return Message(method="*", body=(message.body[0], holepunch.config.HOLEPUNCH_PORT), id=message.id)
+
+
+def negotiate(view):
+    """Negotiate codec.
+
+    Negotiate codec from the first byte received from a peer.
+
+    Args:
+        view: Memoryview of received data.
+
+    Returns:
+        codec: BINARY if data starts with the binary version byte else TEXT.
+    """
+
+    if view and view[0] == BinaryCodec.VERSION:
+        return BINARY
+    return TEXT
+
+
+class Decoder:
+    """Incremental message decoder.
+
+    Incremental message decoder of a stream connection. Received data is read
+    with recv_into in a preallocated buffer and zero or more complete messages
+    are decoded from it, so messages split or coalesced by the stream are
+    handled and per-connection memory is bounded by the buffer size. Codec is
+    negotiated from the first byte received unless given.
+
+    Attributes:
+        _buf: Receive buffer.
+        _view: Memoryview of receive buffer.
+        _start: Offset of first undecoded byte.
+        _end: Offset after last received byte.
+        _codec: Message codec.
+        _methods: Methods expected or None.
+    """
+
+    @property
+    def codec(self):
+        """Codec accessor."""
+        return self._codec
+
+    def __init__(self, size, codec=None, methods=None):
+        """Initialise decoder.
+
+        Args:
+            size: Receive buffer size, the maximum size of a message.
+            codec: Message codec. If codec is None then it is negotiated from
+            the first byte received.
+            methods: Methods expected, REQUESTS on a server. If methods is None
+            then any method is decoded.
+        """
+
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self._codec = codec
+        self._methods = methods
+
+    def __iter__(self):
+        """__iter__ overload."""
+
+        message = self.decode()
+        while message is not None:
+            yield message
+            message = self.decode()
+
+    def _reserve(self):
+        """Reserve free space at the end of receive buffer.
+
+        Move undecoded data to the start of receive buffer when buffer end is
+        reached.
+
+        Raises:
+            ValueError: If receive buffer is full of an incomplete message.
+        """
+
+        if self._end < len(self._buf):
+            return
+
+        if self._start == 0:
+            raise ValueError("Message exceeds receive buffer")
+
+        size = self._end - self._start
+        self._buf[:size] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = size
+
+    def recv_into(self, sock):
+        """Receive data from socket into receive buffer.
+
+        Args:
+            sock: Stream socket.
+
+        Returns:
+            size: Number of bytes received, 0 on end of file.
+
+        Raises:
+            ValueError: If receive buffer is full of an incomplete message.
+        """
+
+        self._reserve()
+
+        size = sock.recv_into(self._view[self._end:])
+        self._end += size
+        return size
+
+    def feed(self, data):
+        """Copy received data into receive buffer and decode messages.
+
+        Args:
+            data: Data as bytes received.
+
+        Yields:
+            message: Complete messages.
+
+        Raises:
+            ValueError: If receive buffer is full of an incomplete message or
+            data is malformed.
+        """
+
+        data = memoryview(data)
+
+        while data:
+            self._reserve()
+
+            size = min(len(data), len(self._buf) - self._end)
+            self._buf[self._end:self._end + size] = data[:size]
+            self._end += size
+            data = data[size:]
+
+            yield from self
+
+    def decode(self):
+        """Decode next message.
+
+        Returns:
+            message: Next complete message or None.
+
+        Raises:
+            ValueError: If data is malformed.
+        """
+
+        if self._start == self._end:
+            return None
+
+        view = self._view[self._start:self._end]
+
+        if self._codec is None:
+            self._codec = negotiate(view)
+
+        message, size = self._codec.decode(view, self._methods)
+
+        self._start += size
+        if self._start == self._end:
+            self._start = self._end = 0
+
+        return message
@@ -0,0 +1,633 @@
+"""Metrics of the holepunch server exported in Prometheus text format.
+
+Counters, gauges and fixed-bucket histograms are plain attributes updated on
+the hot path of the server event loop. The loop is single threaded, so no lock
+is taken; a histogram observation is one bisect over the bucket bounds and
+three increments. Metrics of a registry are rendered in the Prometheus text
+exposition format on scrape.
+
+Exporter serves GET /metrics over HTTP on a local port from the server event
+loop, so a scrape never races an update. Each worker of a sharded server
+exports its own metrics on the configured port plus its slot.
+
+Server metrics:
+
+    +--------------------------------+-----------+----------------------------------------+
+    | Metric                         | Type      | Description                            |
+    +================================+===========+========================================+
+    | holepunch_accepted_total       | counter   | server-client connections accepted     |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_clients              | gauge     | clients and peers in client registry   |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_listening            | gauge     | listening clients and peers parked     |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_requests_total       | counter   | requests handled by method             |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_request_seconds      | histogram | request handling time by method        |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_lookups_total        | counter   | client registry lookups                |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_lookup_misses_total  | counter   | client registry lookups not found      |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_introductions_total  | counter   | holepunch responses to connect clients |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_not_found_total      | counter   | not found responses to connect clients |
+    +--------------------------------+-----------+----------------------------------------+
+    | holepunch_introduction_seconds | histogram | connect request to holepunch response  |
+    +--------------------------------+-----------+----------------------------------------+
+
+Example:
+    Server::
+
+        $ python -m holepunch server --metrics
+        $ curl http://127.0.0.1:20090/metrics
+"""
+
+
+import bisect
+import logging
+import socket
+
+import holepunch.config
+import holepunch.loop
+import holepunch.tuning
+
+
+METHODS = {">": "connect", "<": "listen", ".": "close"}
+
+
+class Counter:
+    """Monotonic counter.
+
+    Attributes:
+        _name: Metric name.
+        _help: Metric description.
+        _labels: Label names to values.
+        _value: Counter value.
+    """
+
+    type = "counter"
+
+    @property
+    def name(self):
+        """Name accessor."""
+        return self._name
+
+    @property
+    def help(self):
+        """Help accessor."""
+        return self._help
+
+    @property
+    def value(self):
+        """Value accessor."""
+        return self._value
+
+    def __init__(self, name, help, labels=None):
+        """Initialise counter.
+
+        Args:
+            name: Metric name.
+            help: Metric description.
+            labels: Label names to values or None.
+        """
+
+        self._name = name
+        self._help = help
+        self._labels = labels or {}
+        self._value = 0
+
+    def inc(self, amount=1):
+        """Increment counter.
+
+        Args:
+            amount: Non negative increment.
+        """
+
+        self._value += amount
+
+    def samples(self):
+        """Get samples of metric.
+
+        Returns:
+            samples: List of sample name, labels and value tuples.
+        """
+
+        return [(self._name, self._labels, self.value)]
+
+
+class Gauge(Counter):
+    """Gauge set by the server or read from a callable on scrape.
+
+    Attributes:
+        _func: Callable returning the gauge value or None.
+    """
+
+    type = "gauge"
+
+    @property
+    def value(self):
+        """Value accessor."""
+        return self._value if self._func is None else self._func()
+
+    def __init__(self, name, help, labels=None, func=None):
+        """Initialise gauge.
+
+        Args:
+            name: Metric name.
+            help: Metric description.
+            labels: Label names to values or None.
+            func: Callable returning the gauge value or None.
+        """
+
+        super().__init__(name, help, labels)
+
+        self._func = func
+
+    def dec(self, amount=1):
+        """Decrement gauge.
+
+        Args:
+            amount: Decrement.
+        """
+
+        self._value -= amount
+
+    def set(self, value):
+        """Set gauge.
+
+        Args:
+            value: Gauge value.
+        """
+
+        self._value = value
+
+
+class Histogram(Counter):
+    """Histogram of observations in fixed buckets.
+
+    Attributes:
+        _bounds: Sorted bucket upper bounds.
+        _counts: Observations by bucket, the last bucket is +Inf.
+        _sum: Sum of observations.
+    """
+
+    type = "histogram"
+
+    @property
+    def count(self):
+        """Count accessor."""
+        return self._value
+
+    @property
+    def sum(self):
+        """Sum accessor."""
+        return self._sum
+
+    def __init__(self, name, help, labels=None, buckets=None):
+        """Initialise histogram.
+
+        Args:
+            name: Metric name.
+            help: Metric description.
+            labels: Label names to values or None.
+            buckets: Bucket upper bounds. If buckets is None then the buckets
+            configured in the config file are used.
+        """
+
+        super().__init__(name, help, labels)
+
+        self._bounds = tuple(sorted(holepunch.config.METRICS_BUCKETS if buckets is None else buckets))
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0
+
+    def observe(self, value):
+        """Observe value.
+
+        Args:
+            value: Observed value.
+        """
+
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._value += 1
+
+    def samples(self):
+        """Get samples of metric.
+
+        Returns:
+            samples: List of sample name, labels and value tuples, cumulative
+            buckets followed by sum and count.
+        """
+
+        samples = []
+        count = 0
+
+        for bound, n in zip(self._bounds + (float("inf"),), self._counts):
+            count += n
+            labels = dict(self._labels, le="+Inf" if bound == float("inf") else repr(bound))
+            samples.append((self._name + "_bucket", labels, count))
+
+        samples.append((self._name + "_sum", self._labels, self._sum))
+        samples.append((self._name + "_count", self._labels, self._value))
+
+        return samples
+
+
+class Registry:
+    """Registry of metrics rendered together.
+
+    Attributes:
+        _metrics: Registered metrics in order, metrics of the same name differ
+            by their labels.
+    """
+
+    def __init__(self):
+        """Initialise registry."""
+
+        self._metrics = []
+
+    def __iter__(self):
+        """__iter__ overload."""
+        return iter(self._metrics)
+
+    def add(self, metric):
+        """Register metric.
+
+        Args:
+            metric: Counter, gauge or histogram.
+
+        Returns:
+            metric: Registered metric.
+        """
+
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Render metrics in Prometheus text exposition format.
+
+        Returns:
+            text: Metrics text.
+        """
+
+        lines = []
+        names = set()
+
+        for metric in sorted(self._metrics, key=lambda metric: metric.name):
+            if metric.name not in names:
+                names.add(metric.name)
+                lines.append("# HELP {0} {1}".format(metric.name, metric.help))
+                lines.append("# TYPE {0} {1}".format(metric.name, metric.type))
+
+            for name, labels, value in metric.samples():
+                if labels:
+                    name += "{" + ",".join('{0}="{1}"'.format(k, v) for k, v in labels.items()) + "}"
+                lines.append("{0} {1}".format(name, value))
+
+        return "\n".join(lines) + "\n"
+
+
+class ServerMetrics(Registry):
+    """Metrics of a holepunch server.
+
+    Attributes:
+        _accepted: Server-client connections accepted.
+        _clients: Clients and peers in client registry.
+        _listening: Listening clients and peers parked.
+        _requests: Requests handled by method.
+        _request_seconds: Request handling time by method.
+        _lookups: Client registry lookups.
+        _misses: Client registry lookups not found.
+        _introductions: Holepunch responses to connect clients.
+        _not_found: Not found responses to connect clients.
+        _introduction_seconds: Connect request to holepunch response time.
+    """
+
+    @property
+    def accepted(self):
+        """Accepted accessor."""
+        return self._accepted
+
+    @property
+    def listening(self):
+        """Listening accessor."""
+        return self._listening
+
+    @property
+    def lookups(self):
+        """Lookups accessor."""
+        return self._lookups
+
+    @property
+    def misses(self):
+        """Misses accessor."""
+        return self._misses
+
+    @property
+    def introductions(self):
+        """Introductions accessor."""
+        return self._introductions
+
+    @property
+    def not_found(self):
+        """Not found accessor."""
+        return self._not_found
+
+    @property
+    def introduction_seconds(self):
+        """Introduction seconds accessor."""
+        return self._introduction_seconds
+
+    def __init__(self, server):
+        """Initialise server metrics.
+
+        Args:
+            server: Holepunch server.
+        """
+
+        super().__init__()
+
+        self._accepted = self.add(Counter("holepunch_accepted_total", "Server-client connections accepted."))
+        self._clients = self.add(Gauge("holepunch_clients", "Clients and peers in client registry.", func=lambda: len(server.registry)))
+        self._listening = self.add(Gauge("holepunch_listening", "Listening clients and peers parked."))
+        self._requests = {}
+        self._request_seconds = {}
+        for method, name in METHODS.items():
+            self._requests[method] = self.add(Counter("holepunch_requests_total", "Requests handled by method.", {"method": name}))
+            self._request_seconds[method] = self.add(Histogram("holepunch_request_seconds", "Request handling time by method.", {"method": name}))
+        self._lookups = self.add(Counter("holepunch_lookups_total", "Client registry lookups."))
+        self._misses = self.add(Counter("holepunch_lookup_misses_total", "Client registry lookups not found."))
+        self._introductions = self.add(Counter("holepunch_introductions_total", "Holepunch responses to connect clients."))
+        self._not_found = self.add(Counter("holepunch_not_found_total", "Not found responses to connect clients."))
+        self._introduction_seconds = self.add(Histogram("holepunch_introduction_seconds", "Connect request to holepunch response time."))
+
+    def request(self, method, seconds):
+        """Account handled request.
+
+        Args:
+            method: Request method.
+            seconds: Request handling time.
+        """
+
+        if method in self._requests:
+            self._requests[method].inc()
+            self._request_seconds[method].observe(seconds)
+
+    def introduce(self, seconds):
+        """Account holepunch response sent to a connect client.
+
+        Args:
+            seconds: Time since connect request was received.
+        """
+
+        self._introductions.inc()
+        self._introduction_seconds.observe(seconds)
+
+
+class Exporter:
+    """HTTP exporter of a metrics registry.
+
+    Attributes:
+        _registry: Metrics registry.
+        _loop: Event loop.
+        _sock: Exporter listening socket.
+        _addr: Exporter host and port address tuple.
+        _scrapes: Open scrape connections.
+        _backoff: Accept backoff timer or None if accepting.
+    """
+
+    @property
+    def addr(self):
+        """Addr accessor."""
+        return self._addr
+
+    @property
+    def registry(self):
+        """Registry accessor."""
+        return self._registry
+
+    @property
+    def loop(self):
+        """Loop accessor."""
+        return self._loop
+
+    def __init__(self, registry, loop, addr=None):
+        """Initialise exporter.
+
+        Args:
+            registry: Metrics registry.
+            loop: Event loop.
+            addr: Exporter host and port address tuple. If addr is None then
+            the host and port configured in the config file are used.
+        """
+
+        self._registry = registry
+        self._loop = loop
+        self._sock = None
+        self._addr = (holepunch.config.METRICS_HOST, holepunch.config.METRICS_PORT) if addr is None else addr
+        self._scrapes = set()
+        self._backoff = None
+
+    def fileno(self):
+        """Get exporter socket file descriptor.
+
+        Returns:
+            file_descriptor: Exporter socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def open(self):
+        """Open exporter listening socket.
+
+        Bind on exporter address and register exporter in event loop.
+        """
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(self._addr)
+        holepunch.tuning.PROFILE.listen(self._sock)
+        self._sock.setblocking(False)
+
+        self._loop.register(self, holepunch.loop.EVENT_READ, self.accept)
+
+        logging.info("Open metrics socket %s", self._sock)
+
+    def close(self):
+        """Close exporter listening socket and scrape connections."""
+
+        for scrape in list(self._scrapes):
+            scrape.close()
+
+        if self._backoff is not None:
+            self._backoff.cancel()
+            self._backoff = None
+        else:
+            self._loop.unregister(self)
+
+        self._sock.close()
+
+        logging.info("Close metrics socket %s", self._sock)
+
+    def accept(self, events=holepunch.loop.EVENT_READ):
+        """Accept scrape connections.
+
+        A connection aborted before it is accepted is skipped. Once file
+        descriptors or memory run out the exporter stops accepting (see pause).
+
+        Args:
+            events: Ready events mask.
+        """
+
+        while True:
+            try:
+                sock, addr = self._sock.accept()
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno in holepunch.loop.EXHAUSTED:
+                    logging.warning("Accept metrics scrape failed: %s", e)
+                    self.pause()
+                    break
+
+                logging.info("Accept metrics scrape failed: %s", e)
+                continue
+
+            scrape = Scrape(self, sock)
+            self._scrapes.add(scrape)
+            scrape.open()
+
+    def pause(self):
+        """Stop accepting scrape connections.
+
+        Unregister exporter from event loop until a scrape is closed or the
+        accept backoff configured in the config file elapses.
+        """
+
+        if self._backoff is not None: # Paused
+            return
+
+        self._loop.unregister(self)
+        self._backoff = self._loop.call_later(holepunch.config.ACCEPT_BACKOFF, self.resume)
+
+    def resume(self):
+        """Resume accepting scrape connections."""
+
+        if self._backoff is None: # Accepting
+            return
+
+        self._backoff.cancel()
+        self._backoff = None
+
+        self._loop.register(self, holepunch.loop.EVENT_READ, self.accept)
+
+    def remove(self, scrape):
+        """Remove closed scrape connection.
+
+        Args:
+            scrape: Closed scrape connection.
+        """
+
+        self._scrapes.discard(scrape)
+
+        # Accept again once a file descriptor is freed
+        self.resume()
+
+
+class Scrape:
+    """HTTP connection of a scrape, answered once and closed.
+
+    Attributes:
+        _exporter: Exporter.
+        _sock: Exporter-scraper socket.
+        _rbuf: Request bytes received.
+        _wbuf: Response bytes not yet sent.
+        _timer: Expiry timer.
+    """
+
+    def __init__(self, exporter, sock):
+        """Initialise scrape.
+
+        Args:
+            exporter: Exporter.
+            sock: Exporter-scraper socket.
+        """
+
+        self._exporter = exporter
+        self._sock = sock
+        self._rbuf = b""
+        self._wbuf = None
+        self._timer = None
+
+    def open(self):
+        """Open scrape.
+
+        Register socket in event loop and schedule expiry.
+        """
+
+        self._sock.setblocking(False)
+        self._exporter.loop.register(self._sock, holepunch.loop.EVENT_READ, self.handle)
+        self._timer = self._exporter.loop.call_later(holepunch.config.METRICS_TIMEOUT, self.close)
+
+    def close(self):
+        """Close scrape."""
+
+        self._timer.cancel()
+        self._exporter.loop.unregister(self._sock)
+        self._sock.close()
+        self._exporter.remove(self)
+
+    def respond(self):
+        """Prepare response to received request."""
+
+        line = self._rbuf.split(b"\r\n", 1)[0].split(b" ")
+
+        if len(line) < 2 or line[0] != b"GET":
+            status, body = "405 Method Not Allowed", ""
+        elif line[1].split(b"?", 1)[0] != b"/metrics":
+            status, body = "404 Not Found", ""
+        else:
+            status, body = "200 OK", self._exporter.registry.render()
+
+        body = body.encode("utf-8")
+        head = "HTTP/1.0 {0}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {1}\r\nConnection: close\r\n\r\n".format(status, len(body))
+
+        self._wbuf = memoryview(head.encode("ascii") + body)
+        self._exporter.loop.modify(self._sock, holepunch.loop.EVENT_WRITE, self.handle)
+
+    def handle(self, events=holepunch.loop.EVENT_READ):
+        """Handle exporter-scraper socket file descriptor.
+
+        Receive request head until its blank line, then send response and
+        close.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        try:
+            if self._wbuf is None:
+                data = self._sock.recv(holepunch.config.RECV_BUFFER_SIZE)
+                if not data: # Socket closed
+                    self.close()
+                    return
+
+                self._rbuf += data
+
+                if b"\r\n\r\n" in self._rbuf:
+                    self.respond()
+                elif len(self._rbuf) > holepunch.config.RECV_BUFFER_SIZE * 8: # Request head too large
+                    self.close()
+                return
+
+            size = self._sock.send(self._wbuf)
+            self._wbuf = self._wbuf[size:]
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close()
+            return
+
+        if not self._wbuf:
+            self.close()
@@ -0,0 +1,463 @@
+"""Stream multiplexer over one client-client P2P stream socket.
+
+Multiplexer opens many independent streams over the socket of a punched TCP
+client, so a new stream costs one frame instead of a new introduction. Every
+mux frame is a length-prefixed frame (see holepunch.buffer) holding a type, a
+stream id and data. Streams opened by the connecting client have odd ids and
+streams opened by the listening client even ids, so both peers may open
+streams at once.
+
+Each stream is flow-controlled: a sender sends at most the window of data the
+receiver granted and the receiver grants more once its application consumed
+half a window, so a slow stream neither blocks others nor grows buffers
+without bound.
+
+Mux frame:
+
+    +----------+----------+----------+-----------------------------------+
+    | length   | type     | id       | data                              |
+    +==========+==========+==========+===================================+
+    | 4 bytes  | 1 byte   | 4 bytes  | length - 5 bytes                  |
+    +----------+----------+----------+-----------------------------------+
+
+Types:
+
+    +----------+---------------------------------------------------------+
+    | Type     | Description                                             |
+    +==========+=========================================================+
+    | OPEN     | stream opened                                           |
+    +----------+---------------------------------------------------------+
+    | DATA     | stream data                                             |
+    +----------+---------------------------------------------------------+
+    | WINDOW   | window increment, data is a 4 bytes increment           |
+    +----------+---------------------------------------------------------+
+    | CLOSE    | stream closed for sending                               |
+    +----------+---------------------------------------------------------+
+
+Example:
+    Connecting client::
+
+        client = holepunch.client.TCPClient()
+        client.open(dest_host)
+        mux = holepunch.mux.Mux(client, initiator=True)
+        stream = mux.open()
+        stream.send(b"hello")
+
+    Listening client::
+
+        client = holepunch.client.TCPClient()
+        client.open()
+        mux = holepunch.mux.Mux(client, initiator=False)
+        stream = mux.accept()
+        data = stream.recv()
+"""
+
+
+import collections
+import logging
+import struct
+
+import holepunch.buffer
+import holepunch.config
+import holepunch.loop
+
+
+OPEN = 0
+DATA = 1
+WINDOW = 2
+CLOSE = 3
+
+HEADER = struct.Struct("!BI")
+INCREMENT = struct.Struct("!I")
+
+
+class Stream:
+    """Multiplexed stream.
+
+    Attributes:
+        _mux: Multiplexer.
+        _id: Stream id.
+        _credit: Bytes the peer granted to send.
+        _chunks: Received data not yet read.
+        _buffered: Bytes of received data not yet read.
+        _consumed: Bytes read and not yet granted back to the peer.
+        _closed: True if stream is closed for sending.
+        _eof: True if peer closed stream for sending.
+    """
+
+    @property
+    def id(self):
+        """Id accessor."""
+        return self._id
+
+    @property
+    def closed(self):
+        """Closed accessor."""
+        return self._closed
+
+    @property
+    def eof(self):
+        """Eof accessor."""
+        return self._eof
+
+    def __init__(self, mux, id):
+        """Initialise stream.
+
+        Args:
+            mux: Multiplexer.
+            id: Stream id.
+        """
+
+        self._mux = mux
+        self._id = id
+        self._credit = holepunch.config.MUX_WINDOW
+        self._chunks = collections.deque()
+        self._buffered = 0
+        self._consumed = 0
+        self._closed = False
+        self._eof = False
+
+    def send(self, data):
+        """Send data on stream.
+
+        Send data in frames of at most the peer granted window, blocking while
+        the window is exhausted.
+
+        Args:
+            data: Bytes-like object.
+
+        Raises:
+            ConnectionError: If stream or multiplexer is closed.
+        """
+
+        view = memoryview(data).cast("B")
+
+        while view:
+            while not self._credit:
+                if self._closed or self._mux.closed:
+                    raise ConnectionError("Stream closed")
+
+                self._mux.poll()
+
+            if self._closed or self._mux.closed:
+                raise ConnectionError("Stream closed")
+
+            size = min(len(view), self._credit, holepunch.config.MUX_FRAME)
+            self._credit -= size
+
+            self._mux.write(DATA, self._id, view[:size])
+            view = view[size:]
+
+    def recv(self):
+        """Receive data from stream.
+
+        Block until data is received, then return the oldest received chunk.
+
+        Returns:
+            data: Data received, empty on end of stream.
+        """
+
+        while not self._chunks and not self._eof and not self._mux.closed:
+            self._mux.poll()
+
+        if not self._chunks:
+            return b""
+
+        data = self._chunks.popleft()
+        self._buffered -= len(data)
+        self._consumed += len(data)
+
+        # Grant peer the consumed window once half of it is consumed
+        if self._consumed >= holepunch.config.MUX_WINDOW // 2 and not self._eof:
+            self._mux.write(WINDOW, self._id, INCREMENT.pack(self._consumed))
+            self._consumed = 0
+
+        return data
+
+    def close(self):
+        """Close stream for sending."""
+
+        if self._closed: # Stream closed
+            return
+
+        self._closed = True
+
+        if not self._mux.closed:
+            self._mux.write(CLOSE, self._id)
+
+        self._mux.release(self)
+
+    def reset(self):
+        """Reset stream on a malformed frame of peer.
+
+        End stream and close it for sending. Data received and not yet read
+        can still be read.
+        """
+
+        self._eof = True
+        self.close()
+
+    def handle(self, type, data):
+        """Handle frame received for stream.
+
+        Args:
+            type: Frame type.
+            data: Memoryview of frame data.
+
+        Raises:
+            ConnectionError: If peer exceeds the stream window.
+            struct.error: If window increment is malformed.
+        """
+
+        if type == DATA:
+            self._buffered += len(data)
+            if self._buffered > holepunch.config.MUX_WINDOW:
+                raise ConnectionError("Stream {0} window exceeded".format(self._id))
+
+            self._chunks.append(bytes(data))
+        elif type == WINDOW:
+            self._credit += INCREMENT.unpack(data)[0]
+        elif type == CLOSE:
+            self._eof = True
+            self._mux.release(self)
+
+
+class Mux:
+    """Stream multiplexer.
+
+    Stream multiplexer owning the client-client socket of a client. The socket
+    is made non-blocking and driven by the multiplexer event loop whenever a
+    stream waits; the client must not send or receive on it directly.
+
+    Attributes:
+        _client: Client of multiplexed socket.
+        _loop: Event loop.
+        _next: Id of next stream opened.
+        _streams: Streams by id.
+        _accepted: Streams opened by peer and not yet accepted.
+        _frames: Incremental frame reader.
+        _wbuf: Outbound data not yet sent.
+        _closed: True if multiplexer is closed.
+    """
+
+    @property
+    def closed(self):
+        """Closed accessor."""
+        return self._closed
+
+    @property
+    def streams(self):
+        """Streams accessor."""
+        return list(self._streams.values())
+
+    def __init__(self, client, initiator):
+        """Initialise multiplexer.
+
+        Args:
+            client: Client with an open client-client stream socket.
+            initiator: True on the connecting client, False on the listening
+            client.
+        """
+
+        self._client = client
+        self._loop = holepunch.loop.Loop()
+        self._next = 1 if initiator else 2
+        self._streams = {}
+        self._accepted = collections.deque()
+        self._frames = holepunch.buffer.FrameReader()
+        self._wbuf = bytearray()
+        self._closed = False
+
+        self._client.sock.setblocking(False)
+        self._loop.register(self._client.sock, holepunch.loop.EVENT_READ, self.handle)
+
+    def open(self):
+        """Open stream.
+
+        Returns:
+            stream: Stream opened.
+
+        Raises:
+            ConnectionError: If multiplexer is closed.
+        """
+
+        if self._closed:
+            raise ConnectionError("Multiplexer closed")
+
+        stream = Stream(self, self._next)
+        self._next += 2
+        self._streams[stream.id] = stream
+
+        self.write(OPEN, stream.id)
+        return stream
+
+    def accept(self, timeout=None):
+        """Accept stream opened by peer.
+
+        Args:
+            timeout: Maximum seconds to wait. If timeout is None then block
+            until a stream is opened or multiplexer is closed.
+
+        Returns:
+            stream: Stream opened by peer or None.
+        """
+
+        while not self._accepted and not self._closed:
+            self.poll(timeout)
+
+            if timeout is not None:
+                break
+
+        return self._accepted.popleft() if self._accepted else None
+
+    def close(self):
+        """Close multiplexer.
+
+        Close every stream, send pending data and close client.
+        """
+
+        if not self._closed:
+            for stream in list(self._streams.values()):
+                stream.close()
+
+            self.shutdown()
+
+            try:
+                self._client.sock.setblocking(True)
+                self._client.sock.sendall(self._wbuf)
+            except OSError as error:
+                logging.info("Multiplexed socket error %s", error)
+
+            self._wbuf.clear()
+
+        self._client.close()
+
+    def shutdown(self):
+        """Shut multiplexer down.
+
+        Stop driving socket and end every stream.
+        """
+
+        self._closed = True
+        self._loop.close()
+
+        for stream in self._streams.values():
+            stream._eof = True
+        self._streams.clear()
+
+    def release(self, stream):
+        """Forget stream closed by both peers.
+
+        Args:
+            stream: Stream.
+        """
+
+        if stream.closed and stream.eof:
+            self._streams.pop(stream.id, None)
+
+    def poll(self, timeout=None):
+        """Drive multiplexed socket once.
+
+        Args:
+            timeout: Maximum seconds to wait. If timeout is None then block
+            until socket is ready.
+        """
+
+        if not self._closed:
+            self._loop.run_once(timeout)
+
+    def write(self, type, id, data=b""):
+        """Write frame.
+
+        Queue frame and send as much outbound data as socket accepts. Block
+        driving socket while outbound data exceeds the high watermark.
+
+        Args:
+            type: Frame type.
+            id: Stream id.
+            data: Bytes-like frame data.
+        """
+
+        self._wbuf += holepunch.buffer.FRAME.pack(HEADER.size + len(data))
+        self._wbuf += HEADER.pack(type, id)
+        self._wbuf += data
+
+        self.flush()
+
+        while len(self._wbuf) > holepunch.config.WRITE_BUFFER_HIGH and not self._closed:
+            self.poll()
+
+    def flush(self):
+        """Send as much outbound data as socket accepts."""
+
+        if self._closed: # Multiplexer closed
+            return
+
+        try:
+            size = self._client.sock.send(self._wbuf)
+        except BlockingIOError:
+            size = 0
+        except OSError as error:
+            logging.info("Multiplexed socket error %s", error)
+            self.shutdown()
+            return
+
+        del self._wbuf[:size]
+
+        events = holepunch.loop.EVENT_READ
+        if self._wbuf:
+            events |= holepunch.loop.EVENT_WRITE
+        self._loop.modify(self._client.sock, events, self.handle)
+
+    def handle(self, events):
+        """Handle multiplexed socket file descriptor.
+
+        Send outbound data when writable and dispatch received frames to their
+        streams when readable. A malformed frame of a stream resets the
+        stream, a frame too short or too large for the mux frame format shuts
+        the multiplexer down.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        if events & holepunch.loop.EVENT_WRITE:
+            self.flush()
+
+        if not events & holepunch.loop.EVENT_READ:
+            return
+
+        try:
+            size = self._frames.recv_into(self._client.sock)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            logging.info("Multiplexed socket error %s", error)
+            size = 0
+
+        if not size: # Socket closed
+            self.shutdown()
+            return
+
+        while True:
+            try:
+                frame = self._frames.frame()
+                if frame is None:
+                    break
+
+                type, id = HEADER.unpack_from(frame)
+            except (ValueError, struct.error) as error:
+                logging.info("Multiplexed socket malformed frame %s", error)
+                self.shutdown()
+                return
+
+            if type == OPEN:
+                stream = Stream(self, id)
+                self._streams[id] = stream
+                self._accepted.append(stream)
+            elif id in self._streams: # Frames of a released stream are dropped
+                try:
+                    self._streams[id].handle(type, frame[HEADER.size:])
+                except (ConnectionError, struct.error) as error:
+                    logging.info("Reset stream %s: %s", id, error)
+                    self._streams[id].reset()
@@ -0,0 +1,201 @@
+"""NAT behaviour classification and port prediction.
+
+Holepunch server observes the external port a NAT mapped for each connection
+or datagram of a client and keeps the last observed ports of each host. The
+mapping behaviour of the host NAT is classified from the deltas between
+consecutive observations:
+
+    +------------+---------------------------------------------------------+
+    | Behaviour  | Description                                             |
+    +============+=========================================================+
+    | UNKNOWN    | less than 2 observations                                |
+    +------------+---------------------------------------------------------+
+    | CONSISTENT | every observation maps the same port                    |
+    +------------+---------------------------------------------------------+
+    | SEQUENTIAL | ports are allocated in a constant direction by small    |
+    |            | steps (symmetric NAT), the smallest step is the delta   |
+    +------------+---------------------------------------------------------+
+    | RANDOM     | ports are preserved or allocated at random              |
+    +------------+---------------------------------------------------------+
+
+Holepunch response carries the delta of the destination host NAT, 0 unless
+SEQUENTIAL. A symmetric NAT maps the punch socket to a new port following the
+observed port, so clients punch the observed port and the ports predicted
+after it in parallel.
+
+Example:
+    Table::
+
+        table = holepunch.nat.Table()
+        table.observe("203.0.113.7", 40001)
+        table.observe("203.0.113.7", 40003)
+        ports = holepunch.nat.predict(40003, table.delta("203.0.113.7"))
+"""
+
+
+import collections
+
+import holepunch.config
+
+
+UNKNOWN = "unknown"
+CONSISTENT = "consistent"
+SEQUENTIAL = "sequential"
+RANDOM = "random"
+
+PORT_MIN = 1
+PORT_MAX = 65535
+
+
+class Classifier:
+    """NAT behaviour classifier of one host.
+
+    Attributes:
+        _ports: Last observed ports, oldest first.
+        _behaviour: Behaviour classified from observed ports.
+        _delta: Port allocation step, 0 unless SEQUENTIAL.
+    """
+
+    @property
+    def ports(self):
+        """Ports accessor."""
+        return list(self._ports)
+
+    @property
+    def behaviour(self):
+        """Behaviour accessor."""
+        return self._behaviour
+
+    @property
+    def delta(self):
+        """Delta accessor."""
+        return self._delta
+
+    def __init__(self, size=None):
+        """Initialise classifier.
+
+        Args:
+            size: Maximum observed ports kept. If size is None then the number
+            of observations configured in the config file is used.
+        """
+
+        size = holepunch.config.NAT_OBSERVATIONS if size is None else size
+
+        self._ports = collections.deque(maxlen=size)
+        self._behaviour = UNKNOWN
+        self._delta = 0
+
+    def observe(self, port):
+        """Observe mapped port and classify behaviour.
+
+        Args:
+            port: External port observed.
+        """
+
+        self._ports.append(port)
+
+        if len(self._ports) < 2:
+            return
+
+        ports = list(self._ports)
+        deltas = [b - a for a, b in zip(ports, ports[1:])]
+
+        if not any(deltas):
+            self._behaviour, self._delta = CONSISTENT, 0
+        elif all(0 < delta <= holepunch.config.NAT_DELTA_MAX for delta in deltas):
+            self._behaviour, self._delta = SEQUENTIAL, min(deltas)
+        elif all(0 < -delta <= holepunch.config.NAT_DELTA_MAX for delta in deltas):
+            self._behaviour, self._delta = SEQUENTIAL, max(deltas)
+        else:
+            self._behaviour, self._delta = RANDOM, 0
+
+
+class Table:
+    """NAT behaviour classifiers by host with least recently used eviction.
+
+    Attributes:
+        _size: Maximum number of hosts.
+        _classifiers: Classifier by host, least recently used first.
+    """
+
+    def __init__(self, size=None):
+        """Initialise table.
+
+        Args:
+            size: Maximum number of hosts. If size is None then the size
+            configured in the config file is used.
+        """
+
+        self._size = holepunch.config.NAT_TABLE_SIZE if size is None else size
+        self._classifiers = collections.OrderedDict()
+
+    def __len__(self):
+        """__len__ overload."""
+        return len(self._classifiers)
+
+    def get(self, host):
+        """Get classifier of host.
+
+        Args:
+            host: Host address.
+
+        Returns:
+            classifier: Classifier or None if host is not observed.
+        """
+
+        return self._classifiers.get(host)
+
+    def observe(self, host, port):
+        """Observe port mapped for host.
+
+        Args:
+            host: Host address.
+            port: External port observed.
+        """
+
+        classifier = self._classifiers.pop(host, None)
+        if classifier is None:
+            classifier = Classifier()
+
+        classifier.observe(port)
+        self._classifiers[host] = classifier
+
+        while len(self._classifiers) > self._size:
+            self._classifiers.popitem(last=False)
+
+    def delta(self, host):
+        """Get port allocation step of host NAT.
+
+        Args:
+            host: Host address.
+
+        Returns:
+            delta: Port allocation step, 0 unless host NAT is SEQUENTIAL.
+        """
+
+        classifier = self._classifiers.get(host)
+        return 0 if classifier is None else classifier.delta
+
+
+def predict(port, delta=0, count=None):
+    """Predict ports a NAT maps for a new socket.
+
+    Args:
+        port: Observed port.
+        delta: Port allocation step of NAT, 0 if ports are not predictable.
+        count: Maximum predicted ports after observed port. If count is None
+        then the number of predicted ports configured in the config file is
+        used.
+
+    Returns:
+        ports: Observed port followed by predicted ports in the valid port
+        range.
+    """
+
+    count = holepunch.config.PUNCH_PREDICT if count is None else count
+
+    if not delta:
+        return [port]
+
+    ports = [port + delta * i for i in range(count + 1)]
+    return [port for port in ports if PORT_MIN <= port <= PORT_MAX]
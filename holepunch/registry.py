@@ -0,0 +1,158 @@
+"""Registry of server-clients indexed for constant time lookup.
+
+Holepunch server keeps every server-client in a registry. Registry maintains
+hash indexes by socket file descriptor, by transport and host and port address
+and of listening clients by host address, so a connect request
+(>dest_host) finds the listening client in constant time regardless of the
+number of clients of its host. Clients without a socket of
+their own (datagram peers sharing the server socket) are not indexed by file
+descriptor. A stream client and a datagram peer may share a host and port
+address, so clients are keyed by transport and address.
+
+Example:
+    Registry::
+
+        registry = holepunch.registry.Registry()
+        registry.add(client)
+        registry.listen(client)
+        registry.find(host="127.0.0.2")
+        registry.find(host="127.0.0.2", port=20001, transport="udp")
+        registry.remove(client)
+"""
+
+
+class Registry:
+    """Server-client registry.
+
+    Server-client registry with hash indexes. Clients are indexed when added and
+    unindexed when removed; a client must be removed before its socket is
+    closed. A client is indexed as listening when added listening or when it
+    starts listening, and unindexed when it stops listening or is removed.
+    Listening clients of the same host are kept in order and lookup by host
+    returns the earliest listening client.
+
+    Attributes:
+        _fds: Clients by socket file descriptor.
+        _addrs: Clients by key, the transport and host and port address tuple.
+        _listeners: Listening clients by host address, each a key to client
+        dict.
+    """
+
+    def __init__(self):
+        """Initialise registry."""
+
+        self._fds = {}
+        self._addrs = {}
+        self._listeners = {}
+
+    def __len__(self):
+        """__len__ overload."""
+        return len(self._addrs)
+
+    def __iter__(self):
+        """__iter__ overload."""
+        return iter(list(self._addrs.values()))
+
+    def __contains__(self, client):
+        """__contains__ overload."""
+        return self._addrs.get((client.transport, client.addr)) is client
+
+    def add(self, client):
+        """Add client to registry.
+
+        Add client to file descriptor and address indexes.
+
+        Args:
+            client: Client with fileno method and addr, transport and
+            listening attributes. Fileno returns None if client has no socket
+            of its own.
+        """
+
+        key = (client.transport, client.addr)
+
+        fd = client.fileno()
+        if fd is not None:
+            self._fds[fd] = client
+        self._addrs[key] = client
+
+        if client.listening:
+            self.listen(client)
+
+    def remove(self, client):
+        """Remove client from registry.
+
+        Remove client from file descriptor, address and listening indexes.
+
+        Args:
+            client: Client with fileno method and addr and transport
+            attributes.
+        """
+
+        key = (client.transport, client.addr)
+
+        fd = client.fileno()
+        if fd is not None:
+            del self._fds[fd]
+        del self._addrs[key]
+
+        self.unlisten(client)
+
+    def listen(self, client):
+        """Index client as listening.
+
+        Indexing a client not in registry has no effect.
+
+        Args:
+            client: Client with addr and transport attributes.
+        """
+
+        if client not in self: # Client removed
+            return
+
+        self._listeners.setdefault(client.addr[0], {})[(client.transport, client.addr)] = client
+
+    def unlisten(self, client):
+        """Unindex client as listening.
+
+        Unindexing a client not listening has no effect.
+
+        Args:
+            client: Client with addr and transport attributes.
+        """
+
+        host = client.addr[0]
+
+        clients = self._listeners.get(host)
+        if clients is None or clients.pop((client.transport, client.addr), None) is None:
+            return
+
+        if not clients:
+            del self._listeners[host]
+
+    def find(self, sock=None, host=None, port=None, transport="tcp"):
+        """Find client in registry.
+
+        Find client by socket, by transport and host and port address or
+        listening client by host address.
+
+        Args:
+            sock: Client socket.
+            host: Client host address.
+            port: Client port address. Port is only used together with host.
+            transport: Client transport ("tcp" or "udp"). Transport is only
+            used together with host and port.
+
+        Returns:
+            client: Client found or None.
+        """
+
+        if sock is not None:
+            return self._fds.get(sock.fileno())
+
+        if host is not None and port is not None:
+            return self._addrs.get((transport, (host, port)))
+
+        if host is not None:
+            return next(iter(self._listeners.get(host, {}).values()), None)
+
+        return None
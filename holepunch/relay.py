@@ -0,0 +1,685 @@
+"""Relay of client-client traffic for clients whose punch failed.
+
+Holepunch server gives both clients of an introduction the same relay token in
+its holepunch (*) response and issues it on the relay. A client whose punch
+fails connects to the relay port of the server and sends the token; once the
+peer sends the same token the relay answers both with a relayed (&) byte and
+forwards every byte between the two connections until both are closed. A
+connection sending a token the relay has not issued, or that has already
+paired or expired, is closed.
+
+Bytes are moved with splice from one socket into a pipe and from the pipe into
+the other socket, so payload never enters the process; where splice is not
+available a buffer per direction is used instead. Relay accounts bytes
+forwarded by each session.
+
+Relay handshake:
+
+    +-------------+-----------+------------------------------------------+
+    | Direction   | Message   | Content                                  |
+    +=============+===========+==========================================+
+    | client      | token     | 8 bytes relay token                      |
+    +-------------+-----------+------------------------------------------+
+    | relay       | relayed   | 1 byte (&), sent once peer is paired     |
+    +-------------+-----------+------------------------------------------+
+
+Example:
+    Server::
+
+        server = holepunch.server.Server(relay=True)
+        server.run()
+"""
+
+
+import fcntl
+import logging
+import os
+import socket
+import struct
+import time
+
+import holepunch.config
+import holepunch.loop
+import holepunch.tuning
+
+
+TOKEN = struct.Struct("!Q")
+
+RELAYED = b"&"
+
+
+class Relay:
+    """Relay listening for clients whose punch failed.
+
+    Attributes:
+        _loop: Event loop.
+        _sock: Relay listening socket.
+        _addr: Relay host and port address tuple.
+        _handshakes: Connections not yet paired.
+        _waiting: Handshake waiting for its peer by token.
+        _sessions: Paired sessions.
+        _bytes: Bytes forwarded by closed sessions.
+        _tokens: Expiry timers of issued tokens not yet paired by token.
+        _backoff: Accept backoff timer or None if accepting.
+    """
+
+    @property
+    def addr(self):
+        """Addr accessor."""
+        return self._addr
+
+    @property
+    def loop(self):
+        """Loop accessor."""
+        return self._loop
+
+    @property
+    def sessions(self):
+        """Sessions accessor."""
+        return list(self._sessions)
+
+    @property
+    def bytes(self):
+        """Bytes accessor, bytes forwarded by all sessions."""
+        return self._bytes + sum(session.bytes for session in self._sessions)
+
+    def __init__(self, loop):
+        """Initialise relay.
+
+        Args:
+            loop: Event loop.
+        """
+
+        self._loop = loop
+        self._sock = None
+        self._addr = (holepunch.config.SERVER_HOST, holepunch.config.RELAY_PORT)
+        self._handshakes = set()
+        self._waiting = {}
+        self._sessions = set()
+        self._bytes = 0
+        self._tokens = {}
+        self._backoff = None
+
+    def fileno(self):
+        """Get relay socket file descriptor.
+
+        Returns:
+            file_descriptor: Relay socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def open(self):
+        """Open relay listening socket.
+
+        Bind on host and relay port as configured in the config file and
+        register relay in event loop.
+        """
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(self._addr)
+        holepunch.tuning.PROFILE.listen(self._sock)
+        self._sock.setblocking(False)
+
+        self._loop.register(self, holepunch.loop.EVENT_READ, self.accept)
+
+        logging.info("Open relay socket %s", self._sock)
+
+    def close(self):
+        """Close relay listening socket, handshakes and sessions."""
+
+        for handshake in list(self._handshakes):
+            handshake.close()
+
+        for session in list(self._sessions):
+            session.close()
+
+        for timer in self._tokens.values():
+            timer.cancel()
+        self._tokens.clear()
+
+        if self._backoff is not None:
+            self._backoff.cancel()
+            self._backoff = None
+        else:
+            self._loop.unregister(self)
+
+        self._sock.close()
+
+        logging.info("Close relay socket %s", self._sock)
+
+    def detach(self):
+        """Close relay sockets inherited by a forked process.
+
+        Close every socket and pipe without unregistering them, so the event
+        loop of the parent process keeps relaying.
+        """
+
+        for handshake in self._handshakes:
+            handshake.sock.close()
+
+        for session in self._sessions:
+            session.detach()
+
+        self._sock.close()
+
+    def accept(self, events=holepunch.loop.EVENT_READ):
+        """Accept relay connections.
+
+        A connection aborted before it is accepted is skipped. Once file
+        descriptors or memory run out the relay stops accepting (see pause).
+
+        Args:
+            events: Ready events mask.
+        """
+
+        while True:
+            try:
+                sock, addr = self._sock.accept()
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno in holepunch.loop.EXHAUSTED:
+                    logging.warning("Accept relay-client failed: %s", e)
+                    self.pause()
+                    break
+
+                logging.info("Accept relay-client failed: %s", e)
+                continue
+
+            handshake = Handshake(self, sock, addr)
+            self._handshakes.add(handshake)
+            handshake.open()
+
+    def pause(self):
+        """Stop accepting relay connections.
+
+        Unregister relay from event loop until a handshake or session is
+        closed, freeing file descriptors, or the accept backoff configured in
+        the config file elapses.
+        """
+
+        if self._backoff is not None: # Paused
+            return
+
+        self._loop.unregister(self)
+        self._backoff = self._loop.call_later(holepunch.config.ACCEPT_BACKOFF, self.resume)
+
+    def resume(self):
+        """Resume accepting relay connections."""
+
+        if self._backoff is None: # Accepting
+            return
+
+        self._backoff.cancel()
+        self._backoff = None
+
+        self._loop.register(self, holepunch.loop.EVENT_READ, self.accept)
+
+    def issue(self, token):
+        """Issue relay token of an introduction.
+
+        Token pairs two connections once, until the relay token TTL configured
+        in the config file elapses.
+
+        Args:
+            token: Relay token.
+        """
+
+        if token in self._tokens: # Token issued
+            return
+
+        self._tokens[token] = self._loop.call_later(holepunch.config.RELAY_TOKEN_TTL, lambda: self.revoke(token))
+
+    def revoke(self, token):
+        """Revoke relay token once paired or expired.
+
+        Args:
+            token: Relay token.
+        """
+
+        timer = self._tokens.pop(token, None)
+
+        if timer is not None:
+            timer.cancel()
+
+    def pair(self, handshake):
+        """Pair handshake with the handshake waiting with the same token.
+
+        Handshake of a token not issued is closed.
+
+        Args:
+            handshake: Handshake which received its token.
+        """
+
+        if handshake.token not in self._tokens: # Token not issued or used
+            logging.info("Relay token %016x unknown", handshake.token)
+            handshake.close()
+            return
+
+        peer = self._waiting.pop(handshake.token, None)
+
+        if peer is None:
+            self._waiting[handshake.token] = handshake
+            return
+
+        self.revoke(handshake.token)
+
+        self._handshakes.discard(peer)
+        self._handshakes.discard(handshake)
+
+        session = Session(self, peer.release(), handshake.release())
+        self._sessions.add(session)
+        session.open()
+
+    def remove(self, handshake=None, session=None):
+        """Remove closed handshake or session.
+
+        Args:
+            handshake: Closed handshake.
+            session: Closed session, its bytes are accounted.
+        """
+
+        if handshake is not None:
+            self._handshakes.discard(handshake)
+            if self._waiting.get(handshake.token) is handshake:
+                del self._waiting[handshake.token]
+
+        if session is not None and session in self._sessions:
+            self._sessions.remove(session)
+            self._bytes += session.bytes
+
+        # Accept again once file descriptors are freed
+        self.resume()
+
+
+class Handshake:
+    """Relay connection waiting for its token and its peer.
+
+    Attributes:
+        _relay: Relay.
+        _sock: Relay-client socket.
+        _addr: Client host and port address tuple.
+        _buf: Token bytes received.
+        _token: Relay token or None until received.
+        _timer: Expiry timer.
+    """
+
+    @property
+    def sock(self):
+        """Sock accessor."""
+        return self._sock
+
+    @property
+    def token(self):
+        """Token accessor."""
+        return self._token
+
+    def __init__(self, relay, sock, addr):
+        """Initialise handshake.
+
+        Args:
+            relay: Relay.
+            sock: Relay-client socket.
+            addr: Client host and port address tuple.
+        """
+
+        self._relay = relay
+        self._sock = sock
+        self._addr = addr
+        self._buf = b""
+        self._token = None
+        self._timer = None
+
+    def open(self):
+        """Open handshake.
+
+        Register socket in event loop and schedule expiry.
+        """
+
+        self._sock.setblocking(False)
+        self._relay.loop.register(self._sock, holepunch.loop.EVENT_READ, self.handle)
+        self._timer = self._relay.loop.call_later(holepunch.config.RELAY_TIMEOUT, self.expire)
+
+    def release(self):
+        """Release paired socket.
+
+        Returns:
+            sock: Relay-client socket.
+        """
+
+        self._timer.cancel()
+        self._relay.loop.unregister(self._sock)
+
+        return self._sock
+
+    def close(self):
+        """Close handshake."""
+
+        self.release()
+        self._sock.close()
+        self._relay.remove(handshake=self)
+
+    def expire(self):
+        """Close handshake once relay timeout elapsed."""
+
+        logging.info("Relay %s timed out", self._addr)
+
+        self.close()
+
+    def handle(self, events=holepunch.loop.EVENT_READ):
+        """Handle relay-client socket file descriptor.
+
+        Receive token, then pair with peer. Data sent before the relayed (&)
+        byte is a protocol error.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        try:
+            data = self._sock.recv(TOKEN.size - len(self._buf))
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data or self._token is not None: # Socket closed or protocol error
+            self.close()
+            return
+
+        self._buf += data
+
+        if len(self._buf) == TOKEN.size:
+            self._token, = TOKEN.unpack(self._buf)
+            self._relay.pair(self)
+
+
+class Session:
+    """Relay session forwarding between two paired connections.
+
+    Attributes:
+        _relay: Relay.
+        _socks: The two relay-client sockets.
+        _forwards: Forward reading each socket.
+        _events: Events registered by socket.
+        _start: Session start clock time.
+        _closed: True once closed.
+    """
+
+    @property
+    def bytes(self):
+        """Bytes accessor, bytes forwarded in both directions."""
+        return sum(forward.bytes for forward in self._forwards.values())
+
+    @property
+    def elapsed(self):
+        """Elapsed accessor, seconds since session start."""
+        return time.monotonic() - self._start
+
+    def __init__(self, relay, left, right):
+        """Initialise session.
+
+        Args:
+            relay: Relay.
+            left: Relay-client socket.
+            right: Relay-client socket of peer.
+        """
+
+        self._relay = relay
+        self._socks = (left, right)
+        self._forwards = {left: Forward(left, right), right: Forward(right, left)}
+        self._events = {}
+        self._start = time.monotonic()
+        self._closed = False
+
+    def open(self):
+        """Open session.
+
+        Send relayed (&) byte to both clients and start forwarding.
+        """
+
+        try:
+            for sock in self._socks:
+                sock.send(RELAYED)
+        except OSError as e:
+            logging.info("Relay session failed: %s", e)
+            self.close()
+            return
+
+        self.update()
+
+        logging.info("Open relay session %s", self._socks)
+
+    def close(self):
+        """Close session and account its bytes."""
+
+        if self._closed: # Session closed
+            return
+
+        self._closed = True
+
+        for sock in self._socks:
+            if self._events.get(sock):
+                self._relay.loop.unregister(sock)
+            sock.close()
+
+        for forward in self._forwards.values():
+            forward.close()
+
+        self._relay.remove(session=self)
+
+        elapsed = self.elapsed
+        logging.info("Close relay session %d bytes in %.3f s (%.0f bytes/s)", self.bytes, elapsed, self.bytes / elapsed if elapsed else 0)
+
+    def detach(self):
+        """Close sockets and pipes inherited by a forked process."""
+
+        for sock in self._socks:
+            sock.close()
+
+        for forward in self._forwards.values():
+            forward.close()
+
+    def update(self):
+        """Register each socket for the events its forwards wait for.
+
+        Close session once both directions are done.
+        """
+
+        if all(forward.done for forward in self._forwards.values()):
+            self.close()
+            return
+
+        for sock in self._socks:
+            peer = self._socks[1] if sock is self._socks[0] else self._socks[0]
+
+            events = 0
+            if self._forwards[sock].readable:
+                events |= holepunch.loop.EVENT_READ
+            if self._forwards[peer].writable:
+                events |= holepunch.loop.EVENT_WRITE
+
+            current = self._events.get(sock, 0)
+
+            if events == current:
+                continue
+
+            if not current:
+                self._relay.loop.register(sock, events, lambda events, sock=sock: self.handle(sock, events))
+            elif not events:
+                self._relay.loop.unregister(sock)
+            else:
+                self._relay.loop.modify(sock, events, lambda events, sock=sock: self.handle(sock, events))
+
+            self._events[sock] = events
+
+    def handle(self, sock, events):
+        """Handle relay-client socket file descriptor.
+
+        Read socket into its forward when readable and write the forward of
+        its peer into it when writable.
+
+        Args:
+            sock: Relay-client socket.
+            events: Ready events mask.
+        """
+
+        peer = self._socks[1] if sock is self._socks[0] else self._socks[0]
+
+        try:
+            if events & holepunch.loop.EVENT_READ:
+                self._forwards[sock].fill()
+                self._forwards[sock].drain()
+
+            if events & holepunch.loop.EVENT_WRITE:
+                self._forwards[peer].drain()
+        except OSError as e:
+            logging.info("Relay session failed: %s", e)
+            self.close()
+            return
+
+        self.update()
+
+
+class Forward:
+    """One direction of a relay session.
+
+    Forward moves bytes from source socket to destination socket through a
+    pipe with splice, or through a buffer where splice is not available. Once
+    source is closed and every byte is forwarded destination is shut down for
+    writing.
+
+    Attributes:
+        _src: Source socket.
+        _dst: Destination socket.
+        _size: Maximum bytes read not yet written, the pipe size if piped.
+        _pipe: Pipe read and write file descriptors or None.
+        _buf: Buffer or None if piped.
+        _start: Offset of buffered bytes not yet written.
+        _pending: Bytes read not yet written.
+        _bytes: Bytes forwarded.
+        _eof: True once source is closed.
+        _done: True once destination is shut down.
+    """
+
+    @property
+    def bytes(self):
+        """Bytes accessor."""
+        return self._bytes
+
+    @property
+    def readable(self):
+        """Readable accessor, True if source may be read."""
+        return not self._eof and self._start + self._pending < self._size
+
+    @property
+    def writable(self):
+        """Writable accessor, True if destination must be written."""
+        return self._pending > 0
+
+    @property
+    def done(self):
+        """Done accessor."""
+        return self._done
+
+    def __init__(self, src, dst):
+        """Initialise forward.
+
+        Args:
+            src: Source socket.
+            dst: Destination socket.
+        """
+
+        self._src = src
+        self._dst = dst
+        self._size = holepunch.config.RELAY_PIPE_SIZE
+        self._pipe = None
+        self._buf = None
+        self._start = 0
+        self._pending = 0
+        self._bytes = 0
+        self._eof = False
+        self._done = False
+
+        self._src.setblocking(False)
+        self._dst.setblocking(False)
+
+        if hasattr(os, "splice"):
+            self._pipe = os.pipe()
+
+            try:
+                self._size = fcntl.fcntl(self._pipe[1], fcntl.F_SETPIPE_SZ, holepunch.config.RELAY_PIPE_SIZE)
+            except OSError: # Pipe keeps its default size
+                self._size = fcntl.fcntl(self._pipe[1], fcntl.F_GETPIPE_SZ)
+        else:
+            self._buf = memoryview(bytearray(self._size))
+
+    def close(self):
+        """Close pipe."""
+
+        if self._pipe is not None:
+            os.close(self._pipe[0])
+            os.close(self._pipe[1])
+            self._pipe = None
+
+    def fill(self):
+        """Read source into pipe or buffer.
+
+        Raises:
+            OSError: If source fails.
+        """
+
+        room = self._size - self._start - self._pending
+        if not room: # Pipe or buffer full
+            return
+
+        try:
+            if self._pipe is not None:
+                size = os.splice(self._src.fileno(), self._pipe[1], room, flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            else:
+                end = self._start + self._pending
+                size = self._src.recv_into(self._buf[end:end + room])
+        except BlockingIOError:
+            return
+
+        if not size: # Source closed
+            self._eof = True
+            self.drain()
+
+        self._pending += size
+
+    def drain(self):
+        """Write pipe or buffer into destination.
+
+        Shut destination down for writing once source is closed and every
+        byte is written.
+
+        Raises:
+            OSError: If destination fails.
+        """
+
+        if self._pending:
+            try:
+                if self._pipe is not None:
+                    size = os.splice(self._pipe[0], self._dst.fileno(), self._pending, flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+                else:
+                    size = self._dst.send(self._buf[self._start:self._start + self._pending])
+                    self._start += size
+            except BlockingIOError:
+                return
+
+            self._pending -= size
+            self._bytes += size
+
+            if not self._pending: # Buffer empty
+                self._start = 0
+
+        if self._eof and not self._pending and not self._done:
+            self._done = True
+
+            try:
+                self._dst.shutdown(socket.SHUT_WR)
+            except OSError: # Destination closed
+                pass
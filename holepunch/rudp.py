@@ -0,0 +1,572 @@
+"""Reliable congestion-controlled stream over client-client UDP sockets.
+
+Connection turns the connected socket of a punched UDP client into an ordered
+reliable byte stream. Data is split in segments of at most the configured
+segment size, each numbered by a packet sequence number. The receiver
+acknowledges the next expected sequence number, its receive window and up to
+RUDP_SACK_BLOCKS ranges of segments received out of order (selective
+acknowledgements), so only lost segments are retransmitted.
+
+Sender keeps at most the smaller of its congestion window and the receiver
+window of segments in flight. Congestion window grows by one segment per
+acknowledged segment in slow start and by one segment per round trip in
+congestion avoidance, and is reduced once per round trip on loss. A segment is
+lost once a segment sent later is acknowledged (time-based loss detection,
+working for retransmissions as well), or when the retransmission timeout
+expires. Segments are paced over the round trip time instead of being sent in
+bursts of a whole window.
+
+Packets:
+
+    +----------+----------+-----------------+-----------------------------+
+    | Packet   | type     | header          | data                        |
+    +==========+==========+=================+=============================+
+    | DATA     | 1 byte   | 4 bytes seq     | segment data                |
+    +----------+----------+-----------------+-----------------------------+
+    | FIN      | 1 byte   | 4 bytes seq     | none, end of stream         |
+    +----------+----------+-----------------+-----------------------------+
+    | ACK      | 1 byte   | 4 bytes next    | SACK blocks, 4 bytes start  |
+    |          |          | 4 bytes window  | and 4 bytes end each        |
+    +----------+----------+-----------------+-----------------------------+
+
+Packets of other types, as late punch probes, are ignored.
+
+Example:
+    Connecting client::
+
+        client = holepunch.client.UDPClient()
+        client.open(dest_host)
+        conn = holepunch.rudp.Connection(client)
+        conn.send(data)
+        conn.close()
+
+    Listening client::
+
+        client = holepunch.client.UDPClient()
+        client.open()
+        conn = holepunch.rudp.Connection(client)
+        data = conn.recv()
+"""
+
+
+import collections
+import logging
+import struct
+import time
+
+import holepunch.config
+import holepunch.loop
+
+
+DATA = 1
+ACK = 2
+FIN = 3
+
+HEADER = struct.Struct("!BI")
+ACK_HEADER = struct.Struct("!BII")
+BLOCK = struct.Struct("!II")
+
+# Segment fields
+TYPE = 0
+PAYLOAD = 1
+SENT = 2
+RETRANSMITTED = 3
+LOST = 4
+
+
+class Connection:
+    """Reliable stream over a punched UDP socket.
+
+    Reliable stream owning the client-client socket of a UDP client. The socket
+    is made non-blocking and driven by the connection event loop whenever the
+    connection waits; the client must not send or receive on it directly.
+
+    Attributes:
+        _client: Client of connection socket.
+        _loop: Event loop.
+        _queue: Segments not yet sent, each a type and payload tuple.
+        _unacked: Segments sent and not yet acknowledged by sequence number,
+        each a list of type, payload, sent clock time, retransmitted and lost
+        flags.
+        _lost: Sequence numbers of lost segments to retransmit, including
+        segments acknowledged since.
+        _missing: Number of segments flagged lost and not yet retransmitted.
+        _next: Sequence number of next new segment.
+        _limit: Sequence number the receiver window ends at.
+        _cwnd: Congestion window in segments.
+        _ssthresh: Slow start threshold in segments.
+        _recovery: Sequence number ending the current loss recovery.
+        _delivered: Latest sent clock time of an acknowledged segment.
+        _srtt: Smoothed round trip time in seconds or None.
+        _rttvar: Round trip time variation in seconds.
+        _rto: Retransmission timeout in seconds.
+        _deadline: Retransmission timeout clock time or None.
+        _tokens: Pacing tokens in segments.
+        _paced: Clock time tokens were last added.
+        _expected: Next in order sequence number expected from peer.
+        _received: Segments received out of order by sequence number.
+        _chunks: Received data not yet read.
+        _advertised: Receive window last advertised to the peer.
+        _ack: True if an acknowledgement is due.
+        _eof: True if peer ended its stream.
+        _closed: True if connection is closed.
+    """
+
+    @property
+    def cwnd(self):
+        """Cwnd accessor."""
+        return self._cwnd
+
+    @property
+    def srtt(self):
+        """Srtt accessor."""
+        return self._srtt
+
+    @property
+    def closed(self):
+        """Closed accessor."""
+        return self._closed
+
+    def __init__(self, client):
+        """Initialise connection.
+
+        Args:
+            client: Client with an open connected client-client UDP socket.
+            Round trip time measured by the punch handshake, if any, seeds
+            the round trip time estimate.
+        """
+
+        self._client = client
+        self._loop = holepunch.loop.Loop()
+
+        self._queue = collections.deque()
+        self._unacked = {}
+        self._lost = collections.deque()
+        self._missing = 0
+        self._next = 0
+        self._limit = holepunch.config.RUDP_WINDOW
+        self._cwnd = float(holepunch.config.RUDP_INITIAL_WINDOW)
+        self._ssthresh = float("inf")
+        self._recovery = 0
+        self._delivered = 0
+        self._srtt = getattr(client, "rtt", None)
+        self._rttvar = self._srtt / 2 if self._srtt else 0
+        self._rto = holepunch.config.RUDP_RTO_INITIAL
+        self._deadline = None
+        self._tokens = float(holepunch.config.RUDP_INITIAL_WINDOW)
+        self._paced = time.monotonic()
+
+        self._expected = 0
+        self._received = {}
+        self._chunks = collections.deque()
+        self._advertised = holepunch.config.RUDP_WINDOW
+        self._ack = False
+        self._eof = False
+        self._closed = False
+
+        self._client.sock.setblocking(False)
+        self._loop.register(self._client.sock, holepunch.loop.EVENT_READ, self.handle)
+
+    def send(self, data):
+        """Send data on connection.
+
+        Queue data in segments and drive the connection while more than a
+        receive window of segments is queued.
+
+        Args:
+            data: Bytes-like object.
+
+        Raises:
+            ConnectionError: If connection is closed.
+        """
+
+        if self._closed:
+            raise ConnectionError("Connection closed")
+
+        view = memoryview(data).cast("B")
+        size = holepunch.config.RUDP_SEGMENT_SIZE
+
+        for offset in range(0, len(view), size):
+            self._queue.append((DATA, bytes(view[offset:offset + size])))
+
+        self.transmit()
+
+        while len(self._queue) > holepunch.config.RUDP_WINDOW and not self._closed:
+            self.poll()
+
+    def recv(self):
+        """Receive data from connection.
+
+        Block until data is received, then return the oldest received segment
+        data.
+
+        Returns:
+            data: Data received, empty on end of stream.
+        """
+
+        while not self._chunks and not self._eof and not self._closed:
+            self.poll()
+
+        if not self._chunks:
+            return b""
+
+        data = self._chunks.popleft()
+
+        # Reopen a receive window closing on the sender
+        if self._advertised < holepunch.config.RUDP_WINDOW // 2 <= self.window():
+            self.acknowledge()
+
+        return data
+
+    def close(self):
+        """Close connection.
+
+        End stream and drive the connection until every segment is
+        acknowledged or the linger timeout expires, then close client. Once
+        the peer ended its stream the end of stream is sent but its
+        acknowledgement is not waited for, the peer closes as soon as its own
+        end of stream is acknowledged.
+        """
+
+        if not self._closed:
+            self._queue.append((FIN, b""))
+            self.transmit()
+
+            deadline = time.monotonic() + holepunch.config.RUDP_LINGER
+            while (self._queue or self._unacked) and time.monotonic() < deadline:
+                if self._eof and not self._queue and all(segment[TYPE] == FIN for segment in self._unacked.values()):
+                    break
+
+                self.poll(deadline - time.monotonic())
+
+            self._closed = True
+            self._loop.close()
+
+        self._client.close()
+
+    def poll(self, timeout=None):
+        """Drive connection once.
+
+        Wait for packets until timeout, the next pacing token or the
+        retransmission timeout, then send what window and pacing allow.
+
+        Args:
+            timeout: Maximum seconds to wait. If timeout is None then wait up
+            to the retransmission timeout.
+        """
+
+        if self._closed:
+            return
+
+        now = time.monotonic()
+        wait = self._rto if timeout is None else timeout
+
+        if self._deadline is not None:
+            wait = min(wait, max(self._deadline - now, 0))
+
+        if self._tokens < 1 and self.sendable():
+            wait = min(wait, (1 - self._tokens) / self.rate())
+
+        self._loop.run_once(wait)
+
+        self.expire()
+        self.transmit()
+
+    def window(self):
+        """Get receive window.
+
+        Returns:
+            window: Segments the peer may send beyond the next expected one.
+        """
+
+        return max(holepunch.config.RUDP_WINDOW - len(self._chunks), 0)
+
+    def rate(self):
+        """Get pacing rate.
+
+        Returns:
+            rate: Segments per second.
+        """
+
+        srtt = self._srtt or self._rto
+        return max(self._cwnd, 1) / max(srtt, 1e-4) * holepunch.config.RUDP_PACING_GAIN
+
+    def inflight(self):
+        """Get segments in flight.
+
+        Returns:
+            inflight: Sent segments neither acknowledged nor lost.
+        """
+
+        return len(self._unacked) - self._missing
+
+    def sendable(self):
+        """Check if a segment may be sent.
+
+        Returns:
+            sendable: True if a lost segment or a new segment within congestion
+            and receive windows is ready to be sent.
+        """
+
+        if self.inflight() >= self._cwnd:
+            return False
+
+        return bool(self._missing) or (bool(self._queue) and self._next < self._limit)
+
+    def transmit(self):
+        """Send lost then new segments as windows and pacing allow."""
+
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._paced) * self.rate(), holepunch.config.RUDP_BURST)
+        self._paced = now
+
+        while self._tokens >= 1 and self.sendable():
+            if self._missing:
+                # Skip lost segments acknowledged since
+                while self._lost[0] not in self._unacked:
+                    self._lost.popleft()
+
+                seq = self._lost[0]
+                segment = self._unacked[seq]
+                segment[RETRANSMITTED] = True
+            else:
+                seq = self._next
+                segment = [*self._queue[0], now, False, False]
+
+            try:
+                self._client.sock.sendmsg([HEADER.pack(segment[TYPE], seq), segment[PAYLOAD]])
+            except BlockingIOError:
+                break
+            except OSError as error:
+                logging.info("Reliable UDP socket error %s", error)
+                break
+
+            if segment[RETRANSMITTED] and segment[LOST]:
+                self._lost.popleft()
+                self._missing -= 1
+                segment[LOST] = False
+                segment[SENT] = now
+            else:
+                self._queue.popleft()
+                self._unacked[seq] = segment
+                self._next += 1
+
+            if self._deadline is None:
+                self._deadline = now + self._rto
+
+            self._tokens -= 1
+
+        # Probe a closed receive window
+        if not self._unacked and self._queue and self._next >= self._limit and self._deadline is None:
+            self._deadline = now + self._rto
+
+    def expire(self):
+        """Handle retransmission timeout.
+
+        Mark every segment in flight lost, collapse the congestion window and
+        back the timeout off. A receive window probe sends the next segment
+        beyond a closed receive window.
+        """
+
+        now = time.monotonic()
+
+        if self._deadline is None or now < self._deadline:
+            return
+
+        if not self._unacked and self._queue: # Receive window probe
+            self._limit = self._next + 1
+        else:
+            for seq, segment in self._unacked.items():
+                if not segment[LOST]:
+                    segment[LOST] = True
+                    self._lost.append(seq)
+                    self._missing += 1
+
+            self._ssthresh = max(self._cwnd / 2, 2)
+            self._cwnd = 1.0
+            self._recovery = self._next
+
+        self._rto = min(self._rto * 2, holepunch.config.RUDP_RTO_MAX)
+        self._deadline = now + self._rto
+
+    def acknowledge(self):
+        """Send acknowledgement of received segments."""
+
+        blocks = []
+        start = end = None
+
+        for seq in sorted(self._received):
+            if seq == end:
+                end += 1
+                continue
+
+            if start is not None:
+                blocks.append(BLOCK.pack(start, end))
+                if len(blocks) == holepunch.config.RUDP_SACK_BLOCKS:
+                    start = None
+                    break
+
+            start, end = seq, seq + 1
+
+        if start is not None:
+            blocks.append(BLOCK.pack(start, end))
+
+        self._advertised = self.window()
+        self._ack = False
+
+        try:
+            self._client.sock.sendmsg([ACK_HEADER.pack(ACK, self._expected, self._advertised), *blocks])
+        except OSError as error: # Acknowledgement lost
+            logging.debug("Reliable UDP socket error %s", error)
+
+    def receive(self, type, seq, data):
+        """Handle data or end of stream segment.
+
+        Args:
+            type: Segment type.
+            seq: Sequence number.
+            data: Segment data.
+        """
+
+        self._ack = True
+
+        if seq < self._expected or seq in self._received: # Duplicate
+            return
+
+        if seq >= self._expected + holepunch.config.RUDP_WINDOW: # Beyond window
+            return
+
+        self._received[seq] = (type, data)
+
+        while self._expected in self._received:
+            type, data = self._received.pop(self._expected)
+            self._expected += 1
+
+            if type == FIN:
+                self._eof = True
+            else:
+                self._chunks.append(data)
+
+    def acknowledged(self, expected, window, data):
+        """Handle acknowledgement.
+
+        Remove acknowledged segments, update round trip time estimate and
+        congestion window, and detect lost segments.
+
+        Args:
+            expected: Next sequence number expected by peer.
+            window: Receive window of peer.
+            data: Selective acknowledgement blocks.
+        """
+
+        now = time.monotonic()
+        acked = []
+
+        for seq in range(next(iter(self._unacked), expected), expected):
+            if seq in self._unacked:
+                acked.append(self._unacked.pop(seq))
+
+        for offset in range(0, len(data) - BLOCK.size + 1, BLOCK.size):
+            start, end = BLOCK.unpack_from(data, offset)
+
+            for seq in range(max(start, expected), min(end, self._next)):
+                if seq in self._unacked:
+                    acked.append(self._unacked.pop(seq))
+
+        self._limit = max(self._limit, expected + window)
+
+        if not acked:
+            return
+
+        sample = None
+
+        for segment in acked:
+            if segment[LOST]:
+                self._missing -= 1
+
+            self._delivered = max(self._delivered, segment[SENT])
+
+            if not segment[RETRANSMITTED]:
+                sample = now - segment[SENT]
+
+            # Grow congestion window outside loss recovery
+            if expected >= self._recovery:
+                if self._cwnd < self._ssthresh:
+                    self._cwnd += 1
+                else:
+                    self._cwnd += 1 / self._cwnd
+
+        # Retransmitted segments give no sample and keep the backed off timeout
+        if sample is not None:
+            if self._srtt is None:
+                self._srtt = sample
+                self._rttvar = sample / 2
+            else:
+                self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - sample)
+                self._srtt = 0.875 * self._srtt + 0.125 * sample
+
+            self._rto = self._srtt + 4 * self._rttvar
+            self._rto = min(max(self._rto, holepunch.config.RUDP_RTO_MIN), holepunch.config.RUDP_RTO_MAX)
+
+        self._deadline = now + self._rto if self._unacked else None
+
+        self.detect()
+
+    def detect(self):
+        """Detect lost segments.
+
+        Mark lost every segment in flight sent a reordering window before the
+        latest acknowledged segment, and reduce the congestion window once per
+        round trip.
+        """
+
+        reordering = max((self._srtt or 0) / 4, holepunch.config.RUDP_REORDERING)
+        lost = None
+
+        for seq, segment in self._unacked.items():
+            if not segment[LOST] and segment[SENT] + reordering < self._delivered:
+                segment[LOST] = True
+                self._lost.append(seq)
+                self._missing += 1
+                lost = seq
+
+        # Segment sent after the last reduction was lost
+        if lost is not None and lost >= self._recovery:
+            self._ssthresh = max(self._cwnd * holepunch.config.RUDP_BETA, 2)
+            self._cwnd = self._ssthresh
+            self._recovery = self._next
+
+    def handle(self, events):
+        """Handle connection socket file descriptor.
+
+        Receive a batch of packets, acknowledge received segments and send what
+        windows and pacing allow.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        for _ in range(holepunch.config.DATAGRAM_BATCH):
+            try:
+                packet = self._client.sock.recv(65535)
+            except BlockingIOError:
+                break
+            except OSError as error: # Peer unreachable, retransmission recovers
+                logging.debug("Reliable UDP socket error %s", error)
+                continue
+
+            if len(packet) < HEADER.size:
+                continue
+
+            type, seq = HEADER.unpack_from(packet)
+
+            if type in (DATA, FIN):
+                self.receive(type, seq, packet[HEADER.size:])
+            elif type == ACK and len(packet) >= ACK_HEADER.size:
+                _, expected, window = ACK_HEADER.unpack_from(packet)
+                self.acknowledged(expected, window, memoryview(packet)[ACK_HEADER.size:])
+
+        if self._ack:
+            self.acknowledge()
+
+        self.transmit()
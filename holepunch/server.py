@@ -3,9 +3,13 @@
 Holepunch server process is listening for clients. A client can send a connect
 or listen request and receive a holepunch or error response. Holepunch server
 will send a holepunch response to the connect and listen client with the
-destination host address and destination port address. Holepunch server will
-bind on the address snd will set a holepunch response to the port set in config
-file.
+destination host address and the destination port address observed by the
+server, with the port delta of the destination NAT classified from the ports
+observed for its host (see holepunch.nat). In relay mode both responses carry
+the same relay token, so clients whose punch failed are relayed by the server
+(see holepunch.relay). Server metrics are exported over HTTP in Prometheus
+text format when enabled (see holepunch.metrics). Per client events are traced
+rather than logged (see holepunch.trace).
 
 Example:
     Server::
@@ -15,27 +19,42 @@ Example:
 
 
 import logging
-import select
+import secrets
 import socket
+import time
 
 import holepunch.config
+import holepunch.loop
 import holepunch.message
+import holepunch.metrics
+import holepunch.nat
+import holepunch.registry
+import holepunch.relay
+import holepunch.trace
+import holepunch.tuning
 
 
 class Server:
     """Holepunch server for P2P communication across NAT/Firewall.
 
     Holepunch server is listening for client and will introduce clients from its
-    client list. It is using select to for asynchronous i/o, accepting new
+    client registry. It is using an event loop for asynchronous i/o, accepting new
     clinets when server is ready and handling request/response when client is
-    ready.
+    ready. Server and each client are registered once in the event loop.
 
     Attributes:
         _sock:  Server-client socket.
         _addr:  Server host and port address tuple.
-        _rlist: Read ready file descriptors
-        _wlist: Write ready file descriptors
-        _xlist: Exception ready file descriptors
+        _loop: Event loop.
+        _registry: Server-client registry.
+        _channel: Broker channel shared with other workers or None.
+        _endpoint: Datagram rendezvous endpoint or None.
+        _nat: NAT behaviour classifiers by client host.
+        _relaying: True if holepunch responses carry a relay token.
+        _relay: Relay of clients whose punch failed or None.
+        _metrics: Server metrics.
+        _exporter: Metrics exporter or None.
+        _backoff: Accept backoff timer or None if accepting.
     """
 
     @property
@@ -58,21 +77,77 @@ class Server:
         """Addr mutator."""
         self._addr = value
 
-    def __init__(self):
-        """Initialise server."""
+    @property
+    def loop(self):
+        """Loop accessor."""
+        return self._loop
+
+    @property
+    def channel(self):
+        """Channel accessor."""
+        return self._channel
+
+    @property
+    def registry(self):
+        """Registry accessor."""
+        return self._registry
+
+    @property
+    def nat(self):
+        """Nat accessor."""
+        return self._nat
+
+    @property
+    def relay(self):
+        """Relay accessor."""
+        return self._relay
+
+    @property
+    def metrics(self):
+        """Metrics accessor."""
+        return self._metrics
+
+    def __init__(self, loop=None, channel=None, udp=False, relay=False, metrics=False):
+        """Initialise server.
+
+        Args:
+            loop: Event loop. If loop is None then a new event loop with the
+            default selector backend is used.
+            channel: Broker channel (holepunch.shard.Channel) when server runs
+            as a worker of a sharded server.
+            udp: If True then also accept requests as UDP datagrams on the
+            server address.
+            relay: If True then holepunch responses carry a relay token and
+            clients whose punch failed are relayed on the relay port. Workers
+            of a sharded server leave relaying to the broker.
+            metrics: If True then server metrics are exported on the metrics
+            port, offset by the channel slot when server runs as a worker.
+        """
 
         self._sock = None
         self._addr = (holepunch.config.SERVER_HOST, holepunch.config.SERVER_PORT)
 
-        self._rlist = [self]
-        self._wlist = []
-        self._xlist = []
+        self._loop = holepunch.loop.Loop() if loop is None else loop
+        self._registry = holepunch.registry.Registry()
+        self._channel = channel
+        self._endpoint = Endpoint(self) if udp else None
+        self._nat = holepunch.nat.Table()
+        self._relaying = relay
+        self._relay = holepunch.relay.Relay(self._loop) if relay and channel is None else None
+        self._metrics = holepunch.metrics.ServerMetrics(self)
+        self._exporter = None
+        self._backoff = None
+
+        if metrics:
+            slot = 0 if channel is None else channel.slot
+            addr = (holepunch.config.METRICS_HOST, holepunch.config.METRICS_PORT + slot)
+            self._exporter = holepunch.metrics.Exporter(self._metrics, self._loop, addr)
 
     def fileno(self):
         """Get server socket file descriptor.
 
         Get server socket file descriptor to unable use of self with
-        select.
+        event loop.
 
         Returns:
             file_descriptor: Server socket file descriptor.
@@ -84,14 +159,38 @@ class Server:
         """Open listening socket.
 
         Open socket, bind on host and port as configured in the config file and
-        start listening for clients.
+        start listening for clients with the tuning profile. Register server in
+        event loop.
         """
 
+        # Raise open file descriptor limit to hold many clients if tuned
+        holepunch.tuning.PROFILE.limits()
+
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self._sock.bind(self._addr)
-        self._sock.listen(5)
+        holepunch.tuning.PROFILE.listen(self._sock)
+        self._sock.setblocking(False)
+
+        # Register server in event loop
+        self._loop.register(self, holepunch.loop.EVENT_READ, self.accept_client)
+
+        # Register broker channel in event loop
+        if self._channel is not None:
+            self._channel.open(self)
+
+        # Register datagram endpoint in event loop
+        if self._endpoint is not None:
+            self._endpoint.open()
+
+        # Register relay in event loop
+        if self._relay is not None:
+            self._relay.open()
+
+        # Register metrics exporter in event loop
+        if self._exporter is not None:
+            self._exporter.open()
 
         logging.info("Open server socket %s", self._sock)
 
@@ -101,85 +200,238 @@ class Server:
         Close socket, and consiquently all server-client sockets.
         """
 
+        # Unregister broker channel from event loop
+        if self._channel is not None:
+            self._channel.close()
+
+        # Unregister datagram endpoint from event loop
+        if self._endpoint is not None:
+            self._endpoint.close()
+
+        # Unregister relay from event loop
+        if self._relay is not None:
+            self._relay.close()
+
+        # Unregister metrics exporter from event loop
+        if self._exporter is not None:
+            self._exporter.close()
+
+        # Unregister server from event loop
+        if self._backoff is not None:
+            self._backoff.cancel()
+            self._backoff = None
+        else:
+            self._loop.unregister(self)
+
         self._sock.close()
 
         logging.info("Close server socket %s", self._sock)
 
-    def accept_client(self):
+    def accept_client(self, events=holepunch.loop.EVENT_READ):
         """Accept server-client connection.
 
-        Accept server-client connections, instantiate and open client.
-        Client will append it self on the server ready list.
+        Accept all pending server-client connections, instantiate and open
+        client. Client will append it self on the server client registry. A
+        connection aborted before it is accepted is skipped. Once file
+        descriptors or memory run out the server stops accepting (see pause).
+
+        Args:
+            events: Ready events mask.
         """
 
-        sock, addr = self._sock.accept()
-        client = Client(self)
-        client.open(sock, addr)
+        while True:
+            try:
+                sock, addr = self._sock.accept()
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno in holepunch.loop.EXHAUSTED:
+                    logging.warning("Accept server-client failed: %s", e)
+                    self.pause()
+                    break
+
+                logging.info("Accept server-client failed: %s", e)
+                continue
+
+            self._metrics.accepted.inc()
+            self.observe(addr)
+
+            client = Client(self)
+            client.open(sock, addr)
+
+    def pause(self):
+        """Stop accepting server-client connections.
+
+        Unregister server from event loop until a client is removed, freeing
+        its file descriptor, or the accept backoff configured in the config
+        file elapses. Pending connections wait in the listen backlog.
+        """
+
+        if self._backoff is not None: # Paused
+            return
+
+        self._loop.unregister(self)
+        self._backoff = self._loop.call_later(holepunch.config.ACCEPT_BACKOFF, self.resume)
+
+    def resume(self):
+        """Resume accepting server-client connections."""
+
+        if self._backoff is None: # Accepting
+            return
 
-    def find_client(self, sock=None, host=None, port=None):
-        """Find client from ready list.
+        self._backoff.cancel()
+        self._backoff = None
 
-        Find client in client list by socket file descriptor or host address or
-        port address.
+        self._loop.register(self, holepunch.loop.EVENT_READ, self.accept_client)
+
+    def observe(self, addr):
+        """Observe client address mapped by its NAT.
+
+        Args:
+            addr: Client host and port address tuple.
+        """
+
+        self._nat.observe(addr[0], addr[1])
+
+    def mapping(self, addr, token=0):
+        """Get holepunch response body of client address.
+
+        Args:
+            addr: Client host and port address tuple.
+            token: Relay token of introduction.
+
+        Returns:
+            body: Client host address, observed port address, port delta of
+            client NAT and relay token.
+        """
+
+        return (addr[0], addr[1], self._nat.delta(addr[0]), token)
+
+    def token(self, *clients):
+        """Get relay token of a new introduction.
+
+        Only binary protocol clients receive a relay token, text protocol
+        responses have no field to carry it. Token is issued on the relay, so
+        the relay only pairs connections of an introduction.
+
+        Args:
+            clients: Introduced server-clients or peers.
+
+        Returns:
+            token: Random 64 bits relay token, 0 if server does not relay or
+            a client does not speak the binary protocol.
+        """
+
+        if not self._relaying or any(client.codec is not holepunch.message.BINARY for client in clients):
+            return 0
+
+        token = secrets.randbits(64) or 1
+
+        if self._relay is not None:
+            self._relay.issue(token)
+        elif self._channel is not None:
+            # Issue token on the relay of the broker
+            self._channel.issue(token)
+
+        return token
+
+    def find_client(self, sock=None, host=None, port=None, transport="tcp"):
+        """Find client from client registry.
+
+        Find client in client registry by socket file descriptor or host
+        address or transport and host and port address in constant time.
 
         Args:
             sock: Client socket file descriptor.
             host: Client host address.
             port: Client port address.
+            transport: Client transport ("tcp" or "udp").
+
+        Returns:
+            client: Client found or None.
         """
 
-        for r in self._rlist:
-            if r.sock == sock or r.addr[0] == host or r.addr[1] == port:
-                return r
-        return None
+        client = self._registry.find(sock=sock, host=host, port=port, transport=transport)
+
+        self._metrics.lookups.inc()
+        if client is None:
+            self._metrics.misses.inc()
+
+        return client
 
     def append_client(self, client):
-        """Append client to ready list.
+        """Append client to client registry.
 
-        Append client to ready list. Ready list is used by select for selecting
-        server or clients which their socket file descriptors are ready to read.
+        Append client to client registry and register client in event loop.
+        Event loop will call client handle when client socket is ready to read.
 
         Args:
-            client: Client to append in ready list.
+            client: Client to append in client registry.
         """
 
-        self._rlist.append(client)
+        self._registry.add(client)
+        self._loop.register(client, holepunch.loop.EVENT_READ, client.handle)
 
     def remove_client(self, client):
-        """Remove client from ready list.
+        """Remove client from client registry.
+
+        Remove client from client registry and unregister client from event
+        loop. Client must be removed before its socket is closed.
+
+        Args:
+            client: Client to remove in client registry.
+        """
+
+        # Unpublish client from other workers
+        if self._channel is not None:
+            self._channel.unpublish(client)
+
+        self._loop.unregister(client)
+        self._registry.remove(client)
+
+        # Accept again once a file descriptor is freed
+        self.resume()
+
+    def append_peer(self, peer):
+        """Append listening datagram peer to client registry.
+
+        Args:
+            peer: Peer to append in client registry.
+        """
 
-        Remove client from ready list. Ready list is used by select for
-        selecting server or clients which their socket file descriptors are
-        ready to read.
+        self._registry.add(peer)
+
+        # Publish peer to other workers
+        if self._channel is not None:
+            self._channel.publish(peer)
+
+    def remove_peer(self, peer):
+        """Remove listening datagram peer from client registry.
 
         Args:
-            client: Client to remove in ready list.
+            peer: Peer to remove in client registry.
         """
 
-        self._rlist.remove(client)
+        # Unpublish peer from other workers
+        if self._channel is not None:
+            self._channel.unpublish(peer)
+
+        self._registry.remove(peer)
 
     def run(self):
         """Run holepunch server.
 
-        Run continues loop for accept or handle clients.
+        Run event loop for accept or handle clients.
         Break loop when KeyboardInterrupt.
         """
 
         self.open()
 
-        while True:
-            try:
-                # Asynchronous I/O
-                rready, wready, xready = select.select(self._rlist, self._wlist, self._xlist)
-
-                for r in rready:
-                    if r is self: # Handle server
-                        r.accept_client()
-                    else: # Handle client
-                        r.handle()
-
-            except KeyboardInterrupt:
-                break
+        try:
+            # Asynchronous I/O
+            self._loop.run()
+        except KeyboardInterrupt:
+            pass
 
         self.close()
 
@@ -187,13 +439,20 @@ class Server:
 class Client:
     """Server-client socket wrapper.
 
-    Server-client socket wrapper used by select asynchronous i/o for handling
+    Server-client socket wrapper used by event loop asynchronous i/o for handling
     request/repsonse. Its client represents a server-client endpoint.
 
     Attributes:
         _server: Holepunch server socket wrapper.
         _sock: Client - client socket.
         _addr: Client host and port address tuple.
+        _decoder: Incremental request decoder.
+        _listen_id: Listen request id.
+        _listening: True if client is listening.
+        _wbuf: Outbound buffer of data not yet sent.
+        _events: Events registered in event loop.
+        _deadline: Clock time after which client expires.
+        _timer: Expiry timer.
     """
 
     @property
@@ -216,18 +475,45 @@ class Client:
         """Addr mutator."""
         self._addr = value
 
+    @property
+    def listen_id(self):
+        """Listen id accessor."""
+        return self._listen_id
+
+    @property
+    def listening(self):
+        """Listening accessor."""
+        return self._listening
+
+    @property
+    def transport(self):
+        """Transport accessor."""
+        return "tcp"
+
+    @property
+    def codec(self):
+        """Codec accessor, text until negotiated."""
+        return self._decoder.codec or holepunch.message.TEXT
+
     def __init__(self, server):
         """Initialise server."""
 
         self._server = server
         self._sock = None
         self._addr = None
+        self._decoder = None
+        self._listen_id = 0
+        self._listening = False
+        self._wbuf = bytearray()
+        self._events = holepunch.loop.EVENT_READ
+        self._deadline = None
+        self._timer = None
 
     def fileno(self):
         """Get server-client socket file descriptor.
 
         Get server-client socket file descriptor to unable use of self with
-        select.
+        event loop.
 
         Returns:
             file_descriptor: Server-client socket file descriptor.
@@ -238,91 +524,644 @@ class Client:
     def open(self, sock, addr):
         """Open server-client socket.
 
-        Append self from server ready list.
+        Append self to server client registry.
         """
 
         # Open socket
         self._sock = sock
+        self._sock.setblocking(False)
         self._addr = addr
+        self._decoder = holepunch.message.Decoder(holepunch.config.RECV_BUFFER_SIZE, methods=holepunch.message.REQUESTS)
 
-        # Append to server client list
+        # Append to server client registry
         self._server.append_client(self)
 
-        logging.info("Open server-client socket %s", self._sock)
+        # Schedule idle expiry
+        self._deadline = time.monotonic() + holepunch.config.IDLE_TIMEOUT
+        self._timer = self._server.loop.call_later(holepunch.config.IDLE_TIMEOUT, self.expire)
+
+        holepunch.trace.event("Open server-client", addr=addr)
 
     def close(self):
         """Close server-client socket.
 
-        Close socket and remove self from server ready list.
+        Close socket and remove self from server client registry. Data not yet
+        sent is discarded.
         """
 
+        if self._addr is None: # Client closed
+            return
+
+        # Cancel expiry
+        self._timer.cancel()
+
+        if self._listening:
+            self._server.metrics.listening.dec()
+
+        # Remove from server client registry
+        self._server.remove_client(self)
+
+        holepunch.trace.event("Close server-client", addr=self._addr)
+
         # Close socket
         self._sock.close()
         self._addr = None
 
-        # Remove from server client list
-        self._server.remove_client(self)
+    def touch(self):
+        """Postpone server-client expiry.
+
+        Postpone expiry by the listen TTL if client is listening else by the
+        idle timeout. Any request received is a heartbeat; a listening client
+        stays listening while it repeats its listen (<) request within the
+        listen TTL.
+        """
+
+        if not self._listening:
+            self._deadline = time.monotonic() + holepunch.config.IDLE_TIMEOUT
+        else:
+            self._deadline = time.monotonic() + holepunch.config.LISTEN_TTL
+
+    def expire(self):
+        """Expire server-client.
+
+        Called by expiry timer. Reschedule expiry timer if deadline has been
+        postponed else send close (.) response and close client.
+        """
+
+        remaining = self._deadline - time.monotonic()
+
+        if remaining > 0:
+            self._timer = self._server.loop.call_later(remaining, self.expire)
+            return
+
+        holepunch.trace.event("Expire server-client", addr=self._addr)
+
+        # Send close response to client
+        response = holepunch.message.Message(method=".", id=self._listen_id)
+        self.send(response)
+
+        self.close()
+
+    def _update_events(self):
+        """Update events registered in event loop.
+
+        Register write events while outbound buffer is not empty. Stop read
+        events while outbound buffer is above the high watermark and resume
+        them when it drains below the low watermark.
+        """
+
+        events = self._events & holepunch.loop.EVENT_READ
+
+        if len(self._wbuf) > holepunch.config.WRITE_BUFFER_HIGH:
+            events = 0
+        elif len(self._wbuf) <= holepunch.config.WRITE_BUFFER_LOW:
+            events = holepunch.loop.EVENT_READ
 
-        logging.info("Close server-client socket %s", self._sock)
+        if self._wbuf:
+            events |= holepunch.loop.EVENT_WRITE
+
+        if events != self._events:
+            self._events = events
+            self._server.loop.modify(self, events, self.handle)
 
     def send(self, message):
         """Send server-client data.
 
-        Send message to server.
+        Send message to client encoded by the negotiated codec without
+        blocking. Data not sent immediately is queued in the outbound buffer and
+        flushed when socket is write ready. Client is closed if outbound buffer
+        exceeds its limit.
 
         Args:
-            message: Parsed data received from client.
+            message: Message sent to client.
         """
 
-        data = bytes(message)
-        self._sock.sendall(data)
+        if self._addr is None: # Client closed
+            return
+
+        # Listening client is introduced once
+        if message.method == "*" and self._listening and message.id == self._listen_id:
+            self._listening = False
+            self._server.registry.unlisten(self)
+            self._server.metrics.listening.dec()
+
+            if self._server.channel is not None:
+                # Unpublish client from other workers
+                self._server.channel.unpublish(self)
+
+        codec = self.codec
+        data = codec.encode(holepunch.message.downgrade(message, codec))
+
+        if not self._wbuf:
+            try:
+                size = self._sock.send(data)
+            except BlockingIOError:
+                size = 0
+            except OSError:
+                self.close()
+                return
+
+            data = memoryview(data)[size:]
+
+        if data:
+            self._wbuf += data
+
+            if len(self._wbuf) > holepunch.config.WRITE_BUFFER_LIMIT:
+                logging.info("Overflow server-client socket %s", self._sock)
+                self.close()
+                return
+
+            self._update_events()
+
+    def flush(self):
+        """Flush server-client outbound buffer.
+
+        Send as much of outbound buffer as socket accepts without blocking.
+        """
+
+        try:
+            size = self._sock.send(self._wbuf)
+        except BlockingIOError:
+            size = 0
+        except OSError:
+            self.close()
+            return
+
+        del self._wbuf[:size]
+
+        self._update_events()
 
     def recv(self):
         """Receive server-client data.
 
-        Receive maximum data from sever.
+        Receive available data from client into the receive buffer and decode
+        all complete messages. Codec is negotiated from the first data
+        received.
 
         Returns:
-            message: Parsed data received from client.
+            messages: List of complete messages received from client. Close
+            (.) on end of file.
+
+        Raises:
+            ValueError: If data is malformed or exceeds the receive buffer.
         """
 
-        data = self._sock.recv(65535)
-        return holepunch.message.Message(data.decode("utf-8"))
+        try:
+            size = self._decoder.recv_into(self._sock)
+        except BlockingIOError:
+            return []
+        except ConnectionError:
+            size = 0
+
+        if not size: # Close (.) on end of file
+            return [holepunch.message.Message(method=".")]
 
-    def handle(self):
+        return list(self._decoder)
+
+    def handle(self, events=holepunch.loop.EVENT_READ):
         """Handle server-client socket file descriptor
 
-        Handle server-client socket file descriptor when is read ready. After
-        receive request, depending on the request method the appropriate respond
-        will be send to client.
+        Handle server-client socket file descriptor when is read or write
+        ready. Outbound buffer is flushed when write ready. After receive
+        requests, each request is handled in order.
+
+        Args:
+            events: Ready events mask.
         """
 
-        logging.info("Handle server-client socket %s", self._sock)
+        holepunch.trace.event("Handle server-client", addr=self._addr, events=events)
+
+        if events & holepunch.loop.EVENT_WRITE:
+            self.flush()
+
+        if not events & holepunch.loop.EVENT_READ or self._addr is None:
+            return
+
+        # Receive requests
+        try:
+            requests = self.recv()
+        except ValueError: # Close client on malformed request
+            requests = [holepunch.message.Message(method=".")]
+
+        metrics = self._server.metrics
+
+        for request in requests:
+            start = time.perf_counter()
+            self.handle_request(request)
+            metrics.request(request.method, time.perf_counter() - start)
+
+            if self._addr is None: # Client closed
+                return
+
+        self.touch()
+
+    def handle_request(self, request):
+        """Handle server-client request.
+
+        Depending on the request method the appropriate respond will be send to
+        client.
 
-        # Receive request
-        request = self.recv()
+        Args:
+            request: Message received from client.
+        """
 
         if request.method == ">": # Handle connect request
-            # Find listening client in server client list
+            start = time.perf_counter()
+
+            # Find listening client in server client registry
             client = self._server.find_client(host=request.body)
 
             if client:
+                token = self._server.token(self, client)
+
                 # Send holepunch response to connect client
-                response = holepunch.message.Message("*{0}".format((client.addr[0], holepunch.config.HOLEPUNCH_PORT)))
+                response = holepunch.message.Message(method="*", body=self._server.mapping(client.addr, token), id=request.id)
                 self.send(response)
 
                 # Send holepunch response to listen client
-                response = holepunch.message.Message("*{0}".format((self.addr[0], holepunch.config.HOLEPUNCH_PORT)))
+                response = holepunch.message.Message(method="*", body=self._server.mapping(self._addr, token), id=client.listen_id)
                 client.send(response)
+
+                self._server.metrics.introduce(time.perf_counter() - start)
+            elif self._server.channel is not None:
+                # Find listening client in other workers
+                self._server.channel.introduce(self, request, start)
             else:
                 # Send client not found response
-                response = holepunch.message.Message("?")
+                response = holepunch.message.Message(method="?", id=request.id)
                 self.send(response)
 
+                self._server.metrics.not_found.inc()
+
         elif request.method == "<": # Handle listen request
             # Client is listening for holepunch response
-            pass
+            if not self._listening:
+                self._server.metrics.listening.inc()
+
+            self._listen_id = request.id
+            self._listening = True
+            self._server.registry.listen(self)
+
+            if self._server.channel is not None:
+                # Publish listening client to other workers
+                self._server.channel.publish(self)
 
         elif request.method == ".": # Handle close request
             # Close client
             self.close()
+
+
+class Endpoint:
+    """Datagram rendezvous endpoint.
+
+    Datagram rendezvous endpoint accepting listen and connect requests as UDP
+    datagrams on the server address. Each datagram holds one request and is
+    answered from the observed source address. Many datagrams are drained per
+    wakeup into a preallocated buffer. Replies to binary requests are cached
+    by source address and request id, so a retransmitted request is answered
+    with the same reply without being handled again.
+
+    Attributes:
+        _server: Holepunch server.
+        _sock: Server datagram socket.
+        _buf: Receive buffer.
+        _view: Memoryview of receive buffer.
+        _replies: Cached replies by source address and request id; None while
+            request is being handled.
+    """
+
+    @property
+    def sock(self):
+        """Sock accessor."""
+        return self._sock
+
+    @property
+    def server(self):
+        """Server accessor."""
+        return self._server
+
+    def __init__(self, server):
+        """Initialise endpoint.
+
+        Args:
+            server: Holepunch server.
+        """
+
+        self._server = server
+        self._sock = None
+        self._buf = bytearray(holepunch.config.RECV_BUFFER_SIZE)
+        self._view = memoryview(self._buf)
+        self._replies = {}
+
+    def fileno(self):
+        """Get server datagram socket file descriptor.
+
+        Returns:
+            file_descriptor: Server datagram socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def open(self):
+        """Open datagram socket.
+
+        Open socket, bind on server host and port and register endpoint in
+        event loop.
+        """
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holepunch.tuning.PROFILE.datagram(self._sock)
+        self._sock.bind(self._server.addr)
+        self._sock.setblocking(False)
+
+        self._server.loop.register(self, holepunch.loop.EVENT_READ, self.handle)
+
+        logging.info("Open server datagram socket %s", self._sock)
+
+    def close(self):
+        """Close datagram socket.
+
+        Unregister endpoint from event loop and close socket.
+        """
+
+        self._server.loop.unregister(self)
+        self._sock.close()
+
+        logging.info("Close server datagram socket %s", self._sock)
+
+    def send(self, message, addr, codec):
+        """Send datagram response.
+
+        Send message to address and cache it as the reply of the request with
+        the same id.
+
+        Args:
+            message: Message sent to peer.
+            addr: Peer host and port address tuple.
+            codec: Message codec of peer.
+        """
+
+        data = codec.encode(holepunch.message.downgrade(message, codec))
+        key = (addr, message.id)
+
+        # Cache reply of binary requests, text requests have no id
+        if codec is holepunch.message.BINARY:
+            if key not in self._replies:
+                self._server.loop.call_later(holepunch.config.REPLY_TTL, lambda: self._replies.pop(key, None))
+            self._replies[key] = data
+
+        try:
+            self._sock.sendto(data, addr)
+        except OSError:
+            pass
+
+    def handle(self, events=holepunch.loop.EVENT_READ):
+        """Handle server datagram socket file descriptor.
+
+        Drain up to a batch of datagrams and handle the request of each.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        for _ in range(holepunch.config.DATAGRAM_BATCH):
+            try:
+                size, addr = self._sock.recvfrom_into(self._buf)
+            except (BlockingIOError, ConnectionError):
+                break
+
+            view = self._view[:size]
+            codec = holepunch.message.negotiate(view)
+
+            try:
+                request, _ = codec.decode(view, holepunch.message.REQUESTS)
+            except ValueError: # Drop malformed request
+                continue
+
+            if request is not None:
+                start = time.perf_counter()
+                self.handle_request(request, addr, codec)
+                self._server.metrics.request(request.method, time.perf_counter() - start)
+
+    def handle_request(self, request, addr, codec):
+        """Handle datagram request.
+
+        Args:
+            request: Message received from peer.
+            addr: Peer host and port address tuple.
+            codec: Message codec of peer.
+        """
+
+        key = (addr, request.id)
+        cached = codec is holepunch.message.BINARY
+
+        if cached and self._replies.get(key) is not None: # Answered request
+            self._sock.sendto(self._replies[key], addr)
+            return
+
+        if cached and key in self._replies: # Request being handled
+            return
+
+        # Find peer without accounting a registry lookup, every datagram looks
+        # up its peer
+        peer = self._server.registry.find(host=addr[0], port=addr[1], transport="udp")
+
+        if peer is None: # New mapping of peer NAT
+            self._server.observe(addr)
+
+        if request.method == ">": # Handle connect request
+            start = time.perf_counter()
+
+            if cached:
+                self._replies[key] = None
+                self._server.loop.call_later(holepunch.config.REPLY_TTL, lambda: self._replies.pop(key, None))
+
+            # Find listening client in server client registry
+            client = self._server.find_client(host=request.body)
+
+            if peer is None:
+                peer = Peer(self, addr, codec)
+
+            if client:
+                token = self._server.token(peer, client)
+
+                # Send holepunch response to connect peer
+                response = holepunch.message.Message(method="*", body=self._server.mapping(client.addr, token), id=request.id)
+                peer.send(response)
+
+                # Send holepunch response to listen client
+                response = holepunch.message.Message(method="*", body=self._server.mapping(addr, token), id=client.listen_id)
+                client.send(response)
+
+                self._server.metrics.introduce(time.perf_counter() - start)
+            elif self._server.channel is not None:
+                # Find listening client in other workers
+                self._server.channel.introduce(peer, request, start)
+            else:
+                # Send client not found response
+                response = holepunch.message.Message(method="?", id=request.id)
+                peer.send(response)
+
+                self._server.metrics.not_found.inc()
+
+        elif request.method == "<": # Handle listen request
+            if not isinstance(peer, Peer):
+                peer = Peer(self, addr, codec)
+                peer.open(request.id)
+            else:
+                peer.touch(request.id)
+
+        elif request.method == ".": # Handle close request
+            if isinstance(peer, Peer):
+                peer.close()
+
+
+class Peer:
+    """Datagram rendezvous peer.
+
+    Datagram rendezvous peer represents a peer of the datagram endpoint by its
+    observed source address. A listening peer is kept in the server client
+    registry until it sends a close (.) request or its listen TTL expires.
+
+    Attributes:
+        _endpoint: Datagram rendezvous endpoint.
+        _addr: Peer host and port address tuple.
+        _codec: Message codec of peer.
+        _listen_id: Listen request id.
+        _deadline: Clock time after which peer expires.
+        _timer: Expiry timer.
+    """
+
+    @property
+    def addr(self):
+        """Addr accessor."""
+        return self._addr
+
+    @property
+    def listen_id(self):
+        """Listen id accessor."""
+        return self._listen_id
+
+    @property
+    def listening(self):
+        """Listening accessor."""
+        return self._timer is not None
+
+    @property
+    def transport(self):
+        """Transport accessor."""
+        return "udp"
+
+    @property
+    def codec(self):
+        """Codec accessor."""
+        return self._codec
+
+    def __init__(self, endpoint, addr, codec):
+        """Initialise peer.
+
+        Args:
+            endpoint: Datagram rendezvous endpoint.
+            addr: Peer host and port address tuple.
+            codec: Message codec of peer.
+        """
+
+        self._endpoint = endpoint
+        self._addr = addr
+        self._codec = codec
+        self._listen_id = 0
+        self._deadline = None
+        self._timer = None
+
+    def fileno(self):
+        """Get peer file descriptor.
+
+        Returns:
+            file_descriptor: None, peer shares the endpoint socket.
+        """
+
+        return None
+
+    def open(self, listen_id):
+        """Open listening peer.
+
+        Append self to server client registry and schedule listen expiry.
+
+        Args:
+            listen_id: Listen request id.
+        """
+
+        self._listen_id = listen_id
+
+        server = self._endpoint.server
+
+        self._deadline = time.monotonic() + holepunch.config.LISTEN_TTL
+        self._timer = server.loop.call_later(holepunch.config.LISTEN_TTL, self.expire)
+
+        server.append_peer(self)
+        server.metrics.listening.inc()
+
+        holepunch.trace.event("Open server-peer", addr=self._addr)
+
+    def close(self):
+        """Close listening peer.
+
+        Remove self from server client registry.
+        """
+
+        if self._timer is None: # Peer closed
+            return
+
+        self._timer.cancel()
+        self._timer = None
+
+        self._endpoint.server.remove_peer(self)
+        self._endpoint.server.metrics.listening.dec()
+
+        holepunch.trace.event("Close server-peer", addr=self._addr)
+
+    def touch(self, listen_id):
+        """Postpone listening peer expiry.
+
+        Args:
+            listen_id: Listen request id.
+        """
+
+        self._listen_id = listen_id
+        self._deadline = time.monotonic() + holepunch.config.LISTEN_TTL
+
+    def expire(self):
+        """Expire listening peer.
+
+        Reschedule expiry timer if deadline has been postponed else send close
+        (.) response and close peer.
+        """
+
+        remaining = self._deadline - time.monotonic()
+
+        if remaining > 0:
+            self._timer = self._endpoint.server.loop.call_later(remaining, self.expire)
+            return
+
+        # Send close response to peer
+        self.send(holepunch.message.Message(method=".", id=self._listen_id))
+
+        self.close()
+
+    def send(self, message):
+        """Send server-peer data.
+
+        Send message to peer. A listening peer is closed once it is sent its
+        holepunch response; the cached response answers its retransmitted
+        listen requests.
+
+        Args:
+            message: Message sent to peer.
+        """
+
+        self._endpoint.send(message, self._addr, self._codec)
+
+        if message.method == "*" and message.id == self._listen_id:
+            self.close()
@@ -0,0 +1,598 @@
+"""Multi-process sharded holepunch server.
+
+Sharded holepunch server forks worker processes, each running a
+holepunch.server.Server bound on the same address with SO_REUSEPORT so the
+kernel spreads incoming clients across workers. The parent process is a broker
+holding the shared peer table of listening clients. A worker publishes its
+listening clients to the broker and, when a connect request cannot be served
+locally, asks the broker to introduce the client to a listening client parked on
+another worker.
+
+Broker and workers exchange datagrams over a unix socket pair per worker. In
+relay mode the broker runs the relay (see holepunch.relay), so both clients of
+an introduction are relayed by the same process whichever worker accepted
+them. Each worker holds a slot from 0 to workers - 1, kept by its replacement,
+and exports its metrics on the metrics port offset by its slot.
+
+Messages:
+
+    +--------------------------------+-------------------+--------------------------------------+
+    | Message                        | Direction         | Description                          |
+    +================================+===================+======================================+
+    | + host port                    | worker -> broker  | publish listening client             |
+    +--------------------------------+-------------------+--------------------------------------+
+    | - host port                    | worker -> broker  | unpublish listening client           |
+    +--------------------------------+-------------------+--------------------------------------+
+    | & relay                        | worker -> broker  | issue relay token                    |
+    +--------------------------------+-------------------+--------------------------------------+
+    | > token host src_host src_port | any               | introduce src to listening host      |
+    | src_delta relay                |                   | with relay token                     |
+    +--------------------------------+-------------------+--------------------------------------+
+    | \\* token host port delta relay | any               | introduced to (host, port)           |
+    +--------------------------------+-------------------+--------------------------------------+
+    | ? token                        | any               | listening host not found             |
+    +--------------------------------+-------------------+--------------------------------------+
+
+Example:
+    Server::
+
+        $ python -m holepunch server --workers 4
+"""
+
+
+import itertools
+import logging
+import os
+import signal
+import socket
+import time
+
+import holepunch.loop
+import holepunch.message
+import holepunch.relay
+import holepunch.server
+import holepunch.trace
+import holepunch.tuning
+
+
+# Number of fields of each channel message
+FIELDS = {"+": 3, "-": 3, "&": 2, ">": 7, "*": 6, "?": 2}
+
+
+def encode(*fields):
+    """Encode channel message.
+
+    Args:
+        fields: Message fields.
+
+    Returns:
+        data: Message as bytes.
+    """
+
+    return " ".join(str(field) for field in fields).encode("ascii")
+
+
+def decode(data):
+    """Decode channel message.
+
+    Args:
+        data: Message as bytes.
+
+    Returns:
+        fields: List of message fields as strings.
+    """
+
+    return data.decode("ascii").split(" ")
+
+
+def valid(host):
+    """Check host address of a connect request.
+
+    Host is sent unchecked by the client and must be a literal IPv4 or IPv6
+    address before it is written in a channel message.
+
+    Args:
+        host: Host address.
+
+    Returns:
+        valid: True if host is an IPv4 or IPv6 address.
+    """
+
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+        except (OSError, ValueError):
+            continue
+        return True
+
+    return False
+
+
+class Broker:
+    """Sharded holepunch server broker.
+
+    Broker forks and supervises workers and routes introductions between them.
+    Broker keeps the shared peer table of listening clients published by
+    workers; a worker that exits is respawned, its listening clients are
+    dropped from the table and introductions pending on it are answered not
+    found (?). Worker messages with the wrong number of fields are dropped.
+
+    Attributes:
+        _workers: Number of worker processes.
+        _udp: True if workers also accept UDP datagram requests.
+        _metrics: True if workers export their metrics.
+        _loop: Event loop.
+        _channels: Broker side of worker channels by worker process id.
+        _hosts: Peer table, listening host to (host, port) to worker channel.
+        _pending: Forwarded introductions, token to (channel, token, owner
+        channel).
+        _tokens: Introduction token generator.
+        _relay: Relay of clients whose punch failed or None.
+    """
+
+    def __init__(self, workers=None, udp=False, relay=False, metrics=False):
+        """Initialise broker.
+
+        Args:
+            workers: Number of worker processes. If workers is None then the
+            workers of the tuning profile are used.
+            udp: If True then workers also accept UDP datagram requests.
+            relay: If True then workers issue relay tokens and broker relays
+            clients whose punch failed.
+            metrics: If True then each worker exports its metrics.
+        """
+
+        self._workers = holepunch.tuning.PROFILE.workers if workers is None else workers
+        self._udp = udp
+        self._metrics = metrics
+        self._loop = holepunch.loop.Loop()
+        self._relay = holepunch.relay.Relay(self._loop) if relay else None
+        self._channels = {}
+        self._hosts = {}
+        self._pending = {}
+        self._tokens = itertools.count()
+
+    def spawn(self, slot):
+        """Spawn worker process.
+
+        Fork worker process running a holepunch server connected to the broker
+        through a unix socket pair.
+
+        Args:
+            slot: Worker slot.
+        """
+
+        sock, worker_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+        pid = os.fork()
+
+        if pid == 0: # Worker process
+            sock.close()
+            for channel in self._channels.values():
+                channel.close()
+            if self._relay is not None:
+                self._relay.detach()
+            self._loop.close()
+
+            status = 0
+            try:
+                holepunch.server.Server(channel=Channel(worker_sock, slot), udp=self._udp, relay=self._relay is not None, metrics=self._metrics).run()
+            except Exception:
+                logging.exception("Worker %s failed", os.getpid())
+                status = 1
+            finally:
+                holepunch.trace.TRACER.close()
+                os._exit(status)
+
+        worker_sock.close()
+
+        channel = BrokerChannel(self, sock, pid, slot)
+        self._channels[pid] = channel
+        self._loop.register(channel, holepunch.loop.EVENT_READ, channel.handle)
+
+        logging.info("Spawn worker %s", pid)
+
+    def reap(self, channel):
+        """Reap exited worker process.
+
+        Drop listening clients of worker from the peer table, answer not found
+        (?) to the introductions forwarded to worker, drop the introductions
+        requested by worker, wait for worker process and spawn a replacement.
+
+        Args:
+            channel: Broker side of the exited worker channel.
+        """
+
+        for host in list(self._hosts):
+            clients = self._hosts[host]
+            for addr in [a for a, c in clients.items() if c is channel]:
+                del clients[addr]
+            if not clients:
+                del self._hosts[host]
+
+        for forward_token, (requester, token, owner) in list(self._pending.items()):
+            if requester is channel:
+                del self._pending[forward_token]
+            elif owner is channel:
+                del self._pending[forward_token]
+                requester.send(encode("?", token))
+
+        self._loop.unregister(channel)
+        channel.close()
+        del self._channels[channel.pid]
+
+        os.waitpid(channel.pid, 0)
+
+        logging.info("Reap worker %s", channel.pid)
+
+        self.spawn(channel.slot)
+
+    def publish(self, channel, host, port):
+        """Publish listening client of worker.
+
+        Args:
+            channel: Broker side of the worker channel.
+            host: Listening client host address.
+            port: Listening client port address.
+        """
+
+        self._hosts.setdefault(host, {})[(host, port)] = channel
+
+    def unpublish(self, channel, host, port):
+        """Unpublish listening client of worker.
+
+        Args:
+            channel: Broker side of the worker channel.
+            host: Listening client host address.
+            port: Listening client port address.
+        """
+
+        clients = self._hosts.get(host, {})
+        if clients.get((host, port)) is channel:
+            del clients[(host, port)]
+            if not clients:
+                del self._hosts[host]
+
+    def issue(self, relay):
+        """Issue relay token of an introduction on the relay.
+
+        Args:
+            relay: Relay token.
+        """
+
+        if self._relay is not None:
+            self._relay.issue(relay)
+
+    def introduce(self, channel, token, host, src_host, src_port, src_delta, relay):
+        """Route introduction to worker of listening client.
+
+        Args:
+            channel: Broker side of the requesting worker channel.
+            token: Requesting worker introduction token.
+            host: Listening client host address.
+            src_host: Connecting client host address.
+            src_port: Connecting client port address.
+            src_delta: Connecting client NAT port delta.
+            relay: Relay token of introduction.
+        """
+
+        clients = self._hosts.get(host)
+
+        if not clients:
+            channel.send(encode("?", token))
+            return
+
+        owner = next(iter(clients.values()))
+
+        forward_token = next(self._tokens)
+        self._pending[forward_token] = (channel, token, owner)
+        owner.send(encode(">", forward_token, host, src_host, src_port, src_delta, relay))
+
+    def reply(self, fields):
+        """Route introduction reply to requesting worker.
+
+        Args:
+            fields: Holepunch (*) or not found (?) reply fields.
+        """
+
+        channel, token, _ = self._pending.pop(int(fields[1]), (None, None, None))
+
+        if channel is not None and channel.pid in self._channels:
+            channel.send(encode(fields[0], token, *fields[2:]))
+
+    def run(self):
+        """Run sharded holepunch server.
+
+        Open relay, spawn workers and route messages until KeyboardInterrupt,
+        then terminate workers.
+        """
+
+        if self._relay is not None:
+            self._relay.open()
+
+        for slot in range(self._workers):
+            self.spawn(slot)
+
+        try:
+            self._loop.run()
+        except KeyboardInterrupt:
+            pass
+
+        for pid, channel in list(self._channels.items()):
+            self._loop.unregister(channel)
+            channel.close()
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+
+        if self._relay is not None:
+            self._relay.close()
+
+        self._loop.close()
+
+
+class BrokerChannel:
+    """Broker side of worker channel.
+
+    Attributes:
+        _broker: Broker.
+        _sock: Broker side of the unix socket pair.
+        _pid: Worker process id.
+        _slot: Worker slot.
+    """
+
+    @property
+    def pid(self):
+        """Pid accessor."""
+        return self._pid
+
+    @property
+    def slot(self):
+        """Slot accessor."""
+        return self._slot
+
+    def __init__(self, broker, sock, pid, slot):
+        """Initialise broker channel."""
+
+        self._broker = broker
+        self._sock = sock
+        self._pid = pid
+        self._slot = slot
+
+    def fileno(self):
+        """Get channel socket file descriptor.
+
+        Returns:
+            file_descriptor: Channel socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def close(self):
+        """Close channel socket."""
+
+        self._sock.close()
+
+    def send(self, data):
+        """Send message to worker.
+
+        Args:
+            data: Message as bytes.
+        """
+
+        self._sock.send(data)
+
+    def handle(self, events=holepunch.loop.EVENT_READ):
+        """Handle worker message.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        data = self._sock.recv(4096)
+
+        if not data: # Worker exited
+            self._broker.reap(self)
+            return
+
+        try:
+            fields = decode(data)
+
+            if FIELDS.get(fields[0]) != len(fields):
+                raise ValueError("Wrong number of fields")
+
+            if fields[0] == "+":
+                self._broker.publish(self, fields[1], int(fields[2]))
+            elif fields[0] == "-":
+                self._broker.unpublish(self, fields[1], int(fields[2]))
+            elif fields[0] == "&":
+                self._broker.issue(int(fields[1]))
+            elif fields[0] == ">":
+                self._broker.introduce(self, *fields[1:])
+            elif fields[0] in ("*", "?"):
+                self._broker.reply(fields)
+        except ValueError as e: # Drop malformed message
+            logging.warning("Drop worker %s message %r: %s", self._pid, data, e)
+
+
+class Channel:
+    """Worker side of broker channel.
+
+    Worker side of broker channel used by holepunch.server.Server to share its
+    listening clients with other workers and to introduce its connecting clients
+    to listening clients of other workers.
+
+    Attributes:
+        _server: Holepunch server.
+        _sock: Worker side of the unix socket pair.
+        _slot: Worker slot.
+        _published: Published listening clients.
+        _pending: Pending introductions, token to connecting client, request
+            id and connect request clock time.
+        _tokens: Introduction token generator.
+    """
+
+    @property
+    def slot(self):
+        """Slot accessor."""
+        return self._slot
+
+    def __init__(self, sock, slot=0):
+        """Initialise channel.
+
+        Args:
+            sock: Worker side of the unix socket pair.
+            slot: Worker slot.
+        """
+
+        self._server = None
+        self._sock = sock
+        self._slot = slot
+        self._published = set()
+        self._pending = {}
+        self._tokens = itertools.count()
+
+    def fileno(self):
+        """Get channel socket file descriptor.
+
+        Returns:
+            file_descriptor: Channel socket file descriptor.
+        """
+
+        return self._sock.fileno()
+
+    def open(self, server):
+        """Open channel.
+
+        Register channel in server event loop.
+
+        Args:
+            server: Holepunch server.
+        """
+
+        self._server = server
+        self._server.loop.register(self, holepunch.loop.EVENT_READ, self.handle)
+
+    def close(self):
+        """Close channel.
+
+        Unregister channel from server event loop and close socket.
+        """
+
+        self._server.loop.unregister(self)
+        self._sock.close()
+
+    def publish(self, client):
+        """Publish listening client to broker.
+
+        Args:
+            client: Listening server-client.
+        """
+
+        if client not in self._published:
+            self._published.add(client)
+            self._sock.send(encode("+", client.addr[0], client.addr[1]))
+
+    def unpublish(self, client):
+        """Unpublish listening client from broker.
+
+        Args:
+            client: Server-client.
+        """
+
+        if client in self._published:
+            self._published.remove(client)
+            self._sock.send(encode("-", client.addr[0], client.addr[1]))
+
+    def issue(self, relay):
+        """Issue relay token on the relay of the broker.
+
+        Args:
+            relay: Relay token.
+        """
+
+        self._sock.send(encode("&", relay))
+
+    def introduce(self, client, request, start=None):
+        """Request introduction of connecting client to a remote listening client.
+
+        Connecting client will receive a holepunch (*) or not found (?) response
+        when the broker replies, or a not found (?) response at once if its
+        destination host is not an IP address.
+
+        Args:
+            client: Connecting server-client.
+            request: Connect (>dest_host) request.
+            start: Performance counter time the connect request was received.
+            If start is None then the current time is used.
+        """
+
+        if not valid(request.body):
+            # Send client not found response
+            response = holepunch.message.Message(method="?", id=request.id)
+            client.send(response)
+
+            self._server.metrics.not_found.inc()
+            return
+
+        token = next(self._tokens)
+        self._pending[token] = (client, request.id, time.perf_counter() if start is None else start)
+        self._sock.send(encode(">", token, request.body, *self._server.mapping(client.addr, self._server.token(client))))
+
+    def handle(self, events=holepunch.loop.EVENT_READ):
+        """Handle broker message.
+
+        Args:
+            events: Ready events mask.
+        """
+
+        data = self._sock.recv(4096)
+
+        if not data: # Broker exited
+            self._server.loop.stop()
+            return
+
+        fields = decode(data)
+
+        if FIELDS.get(fields[0]) != len(fields): # Drop malformed message
+            logging.warning("Drop broker message %r", data)
+            return
+
+        if fields[0] == ">": # Introduce remote connecting client
+            token, host = fields[1], fields[2]
+            src_host, src_port, src_delta, relay = fields[3], int(fields[4]), int(fields[5]), int(fields[6])
+
+            client = self._server.find_client(host=host)
+
+            if client in self._published:
+                if client.codec is not holepunch.message.BINARY:
+                    relay = 0
+
+                # Send holepunch response to listen client
+                response = holepunch.message.Message(method="*", body=(src_host, src_port, src_delta, relay), id=client.listen_id)
+                client.send(response)
+
+                self._sock.send(encode("*", token, *self._server.mapping(client.addr, relay)))
+            else:
+                self._sock.send(encode("?", token))
+
+        elif fields[0] in ("*", "?"): # Introduction reply
+            client, id, start = self._pending.pop(int(fields[1]), (None, 0, 0))
+
+            if client is None or client.addr is None: # Connecting client closed
+                return
+
+            if fields[0] == "*":
+                # Send holepunch response to connect client
+                response = holepunch.message.Message(method="*", body=(fields[2], int(fields[3]), int(fields[4]), int(fields[5])), id=id)
+                client.send(response)
+
+                self._server.metrics.introduce(time.perf_counter() - start)
+            else:
+                # Send client not found response
+                response = holepunch.message.Message(method="?", id=id)
+                client.send(response)
+
+                self._server.metrics.not_found.inc()
@@ -0,0 +1,210 @@
+"""Hierarchical timer wheel for the event loop.
+
+Timer wheel keeps timers in slots of wheels of increasing granularity. The
+first wheel has a slot per tick, each following wheel has a slot per full turn
+of the previous wheel. Scheduling and cancelling a timer is O(1) and advancing
+one tick is O(1) plus the number of timers expired or cascaded to a finer
+wheel, independent of the number of timers scheduled.
+
+Example:
+    TimerWheel::
+
+        timers = holepunch.timer.TimerWheel()
+        timer = timers.schedule(30, callback)
+        timers.advance() # Call callbacks of expired timers
+        timer.cancel()
+"""
+
+
+import math
+import time
+
+
+class Timer:
+    """Timer scheduled in a timer wheel.
+
+    Attributes:
+        _wheel: Timer wheel.
+        _expires: Tick on which timer expires.
+        _callback: Callable called when timer expires.
+        _slot: Slot of timer wheel holding timer or None.
+    """
+
+    __slots__ = ("_wheel", "_expires", "_callback", "_slot")
+
+    @property
+    def expires(self):
+        """Expires accessor."""
+        return self._expires
+
+    @property
+    def callback(self):
+        """Callback accessor."""
+        return self._callback
+
+    def __init__(self, wheel, expires, callback):
+        """Initialise timer.
+
+        Args:
+            wheel: Timer wheel.
+            expires: Tick on which timer expires.
+            callback: Callable called when timer expires.
+        """
+
+        self._wheel = wheel
+        self._expires = expires
+        self._callback = callback
+        self._slot = None
+
+    def cancel(self):
+        """Cancel timer.
+
+        Remove timer from its slot. Cancelling an expired or cancelled timer
+        has no effect.
+        """
+
+        if self._slot is not None:
+            self._slot.discard(self)
+            self._slot = None
+            self._wheel._count -= 1
+
+
+class TimerWheel:
+    """Hierarchical timer wheel.
+
+    Attributes:
+        _resolution: Seconds per tick.
+        _bits: Bits of slot index per wheel.
+        _wheels: Wheels, each a list of slots, each a set of timers.
+        _clock: Monotonic clock returning seconds.
+        _start: Clock time of tick 0.
+        _tick: Current tick.
+        _count: Number of scheduled timers.
+    """
+
+    def __init__(self, resolution=0.1, bits=8, levels=4, clock=time.monotonic):
+        """Initialise timer wheel.
+
+        Args:
+            resolution: Seconds per tick.
+            bits: Bits of slot index per wheel, each wheel has 2 ** bits slots.
+            levels: Number of wheels.
+            clock: Monotonic clock returning seconds.
+        """
+
+        self._resolution = resolution
+        self._bits = bits
+        self._wheels = [[set() for _ in range(1 << bits)] for _ in range(levels)]
+        self._clock = clock
+        self._start = clock()
+        self._tick = 0
+        self._count = 0
+
+    def __len__(self):
+        """__len__ overload."""
+        return self._count
+
+    def _insert(self, timer):
+        """Insert timer in the slot of the finest wheel covering its expiry.
+
+        Args:
+            timer: Timer to insert.
+        """
+
+        delta = timer.expires - self._tick
+        mask = (1 << self._bits) - 1
+
+        for level, wheel in enumerate(self._wheels):
+            if delta < 1 << (self._bits * (level + 1)) or level == len(self._wheels) - 1:
+                break
+
+        if delta >= 1 << (self._bits * (level + 1)):
+            # Beyond the last wheel, park in the furthest slot and cascade again
+            expires = self._tick + (1 << (self._bits * (level + 1))) - 1
+        else:
+            expires = timer.expires
+
+        slot = wheel[(expires >> (self._bits * level)) & mask]
+        slot.add(timer)
+        timer._slot = slot
+
+    def schedule(self, delay, callback):
+        """Schedule timer.
+
+        Args:
+            delay: Seconds until timer expires.
+            callback: Callable called when timer expires.
+
+        Returns:
+            timer: Scheduled timer.
+        """
+
+        now = (self._clock() - self._start) / self._resolution
+        expires = max(math.ceil(now + delay / self._resolution), self._tick + 1)
+
+        timer = Timer(self, expires, callback)
+        self._insert(timer)
+        self._count += 1
+
+        return timer
+
+    def timeout(self):
+        """Get seconds until next tick.
+
+        Returns:
+            timeout: Seconds until next tick or None if no timer is scheduled.
+        """
+
+        if not self._count:
+            return None
+
+        deadline = self._start + (self._tick + 1) * self._resolution
+        return max(deadline - self._clock(), 0)
+
+    def _step(self):
+        """Advance one tick.
+
+        Cascade timers of coarser wheels whose turn is reached and expire the
+        timers of the current slot of the first wheel.
+        """
+
+        self._tick += 1
+
+        mask = (1 << self._bits) - 1
+
+        for level in range(1, len(self._wheels)):
+            if self._tick & ((1 << (self._bits * level)) - 1):
+                break
+
+            index = (self._tick >> (self._bits * level)) & mask
+            slot = self._wheels[level][index]
+            self._wheels[level][index] = set()
+
+            for timer in slot:
+                self._insert(timer)
+
+        index = self._tick & mask
+        slot = self._wheels[0][index]
+        self._wheels[0][index] = set()
+
+        # Timers cancelled by callbacks of the same slot are removed and skipped
+        while slot:
+            timer = slot.pop()
+            timer._slot = None
+            self._count -= 1
+            timer.callback()
+
+    def advance(self):
+        """Advance timer wheel to the current clock time.
+
+        Call callbacks of all expired timers.
+        """
+
+        tick = int((self._clock() - self._start) / self._resolution)
+
+        if not self._count:
+            self._tick = max(self._tick, tick)
+            return
+
+        while self._tick < tick:
+            self._step()
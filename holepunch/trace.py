@@ -0,0 +1,289 @@
+"""Low-overhead event tracing and logging off the event loop thread.
+
+Hot paths of the server record trace events instead of logging them. A trace
+event is a name and structured fields appended as a tuple to a bounded ring;
+nothing is formatted and no lock is taken by the event loop, and only one
+event of every sample is recorded. Log records of the logging module are put
+in the same ring by a queue handler.
+
+A background listener thread drains the ring, turns trace events into log
+records of the holepunch.trace logger and passes every record to the
+handlers, so formatting and i/o never run on the event loop thread. When the
+ring is full the oldest record is dropped.
+
+Logging level and sampling are configured at runtime with configure. Trace
+events are recorded while the holepunch.trace logger is enabled for INFO.
+
+Example:
+    Tracer::
+
+        holepunch.trace.TRACER.open()
+        holepunch.trace.TRACER.configure(level="INFO", sample=100)
+        holepunch.trace.event("Open server-client", addr=("203.0.113.7", 40001))
+"""
+
+
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+import holepunch.config
+
+
+FORMAT = "%(asctime)s %(levelname)s: %(message)s"
+
+LOGGER = "holepunch.trace"
+
+
+class Ring:
+    """Bounded ring of records dropping the oldest when full.
+
+    Ring is the queue of the queue handler and listener. Records are
+    appended without lock and the listener polls for them.
+
+    Attributes:
+        _items: Records, oldest first.
+        _interval: Seconds the listener sleeps while ring is empty.
+        _dropped: Number of records dropped.
+    """
+
+    @property
+    def dropped(self):
+        """Dropped accessor."""
+        return self._dropped
+
+    def __init__(self, size=None, interval=None):
+        """Initialise ring.
+
+        Args:
+            size: Maximum number of records. If size is None then the size
+            configured in the config file is used.
+            interval: Seconds the listener sleeps while ring is empty. If
+            interval is None then the interval configured in the config file
+            is used.
+        """
+
+        self._items = collections.deque(maxlen=holepunch.config.TRACE_BUFFER if size is None else size)
+        self._interval = holepunch.config.TRACE_FLUSH if interval is None else interval
+        self._dropped = 0
+
+    def __len__(self):
+        """__len__ overload."""
+        return len(self._items)
+
+    def put_nowait(self, item):
+        """Append record, dropping the oldest if ring is full.
+
+        Args:
+            item: Log record, trace event tuple or None sentinel.
+        """
+
+        if len(self._items) == self._items.maxlen:
+            self._dropped += 1
+
+        self._items.append(item)
+
+    def get(self, block=True):
+        """Remove oldest record.
+
+        Args:
+            block: If True then wait until a record is appended.
+
+        Returns:
+            item: Oldest record.
+
+        Raises:
+            queue.Empty: If block is False and ring is empty.
+        """
+
+        while True:
+            try:
+                return self._items.popleft()
+            except IndexError:
+                if not block:
+                    raise queue.Empty
+                time.sleep(self._interval)
+
+    def clear(self):
+        """Remove every record."""
+
+        self._items.clear()
+
+
+class Listener(logging.handlers.QueueListener):
+    """Queue listener turning trace events into log records."""
+
+    def prepare(self, record):
+        """Prepare record for handling.
+
+        Args:
+            record: Log record or trace event tuple.
+
+        Returns:
+            record: Log record with trace fields in its trace attribute.
+        """
+
+        if isinstance(record, logging.LogRecord):
+            return record
+
+        created, name, fields = record
+
+        msg = name + "".join(" {0}={1}".format(key, value) for key, value in fields.items())
+
+        record = logging.LogRecord(LOGGER, logging.INFO, "", 0, msg, None, None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        record.trace = fields
+
+        return record
+
+
+class Tracer:
+    """Sampled event tracer.
+
+    Attributes:
+        _ring: Ring of records.
+        _handlers: Handlers of the listener.
+        _handler: Queue handler of the root logger or None.
+        _listener: Listener thread or None if tracer is not open.
+        _sample: One event of every sample is recorded.
+        _count: Events since the last recorded event.
+        _enabled: True if events are recorded.
+    """
+
+    @property
+    def ring(self):
+        """Ring accessor."""
+        return self._ring
+
+    @property
+    def sample(self):
+        """Sample accessor."""
+        return self._sample
+
+    @property
+    def enabled(self):
+        """Enabled accessor."""
+        return self._enabled
+
+    def __init__(self):
+        """Initialise tracer."""
+
+        self._ring = Ring()
+        self._handlers = ()
+        self._handler = None
+        self._listener = None
+        self._sample = holepunch.config.TRACE_SAMPLE
+        self._count = 0
+        self._enabled = False
+
+    def open(self, *handlers):
+        """Open tracer.
+
+        Put log records of the root logger in the ring and start the listener
+        thread. Listener thread is restarted in forked child processes.
+
+        Args:
+            handlers: Handlers of log records. If no handler is given then
+            records are written to standard error.
+        """
+
+        if self._listener is not None: # Tracer open
+            return
+
+        if not handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(FORMAT))
+            handlers = (handler,)
+
+        if self._handler is None: # First open
+            os.register_at_fork(after_in_child=self.fork)
+            atexit.register(self.close)
+
+        self._handlers = handlers
+        self._handler = logging.handlers.QueueHandler(self._ring)
+
+        root = logging.getLogger()
+        root.addHandler(self._handler)
+        root.setLevel(holepunch.config.LOG_LEVEL)
+
+        self.start()
+        self.configure()
+
+    def start(self):
+        """Start listener thread."""
+
+        self._listener = Listener(self._ring, *self._handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def fork(self):
+        """Restart listener thread in forked child process.
+
+        Records pending in the ring are dropped, they are flushed by the
+        parent process.
+        """
+
+        if self._listener is not None:
+            self._ring.clear()
+            self.start()
+
+    def close(self):
+        """Close tracer.
+
+        Stop recording, flush pending records and stop listener thread.
+        """
+
+        if self._listener is not None:
+            logging.getLogger().removeHandler(self._handler)
+            self._enabled = False
+
+            self._listener.stop()
+            self._listener = None
+
+    def configure(self, level=None, sample=None):
+        """Configure logging level and sampling.
+
+        Args:
+            level: Logging level of the root logger, name or number. If level
+            is None then the level is unchanged.
+            sample: One event of every sample is recorded. If sample is None
+            then the sampling is unchanged.
+        """
+
+        if level is not None:
+            logging.getLogger().setLevel(level)
+
+        if sample is not None:
+            self._sample = max(int(sample), 1)
+            self._count = 0
+
+        self._enabled = self._listener is not None and logging.getLogger(LOGGER).isEnabledFor(logging.INFO)
+
+    def event(self, name, **fields):
+        """Record trace event.
+
+        Args:
+            name: Event name.
+            fields: Event fields, immutable values as they are formatted later
+            by the listener thread.
+        """
+
+        if not self._enabled:
+            return
+
+        self._count += 1
+        if self._count < self._sample:
+            return
+
+        self._count = 0
+        self._ring.put_nowait((time.time(), name, fields))
+
+
+# Tracer of the process
+TRACER = Tracer()
+
+event = TRACER.event
@@ -0,0 +1,219 @@
+"""Bulk file transfer over client-client P2P stream sockets.
+
+Sender offers a file in a frame, receiver answers with the offset it already
+holds and sender streams the remaining bytes with sendfile (zero-copy from the
+page cache, memory-mapped reads where sendfile is unavailable). Receiver maps
+the destination file and receives directly into the mapping with recv_into,
+then acknowledges the final offset. An interrupted receiver truncates the
+destination file to the bytes received, so a new transfer of the same file
+resumes from there.
+
+Transfer:
+
+    +-------------+-----------+------------------------------------------+
+    | Direction   | Message   | Content                                  |
+    +=============+===========+==========================================+
+    | sender      | offer     | frame, 8 bytes file size and file name   |
+    +-------------+-----------+------------------------------------------+
+    | receiver    | resume    | frame, 8 bytes offset already received   |
+    +-------------+-----------+------------------------------------------+
+    | sender      | data      | raw file bytes from offset to file size  |
+    +-------------+-----------+------------------------------------------+
+    | receiver    | done      | frame, 8 bytes final offset              |
+    +-------------+-----------+------------------------------------------+
+
+Report:
+
+    +-------------+------------------------------------------------------+
+    | Field       | Description                                          |
+    +=============+======================================================+
+    | path        | file path                                            |
+    +-------------+------------------------------------------------------+
+    | size        | file size in bytes                                   |
+    +-------------+------------------------------------------------------+
+    | offset      | offset the transfer resumed from                     |
+    +-------------+------------------------------------------------------+
+    | bytes       | bytes transferred                                    |
+    +-------------+------------------------------------------------------+
+    | elapsed     | seconds from offer to done                           |
+    +-------------+------------------------------------------------------+
+    | throughput  | bytes transferred per second                         |
+    +-------------+------------------------------------------------------+
+
+Example:
+    Sending client::
+
+        client = holepunch.client.TCPClient()
+        client.open(dest_host)
+        report = client.send_file("/path/to/file")
+
+    Receiving client::
+
+        client = holepunch.client.TCPClient()
+        client.open()
+        report = client.recv_file("/path/to/directory")
+"""
+
+
+import logging
+import mmap
+import os
+import struct
+import time
+
+
+OFFER = struct.Struct("!Q")
+OFFSET = struct.Struct("!Q")
+
+
+def report(path, size, offset, end, start):
+    """Get transfer report.
+
+    Args:
+        path: File path.
+        size: File size in bytes.
+        offset: Offset the transfer resumed from.
+        end: Offset the transfer ended at.
+        start: Transfer start clock time.
+
+    Returns:
+        report: Transfer report.
+    """
+
+    elapsed = time.monotonic() - start
+
+    return {
+        "path": path,
+        "size": size,
+        "offset": offset,
+        "bytes": end - offset,
+        "elapsed": elapsed,
+        "throughput": (end - offset) / elapsed if elapsed else None,
+    }
+
+
+def recv_offset(client):
+    """Receive offset frame.
+
+    Args:
+        client: Client with an open client-client stream socket.
+
+    Returns:
+        offset: Offset received.
+
+    Raises:
+        ConnectionError: If socket is closed or frame is malformed.
+    """
+
+    payload = client.recv_frame()
+
+    if payload is None or len(payload) != OFFSET.size:
+        raise ConnectionError("Transfer interrupted")
+
+    offset, = OFFSET.unpack(payload)
+    return offset
+
+
+def send_file(client, path):
+    """Send file to peer.
+
+    Offer file, then send it from the offset the peer already holds with
+    sendfile and wait for the peer to acknowledge the end of file.
+
+    Args:
+        client: Client with an open client-client stream socket.
+        path: Path of file to send.
+
+    Returns:
+        report: Transfer report.
+
+    Raises:
+        ConnectionError: If transfer is interrupted or refused.
+    """
+
+    start = time.monotonic()
+
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        client.send_frame(OFFER.pack(size), os.path.basename(path).encode("utf-8"))
+
+        offset = recv_offset(client)
+        if offset > size:
+            raise ConnectionError("Transfer refused at offset {0}".format(offset))
+
+        logging.info("Send %s from offset %d of %d bytes", path, offset, size)
+
+        if offset < size:
+            if hasattr(os, "sendfile"):
+                client.sock.sendfile(file, offset, size - offset)
+            else:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    with memoryview(mapping) as view:
+                        client.sock.sendall(view[offset:])
+
+    if recv_offset(client) != size:
+        raise ConnectionError("Transfer interrupted")
+
+    return report(path, size, offset, size, start)
+
+
+def recv_file(client, path):
+    """Receive file from peer.
+
+    Receive file offer, resume from the size of an existing destination file
+    and receive the remaining bytes into a memory mapping of the destination
+    file. A destination file larger than the offered file is overwritten. The
+    destination file is truncated to the bytes received if the transfer is
+    interrupted.
+
+    Args:
+        client: Client with an open client-client stream socket.
+        path: Destination file path or directory to receive the offered file
+        name into.
+
+    Returns:
+        report: Transfer report.
+
+    Raises:
+        ConnectionError: If transfer is interrupted.
+    """
+
+    start = time.monotonic()
+
+    payload = client.recv_frame()
+    if payload is None or len(payload) < OFFER.size:
+        raise ConnectionError("Transfer interrupted")
+
+    size, = OFFER.unpack_from(payload)
+    if os.path.isdir(path):
+        path = os.path.join(path, os.path.basename(bytes(payload[OFFER.size:]).decode("utf-8")))
+
+    with open(path, "a+b") as file:
+        offset = os.fstat(file.fileno()).st_size
+        if offset > size: # Destination is not a part of the offered file
+            offset = 0
+        end = offset
+
+        logging.info("Receive %s from offset %d of %d bytes", path, offset, size)
+
+        client.send_frame(OFFSET.pack(offset))
+
+        try:
+            if offset < size:
+                file.truncate(size)
+
+                with mmap.mmap(file.fileno(), size) as mapping:
+                    with memoryview(mapping) as view:
+                        while end < size:
+                            received = client.sock.recv_into(view[end:])
+                            if not received: # Socket closed
+                                raise ConnectionError("Transfer interrupted")
+
+                            end += received
+        finally:
+            # Keep bytes received for a resumed transfer
+            file.truncate(end)
+
+    client.send_frame(OFFSET.pack(end))
+
+    return report(path, size, offset, end, start)
@@ -0,0 +1,353 @@
+"""Performance tuning profiles of server and client sockets.
+
+A tuning profile holds the socket options applied to every listening, stream
+and datagram socket of the holepunch server, the holepunch client and the
+client-client punch sockets, with the number of sharded server workers:
+
+    +--------------------+---------------------------------------------------+
+    | Option             | Description                                       |
+    +====================+===================================================+
+    | backlog            | listening socket backlog of pending connections   |
+    +--------------------+---------------------------------------------------+
+    | sndbuf, rcvbuf     | socket send and receive buffer sizes in bytes,    |
+    |                    | 0 keeps the system default                        |
+    +--------------------+---------------------------------------------------+
+    | nodelay            | disable Nagle algorithm of stream sockets         |
+    +--------------------+---------------------------------------------------+
+    | fastopen           | TCP fast open queue length of listening sockets,  |
+    |                    | fast open connect of client-server sockets, 0 off |
+    +--------------------+---------------------------------------------------+
+    | keepalive          | seconds idle before keepalive probes, 0 off       |
+    +--------------------+---------------------------------------------------+
+    | keepalive_interval | seconds between keepalive probes, 0 keeps the     |
+    |                    | system default                                    |
+    +--------------------+---------------------------------------------------+
+    | keepalive_count    | unanswered probes before close, 0 keeps the       |
+    |                    | system default                                    |
+    +--------------------+---------------------------------------------------+
+    | workers            | sharded server worker processes, 0 one per cpu    |
+    +--------------------+---------------------------------------------------+
+    | nofile             | open file descriptor soft limit raised when the   |
+    |                    | server opens, -1 the hard limit, 0 keeps the      |
+    |                    | process limit                                     |
+    +--------------------+---------------------------------------------------+
+
+Options of a listening socket are inherited by the sockets it accepts.
+Profile is built from a preset, then overridden by a JSON file, the
+environment and the command line, in this order:
+
+    +----------------------------------+-------------------------------------+
+    | Source                           | Content                             |
+    +==================================+=====================================+
+    | preset                           | "default", "low-latency" or         |
+    |                                  | "high-fanout"                       |
+    +----------------------------------+-------------------------------------+
+    | file                             | JSON object of options, "profile"   |
+    |                                  | names its preset                    |
+    +----------------------------------+-------------------------------------+
+    | HOLEPUNCH_TUNING,                | preset, file and option of the      |
+    | HOLEPUNCH_TUNING_FILE,           | environment                         |
+    | HOLEPUNCH_TUNING_<OPTION>        |                                     |
+    +----------------------------------+-------------------------------------+
+    | --profile, --tuning-file,        | preset, file and option of the      |
+    | --tune option=value              | command line                        |
+    +----------------------------------+-------------------------------------+
+
+Example:
+    Server::
+
+        $ python -m holepunch server --profile high-fanout --tune backlog=4096
+
+    Profile::
+
+        holepunch.tuning.load("low-latency")
+        holepunch.tuning.PROFILE.listen(sock)
+"""
+
+
+import json
+import logging
+import os
+import resource
+import socket
+import sys
+
+import holepunch.config
+
+
+TCP_FASTOPEN_CONNECT = getattr(socket, "TCP_FASTOPEN_CONNECT", 30 if sys.platform.startswith("linux") else None)
+
+ENV = "HOLEPUNCH_TUNING"
+
+PRESETS = {
+    "default": {
+        "backlog": holepunch.config.LISTEN_BACKLOG,
+        "sndbuf": 0,
+        "rcvbuf": 0,
+        "nodelay": False,
+        "fastopen": 0,
+        "keepalive": 0,
+        "keepalive_interval": 0,
+        "keepalive_count": 0,
+        "workers": 1,
+        "nofile": 0,
+    },
+    # Requests answered without Nagle or handshake delays by a single process,
+    # no introduction crosses the shard broker, dead peers are detected fast
+    "low-latency": {
+        "nodelay": True,
+        "fastopen": 256,
+        "keepalive": 10,
+        "keepalive_interval": 2,
+        "keepalive_count": 3,
+    },
+    # Many parked connections with small buffers spread across one worker per
+    # cpu, bursts of reconnects absorbed by a long backlog and fast open
+    "high-fanout": {
+        "backlog": 65535,
+        "sndbuf": 16384,
+        "rcvbuf": 16384,
+        "fastopen": 4096,
+        "keepalive": 60,
+        "keepalive_interval": 10,
+        "keepalive_count": 5,
+        "workers": 0,
+        "nofile": -1,
+    },
+}
+
+
+def parse(option, value):
+    """Parse option value of the environment or the command line.
+
+    Args:
+        option: Option name.
+        value: Option value as string, or already typed.
+
+    Returns:
+        value: Option value of the option type.
+
+    Raises:
+        ValueError: If option is unknown or value is malformed.
+    """
+
+    if option not in PRESETS["default"]:
+        raise ValueError("Unknown tuning option {0}".format(option))
+
+    if not isinstance(value, str):
+        return type(PRESETS["default"][option])(value)
+
+    if isinstance(PRESETS["default"][option], bool):
+        if value.lower() not in ("1", "true", "yes", "on", "0", "false", "no", "off"):
+            raise ValueError("Malformed tuning option {0}={1}".format(option, value))
+        return value.lower() in ("1", "true", "yes", "on")
+
+    return int(value)
+
+
+class Profile:
+    """Tuning profile of sockets.
+
+    Attributes:
+        _name: Preset name.
+        _options: Option values by name.
+    """
+
+    @property
+    def name(self):
+        """Name accessor."""
+        return self._name
+
+    @property
+    def options(self):
+        """Options accessor."""
+        return dict(self._options)
+
+    @property
+    def backlog(self):
+        """Backlog accessor."""
+        return self._options["backlog"]
+
+    @property
+    def workers(self):
+        """Workers accessor, one per cpu if 0."""
+        return self._options["workers"] or os.cpu_count() or 1
+
+    def __init__(self, name="default", **options):
+        """Initialise profile.
+
+        Args:
+            name: Preset name.
+            options: Option values overriding the preset.
+
+        Raises:
+            ValueError: If preset or option is unknown.
+        """
+
+        if name not in PRESETS:
+            raise ValueError("Unknown tuning profile {0}".format(name))
+
+        self._name = name
+        self._options = dict(PRESETS["default"], **PRESETS[name])
+
+        for option, value in options.items():
+            self._options[option] = parse(option, value)
+
+    def __repr__(self):
+        """__repr__ overload."""
+        return "Profile({0}, {1})".format(self._name, self._options)
+
+    def setsockopt(self, sock, level, option, value):
+        """Set socket option, ignoring options the system does not support.
+
+        Args:
+            sock: Socket.
+            level: Option level.
+            option: Option name or None if not supported.
+            value: Option value.
+        """
+
+        if option is None:
+            return
+
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError as e:
+            logging.debug("Tuning option %s of %s failed: %s", option, sock, e)
+
+    def buffers(self, sock):
+        """Apply buffer sizes to socket.
+
+        Args:
+            sock: Socket.
+        """
+
+        if self._options["sndbuf"]:
+            self.setsockopt(sock, socket.SOL_SOCKET, socket.SO_SNDBUF, self._options["sndbuf"])
+        if self._options["rcvbuf"]:
+            self.setsockopt(sock, socket.SOL_SOCKET, socket.SO_RCVBUF, self._options["rcvbuf"])
+
+    def stream(self, sock, fastopen=False):
+        """Apply profile to stream socket before it connects.
+
+        Args:
+            sock: Stream socket.
+            fastopen: If True then connect with TCP fast open.
+        """
+
+        self.buffers(sock)
+
+        if self._options["nodelay"]:
+            self.setsockopt(sock, socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if self._options["keepalive"]:
+            self.setsockopt(sock, socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self.setsockopt(sock, socket.IPPROTO_TCP, getattr(socket, "TCP_KEEPIDLE", None), self._options["keepalive"])
+            if self._options["keepalive_interval"]:
+                self.setsockopt(sock, socket.IPPROTO_TCP, getattr(socket, "TCP_KEEPINTVL", None), self._options["keepalive_interval"])
+            if self._options["keepalive_count"]:
+                self.setsockopt(sock, socket.IPPROTO_TCP, getattr(socket, "TCP_KEEPCNT", None), self._options["keepalive_count"])
+
+        if fastopen and self._options["fastopen"]:
+            self.setsockopt(sock, socket.IPPROTO_TCP, TCP_FASTOPEN_CONNECT, 1)
+
+    def listen(self, sock):
+        """Apply profile to bound stream socket and start listening.
+
+        Accepted sockets inherit buffer sizes, Nagle and keepalive options.
+
+        Args:
+            sock: Bound stream socket.
+        """
+
+        self.stream(sock)
+
+        if self._options["fastopen"]:
+            self.setsockopt(sock, socket.IPPROTO_TCP, getattr(socket, "TCP_FASTOPEN", None), self._options["fastopen"])
+
+        sock.listen(self._options["backlog"])
+
+    def datagram(self, sock):
+        """Apply profile to datagram socket.
+
+        Args:
+            sock: Datagram socket.
+        """
+
+        self.buffers(sock)
+
+    def limits(self):
+        """Apply profile to process resource limits.
+
+        Raise open file descriptor soft limit to the nofile option, capped by
+        the hard limit. Soft limit is never lowered.
+        """
+
+        nofile = self._options["nofile"]
+        if not nofile:
+            return
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+        limit = hard if nofile < 0 else nofile
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+
+        if soft == resource.RLIM_INFINITY or limit <= soft:
+            return
+
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        except (ValueError, OSError) as e:
+            logging.warning("Raise open file descriptor limit to %s failed: %s", limit, e)
+            return
+
+        logging.info("Raise open file descriptor limit from %s to %s", soft, limit)
+
+
+def load(name=None, path=None, overrides=None, environ=None):
+    """Load tuning profile and make it the profile of the process.
+
+    Args:
+        name: Preset name of the command line or None.
+        path: JSON file path of the command line or None.
+        overrides: Option values of the command line by name or None.
+        environ: Environment mapping. If environ is None then the process
+        environment is used.
+
+    Returns:
+        profile: Loaded profile.
+
+    Raises:
+        ValueError: If preset or option is unknown or value is malformed.
+        OSError: If file cannot be read.
+    """
+
+    global PROFILE
+
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(ENV + "_FILE")
+
+    options = {}
+
+    if path:
+        with open(path) as f:
+            options.update(json.load(f))
+
+    preset = options.pop("profile", holepunch.config.TUNING_PROFILE)
+    preset = name or environ.get(ENV) or preset
+
+    prefix = ENV + "_"
+    for key, value in environ.items():
+        if key.startswith(prefix) and key != ENV + "_FILE":
+            options[key[len(prefix):].lower()] = value
+
+    options.update(overrides or {})
+
+    PROFILE = Profile(preset, **options)
+
+    return PROFILE
+
+
+# Tuning profile of the process, loaded from the environment
+PROFILE = load()
@@ -20,7 +20,8 @@ setup(
             "Topic :: Networks and Distributed Systems",
             ],
         packages = [
-            "holepunch"
+            "holepunch",
+            "holepunch.aio"
             ],
         test_suite = "test",
         entry_points = {
@@ -0,0 +1,188 @@
+import asyncio
+import socket
+import time
+import unittest
+import unittest.mock
+
+import holepunch.aio.client
+import holepunch.aio.server
+import holepunch.client
+import holepunch.config
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Transport:
+    """
+    Datagram transport recording sent datagrams
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+
+class TestDatagramProtocol(unittest.IsolatedAsyncioTestCase):
+    """
+    Test punch packets and datagrams received by the datagram protocol
+    """
+
+    async def asyncSetUp(self):
+        self.addr = ("127.0.0.2", 40001)
+        self.transport = Transport()
+        self.protocol = holepunch.aio.client.DatagramProtocol(self.addr[0])
+        self.protocol.connection_made(self.transport)
+
+    def packet(self, kind, sequence):
+        return kind + holepunch.client.UDPPunch.SEQUENCE.pack(sequence)
+
+    def punch(self):
+        self.protocol.probe(0, [self.addr])
+        self.protocol.datagram_received(self.packet(holepunch.client.UDPPunch.PROBE, 0), self.addr)
+        self.protocol.datagram_received(self.packet(holepunch.client.UDPPunch.ACK, 0), self.addr)
+
+    async def test_punch(self):
+        self.punch()
+
+        self.assertEqual(self.protocol.punched.result(), self.addr)
+        self.assertEqual(self.transport.sent[-1], (self.packet(holepunch.client.UDPPunch.ACK, 0), self.addr))
+        self.assertTrue(self.protocol.queue.empty())
+
+    async def test_retransmitted_probe(self):
+        self.punch()
+        self.transport.sent.clear()
+
+        # Probe of destination whose ack was lost is answered, not queued
+        self.protocol.datagram_received(self.packet(holepunch.client.UDPPunch.PROBE, 1), self.addr)
+
+        self.assertEqual(self.transport.sent, [(self.packet(holepunch.client.UDPPunch.ACK, 1), self.addr)])
+        self.assertTrue(self.protocol.queue.empty())
+
+    async def test_application_datagrams(self):
+        self.punch()
+        self.transport.sent.clear()
+
+        datagrams = [b"hello", self.packet(holepunch.client.UDPPunch.PROBE, 1), self.packet(holepunch.client.UDPPunch.ACK, 0)]
+        for data in datagrams:
+            self.protocol.datagram_received(data, self.addr)
+
+        # Destination punched once it sends other datagrams
+        self.assertEqual([self.protocol.queue.get_nowait() for _ in datagrams], datagrams)
+        self.assertEqual(self.transport.sent, [])
+
+    async def test_punch_timeout(self):
+        with unittest.mock.patch.object(holepunch.config, "PUNCH_TIMEOUT", 0):
+            self.punch()
+
+        data = self.packet(holepunch.client.UDPPunch.PROBE, 1)
+        self.protocol.datagram_received(data, self.addr)
+
+        self.assertEqual(self.protocol.queue.get_nowait(), data)
+
+    async def test_other_host(self):
+        self.protocol.datagram_received(self.packet(holepunch.client.UDPPunch.PROBE, 0), ("127.0.0.3", 40001))
+
+        self.assertEqual(self.transport.sent, [])
+        self.assertFalse(self.protocol.punched.done())
+
+
+class TestPunch(unittest.IsolatedAsyncioTestCase):
+    """
+    Test TCP and UDP punch of asyncio clients on the loopback interface
+    """
+
+    async def test_tcp(self):
+        first, second = holepunch.aio.client.TCPClient(), holepunch.aio.client.TCPClient()
+        first_addr, second_addr = ("127.0.0.1", free_port()), ("127.0.0.1", free_port())
+
+        listen = asyncio.ensure_future(first._holepunch(first_addr, second_addr, [second_addr[1]]))
+        await asyncio.sleep(0.05)
+        first.addr = await second._holepunch(second_addr, first_addr, [first_addr[1]])
+        second.addr = await listen
+
+        await second.send(b"hello")
+        self.assertEqual(await first.recv(), b"hello")
+
+        first.close()
+        second.close()
+
+    @unittest.mock.patch.object(holepunch.config, "PUNCH_TIMEOUT", 0.5)
+    async def test_tcp_refused(self):
+        client = holepunch.aio.client.TCPClient()
+        dest_addr = ("127.0.0.1", free_port())
+
+        start = time.process_time()
+
+        with self.assertRaises(TimeoutError):
+            await client._holepunch(("127.0.0.1", free_port()), dest_addr, [dest_addr[1]])
+
+        # Refused connects are retried on schedule, not in a busy loop
+        self.assertLess(time.process_time() - start, 0.2)
+
+    async def test_udp(self):
+        first, second = holepunch.aio.client.UDPClient(), holepunch.aio.client.UDPClient()
+        first_addr, second_addr = ("127.0.0.1", free_port()), ("127.0.0.1", free_port())
+
+        first.addr, second.addr = await asyncio.gather(
+            first._holepunch(first_addr, second_addr, [second_addr[1]]),
+            second._holepunch(second_addr, first_addr, [first_addr[1]])
+        )
+
+        self.assertEqual((first.addr, second.addr), (second_addr, first_addr))
+
+        await second.send(b"hello")
+        self.assertEqual(await first.recv(), b"hello")
+
+        first.close()
+        second.close()
+
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+    """
+    Test introduction of asyncio clients by the asyncio server
+    """
+
+    async def asyncSetUp(self):
+        self.server = holepunch.aio.server.Server()
+        self.server.addr = ("127.0.0.1", 0)
+        await self.server.open()
+
+        addr = self.server._server.sockets[0].getsockname()
+        patch = unittest.mock.patch.multiple(holepunch.config, SERVER_HOST=addr[0], SERVER_PORT=addr[1])
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    async def asyncTearDown(self):
+        self.server.close()
+
+    async def introduce(self, client_class):
+        listener, connector = client_class(), client_class()
+
+        listen = asyncio.ensure_future(listener.open())
+        while self.server.find_client(host="127.0.0.1") is None:
+            await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(connector.open("127.0.0.1"), 5)
+        await asyncio.wait_for(listen, 5)
+
+        await connector.send(b"hello")
+        self.assertEqual(await asyncio.wait_for(listener.recv(), 5), b"hello")
+
+        connector.close()
+        listener.close()
+
+    async def test_tcp(self):
+        await self.introduce(holepunch.aio.client.TCPClient)
+
+    async def test_udp(self):
+        await self.introduce(holepunch.aio.client.UDPClient)
+
+    async def test_not_found(self):
+        with self.assertRaises(Exception):
+            await asyncio.wait_for(holepunch.aio.client.TCPClient().open("127.0.0.3"), 5)
@@ -0,0 +1,88 @@
+import logging
+import socket
+import unittest
+import unittest.mock
+
+import holepunch.bench
+import holepunch.config
+import holepunch.trace
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestPercentile(unittest.TestCase):
+    """
+    Test nearest-rank percentile
+    """
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(holepunch.bench.percentile(values, 0.5), 50)
+        self.assertEqual(holepunch.bench.percentile(values, 0.99), 99)
+        self.assertEqual(holepunch.bench.percentile(values, 0), 1)
+        self.assertEqual(holepunch.bench.percentile([7], 0.999), 7)
+        self.assertIsNone(holepunch.bench.percentile([], 0.5))
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Test introductions of a small benchmark against a server child process
+    """
+
+    def setUp(self):
+        patch = unittest.mock.patch.object(holepunch.config, "SERVER_PORT", free_port())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_host(self):
+        bench = holepunch.bench.Benchmark(pairs=300)
+
+        hosts = {bench.host(index) for index in range(600)}
+
+        self.assertEqual(len(hosts), 600)
+        self.assertEqual(bench.host(0), "127.0.0.1")
+        self.assertEqual(bench.host(255), "127.0.1.0")
+
+    def test_run(self):
+        bench = holepunch.bench.Benchmark(pairs=8, concurrency=2)
+        inflight = []
+
+        connect = bench.connect
+        def record():
+            connect()
+            inflight.append(bench._inflight)
+
+        with unittest.mock.patch.object(bench, "connect", record):
+            report = bench.run()
+
+        self.assertEqual((report["pairs"], report["concurrency"]), (8, 2))
+        self.assertEqual(len(bench._latencies), 8)
+        self.assertEqual(max(inflight), 2)
+        self.assertLessEqual(report["latency_p50"], report["latency_p99"])
+        self.assertGreater(report["introductions_per_sec"], 0)
+
+
+class TestTransportBenchmark(unittest.TestCase):
+    """
+    Test transfers of a small transport benchmark
+    """
+
+    def setUp(self):
+        # Benchmark quiets logging of the root logger
+        self.addCleanup(holepunch.trace.TRACER.configure, level=logging.getLogger().level)
+
+    def test_run(self):
+        bench = holepunch.bench.TransportBenchmark(size=65536, losses=(0, 0.05), delay=0.001)
+
+        report = bench.run()
+
+        self.assertEqual(set(report), {
+            "size", "delay", "tcp_loopback", "rudp_loss_0", "rudp_loss_0.05", "tcp_model_loss_0.05",
+        })
+        for field in ("tcp_loopback", "rudp_loss_0", "rudp_loss_0.05", "tcp_model_loss_0.05"):
+            self.assertGreater(report[field], 0)
@@ -0,0 +1,103 @@
+import socket
+import unittest
+import unittest.mock
+
+import holepunch.buffer
+import holepunch.config
+
+
+def frame(payload):
+    return holepunch.buffer.FRAME.pack(len(payload)) + payload
+
+
+class TestBufferPool(unittest.TestCase):
+    """
+    Test buffer pool acquire and release
+    """
+
+    def test_reuse(self):
+        pool = holepunch.buffer.BufferPool(size=16, count=1)
+
+        view = pool.acquire()
+        self.assertEqual(len(view), 16)
+
+        pool.release(view[:4])
+        self.assertEqual(len(pool), 1)
+        self.assertIs(pool.acquire().obj, view.obj)
+        self.assertEqual(len(pool), 0)
+
+    def test_limits(self):
+        pool = holepunch.buffer.BufferPool(size=16, count=1)
+
+        # Buffers of another size are not kept, nor more than count
+        pool.release(memoryview(bytearray(8)))
+        pool.release(pool.acquire())
+        pool.release(pool.acquire())
+        pool.release(memoryview(bytearray(16)))
+
+        self.assertEqual(len(pool), 1)
+
+
+class TestFrameReader(unittest.TestCase):
+    """
+    Test frame reader of split, coalesced and large frames
+    """
+
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+
+    def tearDown(self):
+        self.sock.close()
+        self.peer.close()
+
+    def read(self, reader):
+        payloads = []
+
+        while True:
+            payload = reader.frame()
+            if payload is None:
+                return payloads
+            payloads.append(bytes(payload))
+
+    def test_coalesced(self):
+        reader = holepunch.buffer.FrameReader(64)
+
+        self.peer.sendall(frame(b"first") + frame(b"") + frame(b"second"))
+        reader.recv_into(self.sock)
+
+        self.assertEqual(self.read(reader), [b"first", b"", b"second"])
+
+    def test_split(self):
+        reader = holepunch.buffer.FrameReader(64)
+        data = frame(b"first") + frame(b"second")
+
+        payloads = []
+        for offset in range(len(data)):
+            self.peer.sendall(data[offset:offset + 1])
+            reader.recv_into(self.sock)
+            payloads.extend(self.read(reader))
+
+        self.assertEqual(payloads, [b"first", b"second"])
+
+    def test_grow(self):
+        reader = holepunch.buffer.FrameReader(16)
+        payload = bytes(range(256)) * 4
+
+        self.peer.sendall(frame(payload))
+
+        payloads = []
+        while not payloads:
+            reader.recv_into(self.sock)
+            payloads = self.read(reader)
+
+        self.assertEqual(payloads, [payload])
+
+    @unittest.mock.patch.object(holepunch.config, "FRAME_MAX", 16)
+    def test_frame_max(self):
+        reader = holepunch.buffer.FrameReader(64)
+
+        self.peer.sendall(frame(b"x" * 17))
+        reader.recv_into(self.sock)
+
+        with self.assertRaises(ValueError):
+            reader.frame()
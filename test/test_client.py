@@ -0,0 +1,431 @@
+import socket
+import threading
+import time
+import unittest
+import unittest.mock
+
+import holepunch.cache
+import holepunch.client
+import holepunch.config
+import holepunch.loop
+import holepunch.message
+import holepunch.server
+
+
+class TestPunchCache(unittest.TestCase):
+    """
+    Test reopen of clients whose punch result is cached
+    """
+
+    def setUp(self):
+        self.server = holepunch.server.Server()
+        self.server.addr = ("127.0.0.1", 0)
+        self.server.open()
+
+        addr = self.server.sock.getsockname()
+        patch = unittest.mock.patch.multiple(holepunch.config, SERVER_HOST=addr[0], SERVER_PORT=addr[1])
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run_server)
+        self.thread.start()
+
+    def tearDown(self):
+        self.running = False
+        self.thread.join()
+        self.server.close()
+
+    def run_server(self):
+        while self.running:
+            self.server.loop.run_once(0.01)
+
+    def open(self, listener, connector, open=None):
+        """Open listener and connector introduced by the server."""
+
+        thread = threading.Thread(target=listener.open)
+        thread.start()
+
+        while not self.server.find_client(host="127.0.0.1"):
+            time.sleep(0.01)
+
+        (open or connector.open)("127.0.0.1")
+        thread.join()
+
+    def test_ports(self):
+        response = holepunch.message.Message(method="*", body=("127.0.0.2", 20001, 1, 0))
+        entry = holepunch.cache.Entry(("", 20001), ("127.0.0.2", 30001), "udp")
+
+        # Cached destination port is punched first
+        self.assertEqual(holepunch.client.ports(response, entry)[0], 30001)
+        self.assertEqual(holepunch.client.ports(response, entry)[1:], holepunch.client.ports(response))
+
+    def test_race_grace(self):
+        client = holepunch.client.HybridClient()
+        client._initiator = True
+        loop = holepunch.loop.Loop()
+        source_addr, dest_addr = ("127.0.0.1", 0), ("127.0.0.2", 20001)
+
+        cached = client._punch(loop, source_addr, dest_addr, None, entry=holepunch.cache.Entry(source_addr, dest_addr, "udp"))
+        cold = client._punch(loop, source_addr, dest_addr, None)
+
+        # Grace delay is skipped only once UDP won the cached race
+        self.assertEqual(cached._delay, 0)
+        self.assertEqual(cold._delay, holepunch.config.PUNCH_GRACE)
+
+        loop.close()
+
+    def test_reopen(self):
+        listener = holepunch.client.UDPClient(cache=holepunch.cache.PunchCache())
+        connector = holepunch.client.UDPClient(cache=holepunch.cache.PunchCache())
+
+        self.open(listener, connector)
+        listener.close()
+        connector.close()
+
+        self.assertEqual(connector.cache.get("127.0.0.1").protocol, "udp")
+        self.assertEqual(listener.cache.get("127.0.0.1").protocol, "udp")
+
+        accepted = self.server.metrics.accepted.value
+
+        # Both peers reopen each other from their cache, without the server
+        thread = threading.Thread(target=listener.reopen, args=("127.0.0.1", True))
+        thread.start()
+        connector.reopen("127.0.0.1")
+        thread.join()
+
+        self.assertEqual(self.server.metrics.accepted.value, accepted)
+
+        connector.send(b"hello")
+        self.assertEqual(listener.recv(), b"hello")
+
+        connector.close()
+        listener.close()
+
+    @unittest.mock.patch.object(holepunch.config, "PUNCH_CACHE_TIMEOUT", 0.2)
+    def test_reopen_fallback(self):
+        listener = holepunch.client.UDPClient(cache=holepunch.cache.PunchCache())
+        connector = holepunch.client.UDPClient(cache=holepunch.cache.PunchCache())
+        connector.cache.put("127.0.0.1", holepunch.cache.Entry(("", 0), ("127.0.0.1", 9), "udp"))
+
+        accepted = self.server.metrics.accepted.value
+
+        # Listener asks the server, direct punch of connector fails
+        self.open(listener, connector, connector.reopen)
+
+        self.assertEqual(self.server.metrics.accepted.value, accepted + 2)
+        self.assertNotEqual(connector.cache.get("127.0.0.1").dest_addr, ("127.0.0.1", 9))
+
+        connector.send(b"hello")
+        self.assertEqual(listener.recv(), b"hello")
+
+        connector.close()
+        listener.close()
+
+
+class TestDatagramServer(unittest.TestCase):
+    """
+    Test clients sending requests to the UDP rendezvous endpoint
+    """
+
+    def setUp(self):
+        self.server = holepunch.server.Server(udp=True)
+        self.server.addr = ("127.0.0.1", 0)
+        self.server.open()
+
+        addr = self.server._endpoint.sock.getsockname()
+        patch = unittest.mock.patch.multiple(holepunch.config, SERVER_HOST=addr[0], SERVER_PORT=addr[1])
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run_server)
+        self.thread.start()
+
+    def tearDown(self):
+        self.running = False
+        self.thread.join()
+        self.server.close()
+
+    def run_server(self):
+        while self.running:
+            self.server.loop.run_once(0.01)
+
+    def listen(self):
+        listener = holepunch.client.UDPClient(holepunch.client.DatagramServer(), holepunch.cache.PunchCache())
+        thread = threading.Thread(target=listener.open)
+        thread.start()
+
+        while not self.server.find_client(host="127.0.0.1"):
+            time.sleep(0.01)
+
+        return listener, thread
+
+    def test_open(self):
+        listener, thread = self.listen()
+
+        connector = holepunch.client.UDPClient(holepunch.client.DatagramServer(), holepunch.cache.PunchCache())
+        connector.open("127.0.0.1")
+        thread.join()
+
+        connector.send(b"hello")
+        self.assertEqual(listener.recv(), b"hello")
+
+        connector.close()
+        listener.close()
+
+    def test_connect_many(self):
+        listener, thread = self.listen()
+
+        opened = dict(holepunch.client.UDPClient.connect_many(["127.0.0.1", "127.0.0.3"], server=holepunch.client.DatagramServer()))
+        thread.join()
+
+        self.assertIsNone(opened["127.0.0.3"])
+
+        opened["127.0.0.1"].send(b"hello")
+        self.assertEqual(listener.recv(), b"hello")
+
+        opened["127.0.0.1"].close()
+        listener.close()
+
+    @unittest.mock.patch.object(holepunch.config, "REQUEST_TIMEOUT", 0.2)
+    def test_timeout(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        # Connect request to a server not answering times out
+        with unittest.mock.patch.object(holepunch.config, "SERVER_PORT", port):
+            response = holepunch.client.DatagramServer().connect_request("127.0.0.1")
+
+        self.assertEqual(response.method, ".")
+
+
+class TestConnectMany(unittest.TestCase):
+    """
+    Test concurrent connects of many destinations over one server connection
+    """
+
+    def setUp(self):
+        self.server = holepunch.server.Server()
+        self.server.addr = ("127.0.0.1", 0)
+        self.server.open()
+
+        addr = self.server.sock.getsockname()
+        patch = unittest.mock.patch.multiple(holepunch.config, SERVER_HOST=addr[0], SERVER_PORT=addr[1])
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run_server)
+        self.thread.start()
+
+    def tearDown(self):
+        self.running = False
+        self.thread.join()
+        self.server.close()
+
+    def run_server(self):
+        while self.running:
+            self.server.loop.run_once(0.01)
+
+    def listen(self):
+        listener = holepunch.client.TCPClient(cache=holepunch.cache.PunchCache())
+        thread = threading.Thread(target=listener.open)
+        thread.start()
+
+        while not self.server.find_client(host="127.0.0.1"):
+            time.sleep(0.01)
+
+        return listener, thread
+
+    def test_connect_many(self):
+        listener, thread = self.listen()
+        hosts = ["127.0.0.3", "127.0.0.1", "127.0.0.4"]
+
+        opened = dict(holepunch.client.TCPClient.connect_many(hosts))
+        thread.join()
+
+        self.assertEqual(sorted(opened), sorted(hosts))
+        self.assertIsNone(opened["127.0.0.3"])
+        self.assertIsNone(opened["127.0.0.4"])
+
+        opened["127.0.0.1"].send(b"hello")
+        self.assertEqual(listener.recv(), b"hello")
+
+        opened["127.0.0.1"].close()
+        listener.close()
+
+    def test_concurrency(self):
+        inflight = []
+        start = holepunch.client.Connector.start
+
+        def record(connector):
+            started = start(connector)
+            inflight.append(connector._inflight)
+            return started
+
+        with unittest.mock.patch.object(holepunch.client.Connector, "start", record):
+            opened = list(holepunch.client.TCPClient.connect_many(["127.0.0.{0}".format(i) for i in range(2, 7)], concurrency=2))
+
+        # At most concurrency destinations are in progress
+        self.assertEqual(len(opened), 5)
+        self.assertEqual(max(inflight), 2)
+
+    def test_shared_server(self):
+        server = holepunch.client.Server()
+        self.addCleanup(server.close)
+
+        opened = list(holepunch.client.TCPClient.connect_many(["127.0.0.2", "127.0.0.3"], server=server))
+
+        # Requests are pipelined over the persistent connection kept open
+        self.assertEqual(sorted(opened), [("127.0.0.2", None), ("127.0.0.3", None)])
+        self.assertIsNotNone(server.sock)
+        self.assertIsNone(server.loop)
+        self.assertEqual(self.server.metrics.accepted.value, 1)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.mock.patch.object(holepunch.config, "RECONNECT_RETRY", (0, 0.1, 0.1))
+class TestReconnect(unittest.TestCase):
+    """
+    Test reconnect of the persistent client-server connection
+    """
+
+    def setUp(self):
+        patch = unittest.mock.patch.multiple(holepunch.config, SERVER_HOST="127.0.0.1", SERVER_PORT=free_port())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.loop = holepunch.loop.Loop()
+        self.server = holepunch.client.Server()
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.close()
+
+    def run_loop(self, id, seconds=1):
+        deadline = time.monotonic() + seconds
+        while not self.server.ready(id) and time.monotonic() < deadline:
+            self.loop.run_once(0.01)
+
+    def test_blocking(self):
+        with self.assertRaises(ConnectionError):
+            self.server.connect_request("127.0.0.3")
+
+    def test_scheduled(self):
+        self.server.loop = self.loop
+
+        # Reconnect delays are scheduled on the loop instead of slept
+        with unittest.mock.patch.object(time, "sleep") as sleep:
+            id = self.server.submit(holepunch.message.Message(method=">", body="127.0.0.3"))
+            self.assertFalse(self.server.ready(id))
+            self.run_loop(id)
+
+        sleep.assert_not_called()
+        self.assertEqual(self.server.result(id).method, ".")
+
+    def test_reconnected(self):
+        self.server.loop = self.loop
+
+        id = self.server.submit(holepunch.message.Message(method=">", body="127.0.0.3"))
+
+        # Server comes up before the reconnect delay elapses
+        server = holepunch.server.Server()
+        server.addr = (holepunch.config.SERVER_HOST, holepunch.config.SERVER_PORT)
+        server.open()
+        self.addCleanup(server.close)
+
+        deadline = time.monotonic() + 1
+        while self.server.sock is None and time.monotonic() < deadline:
+            self.loop.run_once(0.01)
+
+        self.server.sock.settimeout(1)
+        for _ in range(5):
+            server.loop.run_once(0.01)
+
+        self.assertEqual(self.server.result(id).method, "?")
+
+    def test_connect_many(self):
+        with unittest.mock.patch.object(time, "sleep") as sleep:
+            opened = list(holepunch.client.TCPClient.connect_many(["127.0.0.2", "127.0.0.3"]))
+
+        sleep.assert_not_called()
+        self.assertEqual(sorted(opened), [("127.0.0.2", None), ("127.0.0.3", None)])
+
+
+class TestBufferedIO(unittest.TestCase):
+    """
+    Test vectored send and framed i/o of client-client sockets
+    """
+
+    def setUp(self):
+        self.client = holepunch.client.TCPClient()
+        self.client.sock, self.peer = socket.socketpair()
+        self.peer.settimeout(1)
+
+        self.other = holepunch.client.TCPClient()
+        self.other.sock = self.peer
+
+    def tearDown(self):
+        self.client.sock.close()
+        self.peer.close()
+
+    def recv(self, size):
+        data = b""
+        while len(data) < size:
+            data += self.peer.recv(size - len(data))
+        return data
+
+    def test_sendmsg(self):
+        self.client.sendmsg(b"head", b"", bytearray(b"body"), memoryview(b"tail"), b"")
+
+        self.assertEqual(self.recv(12), b"headbodytail")
+
+    def test_sendmsg_empty(self):
+        self.client.sendmsg()
+        self.client.sendmsg(b"")
+        self.client.sendmsg(b"", b"")
+
+        self.client.sendmsg(b"end")
+        self.assertEqual(self.recv(3), b"end")
+
+    def test_sendmsg_partial(self):
+        # Buffers larger than the socket buffer are sent in parts
+        payload = bytes(range(256)) * 4096
+        thread = threading.Thread(target=self.client.sendmsg, args=(payload[:1000], payload[1000:]))
+        thread.start()
+
+        data = self.recv(len(payload))
+        thread.join()
+
+        self.assertEqual(data, payload)
+
+    def test_frame(self):
+        self.client.send_frame(b"head", b"body")
+        self.client.send_frame(b"")
+        self.client.send_frame()
+        self.client.send_frame(b"", b"tail")
+
+        payloads = [bytes(self.other.recv_frame()) for _ in range(4)]
+        self.assertEqual(payloads, [b"headbody", b"", b"", b"tail"])
+
+        self.client.sock.shutdown(socket.SHUT_WR)
+        self.assertIsNone(self.other.recv_frame())
+
+    def test_recv_into(self):
+        self.client.send(b"data")
+
+        view = self.other.recv_into()
+        self.assertEqual(bytes(view), b"data")
+        self.other.release(view)
+
+        buffer = bytearray(8)
+        self.client.send(b"more")
+        self.assertEqual(bytes(self.other.recv_into(buffer)), b"more")
+        self.assertEqual(buffer[:4], b"more")
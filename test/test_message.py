@@ -0,0 +1,209 @@
+import socket
+import unittest
+
+import holepunch.config
+import holepunch.message
+
+
+class TestCodec(unittest.TestCase):
+    """
+    Test message codecs round trip and negotiation
+    """
+
+    def round_trip(self, codec, message):
+        data = codec.encode(message)
+        decoded, size = codec.decode(memoryview(data))
+
+        self.assertEqual(size, len(data))
+        return decoded
+
+    def test_binary(self):
+        messages = [
+            holepunch.message.Message(method=">", body="127.0.0.2", id=1),
+            holepunch.message.Message(method=">", body="2001:db8::2", id=2),
+            holepunch.message.Message(method="<", id=3),
+            holepunch.message.Message(method="*", body=("127.0.0.2", 40001, -2, 2 ** 64 - 1), id=4),
+            holepunch.message.Message(method="*", body=("2001:db8::2", 40001, 1, 0), id=5),
+            holepunch.message.Message(method="?", id=0xffffffff),
+            holepunch.message.Message(method=".", id=0),
+        ]
+
+        for message in messages:
+            decoded = self.round_trip(holepunch.message.BINARY, message)
+
+            self.assertEqual(decoded.method, message.method)
+            self.assertEqual(decoded.body, message.body)
+            self.assertEqual(decoded.id, message.id)
+
+    def test_binary_optional(self):
+        message = holepunch.message.Message(method="*", body=("127.0.0.2", 40001), id=1)
+
+        decoded = self.round_trip(holepunch.message.BINARY, message)
+
+        self.assertEqual(decoded.body, ("127.0.0.2", 40001, 0, 0))
+
+    def test_binary_incomplete(self):
+        data = holepunch.message.BINARY.encode(holepunch.message.Message(method=">", body="127.0.0.2", id=1))
+
+        for size in range(len(data)):
+            self.assertEqual(holepunch.message.BINARY.decode(memoryview(data[:size])), (None, 0))
+
+    def test_binary_malformed(self):
+        data = holepunch.message.BINARY.encode(holepunch.message.Message(method=">", body="127.0.0.2", id=1))
+
+        with self.assertRaises(ValueError): # Unknown version
+            holepunch.message.BINARY.decode(memoryview(b"\x02" + data[1:]))
+
+        with self.assertRaises(ValueError): # Unknown opcode
+            holepunch.message.BINARY.decode(memoryview(data[:1] + b"\x09" + data[2:]))
+
+        with self.assertRaises(ValueError): # Unknown family
+            holepunch.message.BINARY.decode(memoryview(data[:8] + b"\x05" + data[9:]))
+
+    def test_text(self):
+        messages = [
+            holepunch.message.Message(method=">", body="127.0.0.2"),
+            holepunch.message.Message(method="<"),
+            holepunch.message.Message(method="*", body=("127.0.0.2", holepunch.config.HOLEPUNCH_PORT)),
+            holepunch.message.Message(method="?"),
+            holepunch.message.Message(method="."),
+        ]
+
+        for message in messages:
+            decoded = self.round_trip(holepunch.message.TEXT, message)
+
+            self.assertEqual(decoded.method, message.method)
+            self.assertEqual(decoded.body, message.body)
+
+        self.assertEqual(holepunch.message.TEXT.decode(memoryview(b"")), (None, 0))
+
+    def test_text_malformed(self):
+        for data in (b"*(", b"*5", b"*('127.0.0.2',)", b"*(1, 2)", b"*[1, 2]", b"*{}[()]", b"\xff"):
+            with self.assertRaises(ValueError):
+                holepunch.message.TEXT.decode(memoryview(data))
+
+    def test_text_undelimited(self):
+        data = b">127.0.0.2" + b"<"
+
+        message, size = holepunch.message.TEXT.decode(memoryview(data))
+
+        # Text messages are not delimited, all data is a single message
+        self.assertEqual(size, len(data))
+        self.assertEqual(message.method, ">")
+        self.assertEqual(message.body, "127.0.0.2<")
+
+    def test_binary_truncated(self):
+        data = holepunch.message.BINARY.encode(holepunch.message.Message(method="*", body=("127.0.0.2", 40001, 1, 7), id=1))
+        following = holepunch.message.BINARY.encode(holepunch.message.Message(method="?", id=2))
+
+        # Frame length ends within the delta or the token, body is not read
+        # from the following frame
+        for length in (8, 10, 14):
+            frame = data[:2] + length.to_bytes(2, "big") + data[4:8 + length] + following
+
+            with self.assertRaises(ValueError):
+                holepunch.message.BINARY.decode(memoryview(frame))
+
+        # Frame length ends within the address
+        frame = data[:2] + (3).to_bytes(2, "big") + data[4:11] + following
+        with self.assertRaises(ValueError):
+            holepunch.message.BINARY.decode(memoryview(frame))
+
+    def test_requests(self):
+        requests = holepunch.message.REQUESTS
+
+        for codec in (holepunch.message.TEXT, holepunch.message.BINARY):
+            for method, body in ((">", "127.0.0.2"), ("<", ""), (".", "")):
+                data = codec.encode(holepunch.message.Message(method=method, body=body, id=1))
+                message, _ = codec.decode(memoryview(data), requests)
+                self.assertEqual(message.method, method)
+
+            for method, body in (("*", ("127.0.0.2", 40001)), ("?", "")):
+                data = codec.encode(holepunch.message.Message(method=method, body=body, id=1))
+                with self.assertRaises(ValueError):
+                    codec.decode(memoryview(data), requests)
+
+        decoder = holepunch.message.Decoder(1024, methods=requests)
+        with self.assertRaises(ValueError):
+            list(decoder.feed(b"*("))
+
+    def test_negotiate(self):
+        binary = holepunch.message.BINARY.encode(holepunch.message.Message(method="<", id=1))
+
+        self.assertIs(holepunch.message.negotiate(memoryview(binary)), holepunch.message.BINARY)
+        self.assertIs(holepunch.message.negotiate(memoryview(b"<")), holepunch.message.TEXT)
+        self.assertIs(holepunch.message.negotiate(memoryview(b">127.0.0.2")), holepunch.message.TEXT)
+        self.assertIs(holepunch.message.negotiate(memoryview(b"")), holepunch.message.TEXT)
+
+    def test_downgrade(self):
+        message = holepunch.message.Message(method="*", body=("127.0.0.2", 40001, 1, 7), id=1)
+
+        self.assertIs(holepunch.message.downgrade(message, holepunch.message.BINARY), message)
+        self.assertEqual(holepunch.message.downgrade(message, holepunch.message.TEXT).body, ("127.0.0.2", holepunch.config.HOLEPUNCH_PORT))
+
+
+class TestDecoder(unittest.TestCase):
+    """
+    Test incremental decoder of split and coalesced frames
+    """
+
+    def setUp(self):
+        self.messages = [
+            holepunch.message.Message(method="<", id=1),
+            holepunch.message.Message(method=">", body="127.0.0.2", id=2),
+            holepunch.message.Message(method="*", body=("127.0.0.2", 40001, 1, 7), id=3),
+        ]
+        self.data = b"".join(holepunch.message.BINARY.encode(message) for message in self.messages)
+
+    def assertMessages(self, messages):
+        self.assertEqual([(message.method, message.body, message.id) for message in messages], [(message.method, message.body, message.id) for message in self.messages])
+
+    def test_coalesced(self):
+        decoder = holepunch.message.Decoder(1024)
+
+        self.assertMessages(list(decoder.feed(self.data)))
+        self.assertIs(decoder.codec, holepunch.message.BINARY)
+
+    def test_split(self):
+        decoder = holepunch.message.Decoder(1024)
+
+        messages = []
+        for offset in range(len(self.data)):
+            messages.extend(decoder.feed(self.data[offset:offset + 1]))
+
+        self.assertMessages(messages)
+
+    def test_wrap(self):
+        # Buffer smaller than the data, undecoded data is moved to its start
+        decoder = holepunch.message.Decoder(32)
+
+        messages = []
+        for _ in range(10):
+            messages.extend(decoder.feed(self.data))
+
+        self.assertEqual(len(messages), 10 * len(self.messages))
+
+    def test_overflow(self):
+        decoder = holepunch.message.Decoder(8)
+
+        with self.assertRaises(ValueError):
+            list(decoder.feed(holepunch.message.BINARY.encode(self.messages[1])))
+
+    def test_recv_into(self):
+        decoder = holepunch.message.Decoder(1024)
+        a, b = socket.socketpair()
+
+        with a, b:
+            # Header split
+            a.sendall(self.data[:5])
+            decoder.recv_into(b)
+            self.assertEqual(list(decoder), [])
+
+            a.sendall(self.data[5:])
+
+            messages = []
+            while len(messages) < len(self.messages):
+                decoder.recv_into(b)
+                messages.extend(decoder)
+
+        self.assertMessages(messages)
@@ -0,0 +1,170 @@
+import errno
+import socket
+import time
+import unittest
+
+import holepunch.config
+import holepunch.loop
+import holepunch.message
+import holepunch.metrics
+import holepunch.server
+
+
+class Listener:
+    """
+    Listening socket failing its first accept with an error
+    """
+
+    def __init__(self, sock, error):
+        self.sock = sock
+        self.error = error
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def accept(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise OSError(error, "accept failed")
+        return self.sock.accept()
+
+
+class TestRegistry(unittest.TestCase):
+    """
+    Test rendering of metrics in Prometheus text format
+    """
+
+    def test_render(self):
+        registry = holepunch.metrics.Registry()
+        counter = registry.add(holepunch.metrics.Counter("test_total", "Test counter.", {"method": "connect"}))
+        gauge = registry.add(holepunch.metrics.Gauge("test_gauge", "Test gauge.", func=lambda: 3))
+        histogram = registry.add(holepunch.metrics.Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1)))
+
+        counter.inc(2)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        self.assertEqual(gauge.value, 3)
+        self.assertEqual(registry.render().splitlines(), [
+            "# HELP test_gauge Test gauge.",
+            "# TYPE test_gauge gauge",
+            "test_gauge 3",
+            "# HELP test_seconds Test histogram.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1"} 2',
+            'test_seconds_bucket{le="+Inf"} 3',
+            "test_seconds_sum 5.55",
+            "test_seconds_count 3",
+            "# HELP test_total Test counter.",
+            "# TYPE test_total counter",
+            'test_total{method="connect"} 2',
+        ])
+
+
+class TestExporter(unittest.TestCase):
+    """
+    Test exporter scrapes and accept errors
+    """
+
+    def setUp(self):
+        self.loop = holepunch.loop.Loop()
+        self.registry = holepunch.metrics.Registry()
+        self.registry.add(holepunch.metrics.Counter("test_total", "Test counter.")).inc()
+        self.exporter = holepunch.metrics.Exporter(self.registry, self.loop, ("127.0.0.1", 0))
+        self.exporter.open()
+        self.addr = self.exporter._sock.getsockname()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.exporter.close()
+        self.loop.close()
+
+    def run_loop(self, seconds=0.05):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.loop.run_once(0.01)
+
+    def scrape(self, request):
+        sock = socket.create_connection(self.addr)
+        sock.settimeout(1)
+        self.socks.append(sock)
+        sock.sendall(request)
+        self.run_loop()
+        return sock.recv(4096)
+
+    def test_scrape(self):
+        response = self.scrape(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+
+        head, body = response.split(b"\r\n\r\n", 1)
+        self.assertTrue(head.startswith(b"HTTP/1.0 200 OK"))
+        self.assertIn(b"test_total 1\n", body)
+
+    def test_not_found(self):
+        self.assertTrue(self.scrape(b"GET / HTTP/1.1\r\n\r\n").startswith(b"HTTP/1.0 404"))
+        self.assertTrue(self.scrape(b"POST /metrics HTTP/1.1\r\n\r\n").startswith(b"HTTP/1.0 405"))
+
+    def test_aborted(self):
+        self.exporter._sock = Listener(self.exporter._sock, errno.ECONNABORTED)
+
+        response = self.scrape(b"GET /metrics HTTP/1.1\r\n\r\n")
+
+        self.assertTrue(response.startswith(b"HTTP/1.0 200 OK"))
+
+    def test_out_of_descriptors(self):
+        self.exporter._sock = Listener(self.exporter._sock, errno.EMFILE)
+
+        sock = socket.create_connection(self.addr)
+        sock.settimeout(1)
+        self.socks.append(sock)
+        sock.sendall(b"GET /metrics HTTP/1.1\r\n\r\n")
+        self.run_loop()
+
+        # Exporter stops accepting, connection waits in the backlog
+        self.assertNotIn(self.exporter, [key.fileobj for key in self.loop.selector.get_map().values()])
+
+        self.run_loop(holepunch.config.ACCEPT_BACKOFF * 2)
+
+        self.assertTrue(sock.recv(4096).startswith(b"HTTP/1.0 200 OK"))
+
+
+class TestServerMetrics(unittest.TestCase):
+    """
+    Test server metrics of datagram requests
+    """
+
+    def setUp(self):
+        self.server = holepunch.server.Server(udp=True)
+        self.server.addr = ("127.0.0.1", 0)
+        self.server.open()
+        self.addr = self.server._endpoint.sock.getsockname()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.server.close()
+
+    def datagram(self, message):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1)
+        self.socks.append(sock)
+        sock.sendto(holepunch.message.BINARY.encode(message), self.addr)
+        for _ in range(5):
+            self.server.loop.run_once(0.01)
+        return sock
+
+    def test_lookups(self):
+        self.datagram(holepunch.message.Message(method="<", id=1))
+        self.datagram(holepunch.message.Message(method=">", body="127.0.0.1", id=2))
+        self.datagram(holepunch.message.Message(method=">", body="127.0.0.3", id=3))
+
+        # Only connect requests look up the listening client
+        metrics = self.server.metrics
+        self.assertEqual(metrics.lookups.value, 2)
+        self.assertEqual(metrics.misses.value, 1)
+        self.assertEqual(metrics.introductions.value, 1)
+        self.assertEqual(metrics.not_found.value, 1)
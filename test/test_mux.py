@@ -0,0 +1,80 @@
+import socket
+import unittest
+
+import holepunch.buffer
+import holepunch.config
+import holepunch.mux
+
+
+class Client:
+    """
+    Client of one end of a socket pair
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def close(self):
+        self.sock.close()
+
+
+class TestMalformed(unittest.TestCase):
+    """
+    Test multiplexer handling of malformed frames of peer
+    """
+
+    def setUp(self):
+        sock, self.peer = socket.socketpair()
+        self.mux = holepunch.mux.Mux(Client(sock), initiator=False)
+
+    def tearDown(self):
+        self.mux.close()
+        self.peer.close()
+
+    def send(self, payload):
+        self.peer.sendall(holepunch.buffer.FRAME.pack(len(payload)) + payload)
+        self.mux.poll(1)
+
+    def frame(self, type, id, data=b""):
+        self.send(holepunch.mux.HEADER.pack(type, id) + data)
+
+    def test_short_frame(self):
+        self.send(b"\x01\x00")
+
+        self.assertTrue(self.mux.closed)
+
+    def test_oversized_frame(self):
+        self.peer.sendall(holepunch.buffer.FRAME.pack(holepunch.config.FRAME_MAX + 1))
+        self.mux.poll(1)
+
+        self.assertTrue(self.mux.closed)
+
+    def test_malformed_window(self):
+        self.frame(holepunch.mux.OPEN, 1)
+        stream = self.mux.accept()
+
+        self.frame(holepunch.mux.DATA, 1, b"hello")
+        self.frame(holepunch.mux.WINDOW, 1, b"\x00\x01")
+
+        # Stream is reset, data already received is kept
+        self.assertFalse(self.mux.closed)
+        self.assertTrue(stream.closed)
+        self.assertEqual(stream.recv(), b"hello")
+        self.assertEqual(stream.recv(), b"")
+
+        # Other streams are unaffected
+        self.frame(holepunch.mux.OPEN, 3)
+        self.frame(holepunch.mux.DATA, 3, b"world")
+        self.assertEqual(self.mux.accept().recv(), b"world")
+
+    def test_window_exceeded(self):
+        self.frame(holepunch.mux.OPEN, 1)
+        stream = self.mux.accept()
+
+        data = b"x" * holepunch.config.MUX_FRAME
+        for _ in range(holepunch.config.MUX_WINDOW // len(data) + 1):
+            self.frame(holepunch.mux.DATA, 1, data)
+
+        self.assertFalse(self.mux.closed)
+        self.assertTrue(stream.closed)
+        self.assertTrue(stream.eof)
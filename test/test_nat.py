@@ -0,0 +1,79 @@
+import unittest
+
+import holepunch.nat
+
+
+class TestClassifier(unittest.TestCase):
+    """
+    Test NAT behaviour classification from observed ports
+    """
+
+    def classify(self, *ports):
+        classifier = holepunch.nat.Classifier(size=4)
+        for port in ports:
+            classifier.observe(port)
+        return classifier.behaviour, classifier.delta
+
+    def test_unknown(self):
+        self.assertEqual(self.classify(), (holepunch.nat.UNKNOWN, 0))
+        self.assertEqual(self.classify(40001), (holepunch.nat.UNKNOWN, 0))
+
+    def test_consistent(self):
+        self.assertEqual(self.classify(40001, 40001, 40001), (holepunch.nat.CONSISTENT, 0))
+
+    def test_sequential(self):
+        self.assertEqual(self.classify(40001, 40003, 40004), (holepunch.nat.SEQUENTIAL, 1))
+        self.assertEqual(self.classify(40010, 40008, 40004), (holepunch.nat.SEQUENTIAL, -2))
+
+    def test_random(self):
+        self.assertEqual(self.classify(40001, 52113, 40020), (holepunch.nat.RANDOM, 0))
+
+        # Steps over the maximum delta are not predictable
+        self.assertEqual(self.classify(40001, 40101), (holepunch.nat.RANDOM, 0))
+
+    def test_window(self):
+        # Only the last observations are classified
+        self.assertEqual(self.classify(1000, 52113, 40001, 40002, 40003, 40004), (holepunch.nat.SEQUENTIAL, 1))
+
+
+class TestTable(unittest.TestCase):
+    """
+    Test NAT classifiers by host and least recently used eviction
+    """
+
+    def test_delta(self):
+        table = holepunch.nat.Table()
+        table.observe("203.0.113.7", 40001)
+        table.observe("203.0.113.7", 40003)
+
+        self.assertEqual(table.delta("203.0.113.7"), 2)
+        self.assertEqual(table.delta("203.0.113.8"), 0)
+        self.assertEqual(table.get("203.0.113.7").ports, [40001, 40003])
+
+    def test_eviction(self):
+        table = holepunch.nat.Table(size=2)
+        table.observe("203.0.113.1", 40001)
+        table.observe("203.0.113.2", 40001)
+        table.observe("203.0.113.1", 40002)
+        table.observe("203.0.113.3", 40001)
+
+        self.assertEqual(len(table), 2)
+        self.assertIsNone(table.get("203.0.113.2"))
+        self.assertIsNotNone(table.get("203.0.113.1"))
+
+
+class TestPredict(unittest.TestCase):
+    """
+    Test port prediction of observed port and delta
+    """
+
+    def test_unpredictable(self):
+        self.assertEqual(holepunch.nat.predict(40001), [40001])
+
+    def test_sequential(self):
+        self.assertEqual(holepunch.nat.predict(40001, 2, count=3), [40001, 40003, 40005, 40007])
+        self.assertEqual(holepunch.nat.predict(40001, -1, count=2), [40001, 40000, 39999])
+
+    def test_port_range(self):
+        self.assertEqual(holepunch.nat.predict(65534, 1, count=3), [65534, 65535])
+        self.assertEqual(holepunch.nat.predict(2, -1, count=3), [2, 1])
@@ -0,0 +1,328 @@
+import socket
+import time
+import unittest
+
+import holepunch.client
+import holepunch.loop
+
+
+def free_port(type=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, type) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class PunchTestCase(unittest.TestCase):
+    """
+    Base test case running punches in one event loop
+    """
+
+    def setUp(self):
+        self.loop = holepunch.loop.Loop()
+        self.results = {}
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        holepunch.client.PunchPort.shutdown(self.loop)
+        self.loop.close()
+
+    def done(self, punch, error):
+        self.results[punch] = error
+        if punch.sock is not None:
+            self.socks.append(punch.sock)
+
+    def run_loop(self, punches, seconds=2):
+        deadline = time.monotonic() + seconds
+        while any(punch not in self.results for punch in punches) and time.monotonic() < deadline:
+            self.loop.run_once(0.01)
+
+    def addrs(self, type=socket.SOCK_STREAM):
+        return ("127.0.0.1", free_port(type)), ("127.0.0.1", free_port(type))
+
+
+class TestTCPPunch(PunchTestCase):
+    """
+    Test TCP simultaneous open state machine on the loopback interface
+    """
+
+    def test_punch(self):
+        first_addr, second_addr = self.addrs()
+        first = holepunch.client.TCPPunch(self.loop, first_addr, second_addr, self.done)
+        second = holepunch.client.TCPPunch(self.loop, second_addr, first_addr, self.done)
+        first.open()
+        second.open()
+
+        self.run_loop([first, second])
+
+        self.assertEqual(self.results, {first: None, second: None})
+        self.assertEqual((first.dest_addr, second.dest_addr), (second_addr, first_addr))
+
+        first.sock.sendall(b"hello")
+        self.assertEqual(second.sock.recv(5), b"hello")
+
+    def test_accepted(self):
+        source_addr, dest_addr = self.addrs()
+        punch = holepunch.client.TCPPunch(self.loop, source_addr, dest_addr, self.done, schedule=(1,))
+        punch.open()
+
+        # Connect of destination is accepted by the listening socket of source
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socks.append(sock)
+        sock.bind(dest_addr)
+        sock.connect(source_addr)
+
+        self.run_loop([punch])
+
+        self.assertIsNone(self.results[punch])
+        self.assertEqual(punch.sock.getpeername(), dest_addr)
+
+    def test_ports(self):
+        source_addr, dest_addr = self.addrs()
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socks.append(listener)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+
+        # Predicted port of destination answers
+        punch = holepunch.client.TCPPunch(self.loop, source_addr, dest_addr, self.done, ports=[dest_addr[1], listener.getsockname()[1]])
+        punch.open()
+
+        self.run_loop([punch])
+
+        self.assertIsNone(self.results[punch])
+        self.assertEqual(punch.dest_addr, listener.getsockname())
+
+    def test_timeout(self):
+        source_addr, dest_addr = self.addrs()
+        punch = holepunch.client.TCPPunch(self.loop, source_addr, dest_addr, self.done, schedule=(0.05,), timeout=0.3)
+
+        start = time.process_time()
+        punch.open()
+        self.run_loop([punch])
+
+        # Refused connects are retried on schedule, not in a busy loop
+        self.assertIsInstance(self.results[punch], TimeoutError)
+        self.assertLessEqual(punch._attempt, 7)
+        self.assertLess(time.process_time() - start, 0.2)
+        self.assertEqual(len(self.loop.selector.get_map()), 0)
+
+
+class TestUDPPunch(PunchTestCase):
+    """
+    Test confirmed UDP punch handshake on the loopback interface
+    """
+
+    def peer(self, addr):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1)
+        self.socks.append(sock)
+        sock.bind(addr)
+        return sock
+
+    def packet(self, kind, sequence):
+        return kind + holepunch.client.UDPPunch.SEQUENCE.pack(sequence)
+
+    def drain(self, sock):
+        packets = []
+        sock.settimeout(0.05)
+        try:
+            while True:
+                packets.append(sock.recv(64))
+        except socket.timeout:
+            return packets
+
+    def test_punch(self):
+        first_addr, second_addr = self.addrs(socket.SOCK_DGRAM)
+        first = holepunch.client.UDPPunch(self.loop, first_addr, second_addr, self.done)
+        second = holepunch.client.UDPPunch(self.loop, second_addr, first_addr, self.done)
+        first.open()
+        second.open()
+
+        self.run_loop([first, second])
+
+        self.assertEqual(self.results, {first: None, second: None})
+        self.assertIsNotNone(first.rtt)
+
+        # Punch packets still in flight precede application datagrams
+        first.sock.send(b"hello")
+        self.assertIn(b"hello", self.drain(second.sock))
+
+    def test_retransmit(self):
+        source_addr, dest_addr = self.addrs(socket.SOCK_DGRAM)
+        peer = self.peer(dest_addr)
+        punch = holepunch.client.UDPPunch(self.loop, source_addr, dest_addr, self.done, schedule=(0.05,))
+        punch.open()
+
+        # Probes are retransmitted with the next sequence number
+        self.run_loop([punch], 0.12)
+        self.assertEqual(peer.recv(64), self.packet(holepunch.client.UDPPunch.PROBE, 0))
+        self.assertEqual(peer.recv(64), self.packet(holepunch.client.UDPPunch.PROBE, 1))
+
+        # Probe of destination is answered, punch completes once acked
+        peer.sendto(self.packet(holepunch.client.UDPPunch.PROBE, 0), source_addr)
+        self.run_loop([punch], 0.02)
+        self.assertNotIn(punch, self.results)
+
+        peer.sendto(self.packet(holepunch.client.UDPPunch.ACK, 1), source_addr)
+        self.run_loop([punch])
+
+        self.assertIsNone(self.results[punch])
+        self.assertIn(self.packet(holepunch.client.UDPPunch.ACK, 0), self.drain(peer))
+
+    def test_unconfirmed(self):
+        source_addr, dest_addr = self.addrs(socket.SOCK_DGRAM)
+        peer = self.peer(dest_addr)
+        punch = holepunch.client.UDPPunch(self.loop, source_addr, dest_addr, self.done, schedule=(1,), timeout=0.2)
+        punch.open()
+
+        # Malformed packets and acks of probes never sent do not confirm
+        for data in (b"*", self.packet(b"?", 0), self.packet(holepunch.client.UDPPunch.ACK, 7)):
+            peer.sendto(data, source_addr)
+        peer.sendto(self.packet(holepunch.client.UDPPunch.PROBE, 0), source_addr)
+
+        self.run_loop([punch])
+
+        self.assertIsInstance(self.results[punch], TimeoutError)
+
+    def test_ports(self):
+        source_addr, dest_addr = self.addrs(socket.SOCK_DGRAM)
+        peer = self.peer(("127.0.0.1", 0))
+        punch = holepunch.client.UDPPunch(self.loop, source_addr, dest_addr, self.done, ports=[dest_addr[1], peer.getsockname()[1]])
+        punch.open()
+
+        # Predicted port of destination answers, punch follows it
+        self.run_loop([punch], 0.02)
+        sequence = holepunch.client.UDPPunch.SEQUENCE.unpack_from(peer.recv(64), 1)[0]
+        peer.sendto(self.packet(holepunch.client.UDPPunch.ACK, sequence), source_addr)
+        peer.sendto(self.packet(holepunch.client.UDPPunch.PROBE, 0), source_addr)
+
+        self.run_loop([punch])
+
+        self.assertIsNone(self.results[punch])
+        self.assertEqual(punch.dest_addr, peer.getsockname())
+
+
+class Punch:
+    """
+    Punch stub completed by the test
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.dest_addr = ("127.0.0.2", 20001)
+        self.closed = False
+
+    def open(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class TestHybridPunch(PunchTestCase):
+    """
+    Test TCP and UDP punch race selection of initiator and listener
+    """
+
+    def race(self, initiator, grace=None):
+        race = holepunch.client.HybridPunch(self.loop, ("127.0.0.1", 20001), ("127.0.0.2", 20001), self.done, initiator, grace=grace)
+
+        tcp, self.tcp_peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        udp, self.udp_peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socks += [tcp, udp, self.tcp_peer, self.udp_peer]
+        for sock in (self.tcp_peer, self.udp_peer):
+            sock.settimeout(1)
+
+        race._tcp, race._udp = Punch(tcp), Punch(udp)
+        race.open()
+
+        return race
+
+    def test_loopback(self):
+        first_addr, second_addr = self.addrs()
+        first = holepunch.client.HybridPunch(self.loop, first_addr, second_addr, self.done, True)
+        second = holepunch.client.HybridPunch(self.loop, second_addr, first_addr, self.done, False)
+        first.open()
+        second.open()
+
+        self.run_loop([first, second])
+
+        # Both peers keep the same transport
+        self.assertEqual(self.results, {first: None, second: None})
+        self.assertEqual(first.sock.type, second.sock.type)
+
+    def test_initiator_tcp(self):
+        race = self.race(True)
+
+        race.punched(race._udp, None)
+        race.punched(race._tcp, None)
+
+        # TCP punched within the grace delay wins
+        self.assertIsNone(self.results[race])
+        self.assertIs(race.sock, race._tcp.sock)
+        self.assertEqual(self.tcp_peer.recv(1), holepunch.client.HybridPunch.TCP_SELECT)
+        self.assertEqual(race._udp.sock.fileno(), -1)
+
+    def test_initiator_grace(self):
+        race = self.race(True, grace=0.05)
+
+        race.punched(race._udp, None)
+        self.assertNotIn(race, self.results)
+
+        self.run_loop([race])
+
+        # UDP wins once the grace delay elapsed, TCP punch is stopped
+        self.assertIsNone(self.results[race])
+        self.assertIs(race.sock, race._udp.sock)
+        self.assertTrue(race._tcp.closed)
+        self.assertEqual([self.udp_peer.recv(1) for _ in range(holepunch.client.HybridPunch.SELECT_COPIES)], [holepunch.client.HybridPunch.UDP_SELECT] * 3)
+
+    def test_initiator_tcp_failed(self):
+        race = self.race(True)
+
+        race.punched(race._tcp, ConnectionRefusedError())
+        race.punched(race._udp, None)
+
+        # UDP wins without grace delay once TCP failed
+        self.assertIs(race.sock, race._udp.sock)
+
+    def test_listener_udp(self):
+        race = self.race(False)
+
+        race.punched(race._tcp, None)
+        race.punched(race._udp, None)
+        self.assertNotIn(race, self.results)
+
+        # Listener follows the select marker of initiator
+        for _ in range(holepunch.client.HybridPunch.SELECT_COPIES):
+            self.udp_peer.send(holepunch.client.HybridPunch.UDP_SELECT)
+        self.udp_peer.send(b"hello")
+
+        self.run_loop([race])
+
+        self.assertIs(race.sock, race._udp.sock)
+        self.assertEqual(race.sock.recv(5), b"hello")
+        self.assertEqual(len(self.loop.selector.get_map()), 0)
+
+    def test_listener_tcp_closed(self):
+        race = self.race(False)
+
+        race.punched(race._tcp, None)
+        race.punched(race._udp, None)
+
+        # TCP closed by initiator selecting UDP
+        self.tcp_peer.close()
+        self.run_loop([race])
+
+        self.assertIs(race.sock, race._udp.sock)
+
+    def test_failed(self):
+        race = self.race(True)
+
+        race.punched(race._tcp, ConnectionRefusedError())
+        race.punched(race._udp, TimeoutError())
+
+        self.assertIsInstance(self.results[race], ConnectionRefusedError)
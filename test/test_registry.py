@@ -0,0 +1,128 @@
+import socket
+import unittest
+
+import holepunch.registry
+
+
+class Client:
+    """
+    Registry client with an optional socket of its own
+    """
+
+    def __init__(self, addr, sock=None, listening=False, transport="tcp"):
+        self.addr = addr
+        self.sock = sock
+        self.listening = listening
+        self.transport = transport
+
+    def fileno(self):
+        return None if self.sock is None else self.sock.fileno()
+
+
+class TestRegistry(unittest.TestCase):
+    """
+    Test registry add, find and remove
+    """
+
+    def setUp(self):
+        self.registry = holepunch.registry.Registry()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+
+    def client(self, addr, listening=False, own_sock=True):
+        sock = None
+        if own_sock:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socks.append(sock)
+
+        return Client(addr, sock, listening, "tcp" if own_sock else "udp")
+
+    def test_add(self):
+        client = self.client(("127.0.0.2", 40001))
+        self.registry.add(client)
+
+        self.assertEqual(len(self.registry), 1)
+        self.assertIn(client, self.registry)
+        self.assertEqual(list(self.registry), [client])
+
+    def test_find(self):
+        client = self.client(("127.0.0.2", 40001))
+        peer = self.client(("127.0.0.2", 40002), own_sock=False)
+        self.registry.add(client)
+        self.registry.add(peer)
+
+        self.assertIs(self.registry.find(sock=client.sock), client)
+        self.assertIs(self.registry.find(host="127.0.0.2", port=40001), client)
+        self.assertIs(self.registry.find(host="127.0.0.2", port=40002, transport="udp"), peer)
+        self.assertIsNone(self.registry.find(host="127.0.0.2", port=40002))
+        self.assertIsNone(self.registry.find(host="127.0.0.2", port=40003))
+        self.assertIsNone(self.registry.find())
+
+        # Only listening clients are found by host
+        self.assertIsNone(self.registry.find(host="127.0.0.2"))
+
+    def test_find_listening(self):
+        first = self.client(("127.0.0.2", 40001))
+        second = self.client(("127.0.0.2", 40002), listening=True)
+        third = self.client(("127.0.0.2", 40003))
+        for client in (first, second, third):
+            self.registry.add(client)
+
+        self.assertIs(self.registry.find(host="127.0.0.2"), second)
+        self.assertIsNone(self.registry.find(host="127.0.0.3"))
+
+        # Earliest listening client is found first
+        self.registry.listen(third)
+        self.registry.listen(first)
+        self.assertIs(self.registry.find(host="127.0.0.2"), second)
+
+        self.registry.unlisten(second)
+        self.assertIs(self.registry.find(host="127.0.0.2"), third)
+
+        self.registry.unlisten(second)
+        self.registry.remove(third)
+        self.assertIs(self.registry.find(host="127.0.0.2"), first)
+
+    def test_listen_removed(self):
+        client = self.client(("127.0.0.2", 40001))
+
+        self.registry.listen(client)
+        self.assertIsNone(self.registry.find(host="127.0.0.2"))
+
+    def test_remove(self):
+        client = self.client(("127.0.0.2", 40001), listening=True)
+        peer = self.client(("127.0.0.2", 40002), listening=True, own_sock=False)
+        self.registry.add(client)
+        self.registry.add(peer)
+
+        self.registry.remove(client)
+
+        self.assertEqual(len(self.registry), 1)
+        self.assertNotIn(client, self.registry)
+        self.assertIsNone(self.registry.find(sock=client.sock))
+        self.assertIsNone(self.registry.find(host="127.0.0.2", port=40001))
+        self.assertIs(self.registry.find(host="127.0.0.2"), peer)
+
+        self.registry.remove(peer)
+
+        self.assertEqual(len(self.registry), 0)
+        self.assertIsNone(self.registry.find(host="127.0.0.2"))
+
+    def test_shared_addr(self):
+        client = self.client(("127.0.0.2", 40001), listening=True)
+        peer = self.client(("127.0.0.2", 40001), listening=True, own_sock=False)
+        self.registry.add(client)
+        self.registry.add(peer)
+
+        # Stream client and datagram peer of the same address are both kept
+        self.assertEqual(len(self.registry), 2)
+        self.assertIs(self.registry.find(host="127.0.0.2", port=40001), client)
+        self.assertIs(self.registry.find(host="127.0.0.2", port=40001, transport="udp"), peer)
+
+        self.registry.remove(peer)
+
+        self.assertIn(client, self.registry)
+        self.assertIs(self.registry.find(host="127.0.0.2"), client)
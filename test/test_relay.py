@@ -0,0 +1,191 @@
+import errno
+import os
+import socket
+import threading
+import time
+import unittest
+import unittest.mock
+
+import holepunch.config
+import holepunch.loop
+import holepunch.relay
+
+
+class Listener:
+    """
+    Listening socket failing its first accept with an error
+    """
+
+    def __init__(self, sock, error):
+        self.sock = sock
+        self.error = error
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def accept(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise OSError(error, "accept failed")
+        return self.sock.accept()
+
+
+@unittest.mock.patch.object(holepunch.config, "RELAY_PORT", 0)
+@unittest.mock.patch.object(holepunch.config, "SERVER_HOST", "127.0.0.1")
+class TestRelay(unittest.TestCase):
+    """
+    Test relay pairing, forwarding and accept errors
+    """
+
+    def setUp(self):
+        self.loop = holepunch.loop.Loop()
+        self.relay = holepunch.relay.Relay(self.loop)
+        self.relay.open()
+        self.addr = self.relay._sock.getsockname()
+        self.socks = []
+        self.running = False
+
+    def tearDown(self):
+        self.stop()
+        for sock in self.socks:
+            sock.close()
+        self.relay.close()
+        self.loop.close()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run_relay)
+        self.thread.start()
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.thread.join()
+
+    def run_relay(self):
+        while self.running:
+            self.loop.run_once(0.01)
+
+    def run_once(self, seconds=0.05):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.loop.run_once(0.01)
+
+    def connect(self, token):
+        sock = socket.create_connection(self.addr)
+        sock.settimeout(1)
+        self.socks.append(sock)
+        sock.sendall(holepunch.relay.TOKEN.pack(token))
+        return sock
+
+    def pair(self, token=7):
+        self.relay.issue(token)
+        self.start()
+
+        left, right = self.connect(token), self.connect(token)
+        self.assertEqual(left.recv(1), holepunch.relay.RELAYED)
+        self.assertEqual(right.recv(1), holepunch.relay.RELAYED)
+
+        return left, right
+
+    def recv(self, sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def forward(self):
+        left, right = self.pair()
+
+        left.sendall(b"hello")
+        self.assertEqual(self.recv(right, 5), b"hello")
+        right.sendall(b"world")
+        self.assertEqual(self.recv(left, 5), b"world")
+
+        # End of file of one direction is forwarded, other direction stays open
+        left.shutdown(socket.SHUT_WR)
+        self.assertEqual(right.recv(1), b"")
+        right.sendall(b"late")
+        self.assertEqual(self.recv(left, 4), b"late")
+
+        right.close()
+        self.assertEqual(left.recv(1), b"")
+        left.close()
+
+        deadline = time.monotonic() + 1
+        while self.relay.sessions and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.relay.sessions, [])
+        self.assertEqual(self.relay.bytes, 14)
+
+    def test_forward(self):
+        self.forward()
+
+    def test_forward_buffer(self):
+        # Forward through a buffer where splice is not available
+        with unittest.mock.patch.dict(os.__dict__):
+            os.__dict__.pop("splice", None)
+            self.forward()
+
+    def test_forward_large(self):
+        left, right = self.pair()
+        payload = bytes(range(256)) * 16384
+
+        thread = threading.Thread(target=left.sendall, args=(payload,))
+        thread.start()
+        data = self.recv(right, len(payload))
+        thread.join()
+
+        self.assertEqual(data, payload)
+
+    def test_unknown_token(self):
+        self.start()
+
+        sock = self.connect(7)
+
+        self.assertEqual(sock.recv(1), b"")
+
+    def test_token_paired_once(self):
+        self.pair()
+
+        sock = self.connect(7)
+
+        self.assertEqual(sock.recv(1), b"")
+
+    @unittest.mock.patch.object(holepunch.config, "RELAY_TOKEN_TTL", 0.05)
+    def test_token_expiry(self):
+        self.relay.issue(7)
+        self.run_once(0.1)
+        self.start()
+
+        sock = self.connect(7)
+
+        self.assertEqual(sock.recv(1), b"")
+
+    def test_aborted(self):
+        self.relay._sock = Listener(self.relay._sock, errno.ECONNABORTED)
+
+        socket.create_connection(self.addr).close()
+        self.run_once()
+
+        self.assertIsNone(self.relay._sock.error)
+        self.assertIn(self.relay, [key.fileobj for key in self.loop.selector.get_map().values()])
+
+    def test_out_of_descriptors(self):
+        self.relay._sock = Listener(self.relay._sock, errno.EMFILE)
+        self.relay.issue(7)
+
+        self.connect(7)
+        self.run_once()
+
+        # Relay stops accepting, connection waits in the backlog
+        self.assertNotIn(self.relay, [key.fileobj for key in self.loop.selector.get_map().values()])
+
+        self.run_once(holepunch.config.ACCEPT_BACKOFF * 2)
+        self.start()
+
+        self.assertEqual(self.connect(7).recv(1), holepunch.relay.RELAYED)
@@ -0,0 +1,54 @@
+import socket
+import threading
+import time
+import unittest
+
+import holepunch.client
+import holepunch.config
+import holepunch.rudp
+
+
+class TestConnection(unittest.TestCase):
+    """
+    Test reliable stream over a pair of connected UDP sockets
+    """
+
+    def setUp(self):
+        self.clients = []
+
+        for _ in range(2):
+            client = holepunch.client.UDPClient()
+            client.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            client.sock.bind(("127.0.0.1", 0))
+            self.clients.append(client)
+
+        self.clients[0].sock.connect(self.clients[1].sock.getsockname())
+        self.clients[1].sock.connect(self.clients[0].sock.getsockname())
+
+    def test_close(self):
+        data = b"x" * 100000
+        received = []
+
+        def receive():
+            conn = holepunch.rudp.Connection(self.clients[1])
+
+            chunk = conn.recv()
+            while chunk:
+                received.append(chunk)
+                chunk = conn.recv()
+
+            start = time.monotonic()
+            conn.close()
+            received.append(time.monotonic() - start)
+
+        thread = threading.Thread(target=receive)
+        thread.start()
+
+        conn = holepunch.rudp.Connection(self.clients[0])
+        conn.send(data)
+        conn.close()
+
+        thread.join(holepunch.config.RUDP_LINGER * 2)
+
+        self.assertEqual(b"".join(received[:-1]), data)
+        self.assertLess(received[-1], 1)
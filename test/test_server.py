@@ -0,0 +1,377 @@
+import errno
+import socket
+import time
+import unittest
+import unittest.mock
+
+import holepunch.config
+import holepunch.loop
+import holepunch.message
+import holepunch.server
+
+
+class ServerTestCase(unittest.TestCase):
+    """
+    Base test case running a server on the loopback interface
+    """
+
+    def make_server(self):
+        return holepunch.server.Server()
+
+    def setUp(self):
+        self.server = self.make_server()
+        self.server.addr = ("127.0.0.1", 0)
+        self.server.open()
+        self.addr = self.server.sock.getsockname()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.server.close()
+
+    def run_server(self, seconds=0.05):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.server.loop.run_once(0.01)
+
+    def connect(self, source_addr=None):
+        sock = socket.create_connection(self.addr, source_address=source_addr)
+        sock.settimeout(1)
+        self.socks.append(sock)
+        return sock
+
+    def request(self, data, source_addr=None):
+        sock = self.connect(source_addr)
+        sock.sendall(data)
+        self.run_server()
+        return sock
+
+
+class TestTextProtocol(ServerTestCase):
+    """
+    Test server with clients of the text protocol
+    """
+
+    def response(self, sock):
+        return holepunch.message.Message(sock.recv(1024).decode("utf-8"))
+
+    def test_introduce(self):
+        listen = self.request(b"<")
+        connect = self.request(b">127.0.0.1")
+
+        for sock in (connect, listen):
+            response = self.response(sock)
+            self.assertEqual(response.method, "*")
+            self.assertEqual(response.body, ("127.0.0.1", holepunch.config.HOLEPUNCH_PORT))
+
+    def test_not_found(self):
+        connect = self.request(b">127.0.0.3")
+
+        self.assertEqual(self.response(connect).method, "?")
+
+
+class TestMalformed(ServerTestCase):
+    """
+    Test server handling of malformed requests
+    """
+
+    def make_server(self):
+        return holepunch.server.Server(udp=True)
+
+    def datagram(self, data):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1)
+        self.socks.append(sock)
+        sock.sendto(data, self.server._endpoint.sock.getsockname())
+        self.run_server()
+        return sock
+
+    def test_stream(self):
+        binary = holepunch.message.BINARY
+        response = binary.encode(holepunch.message.Message(method="?", id=1))
+
+        for data in (b"*(", b"*('127.0.0.1', 1)", b"?", b"\xff", response):
+            client = self.request(data)
+
+            # Client is closed, server keeps running
+            self.assertEqual(client.recv(1024), b"")
+            self.assertEqual(len(self.server.registry), 0)
+
+        self.assertEqual(self.request(b">127.0.0.3").recv(1024), b"?")
+
+    def test_datagram(self):
+        for data in (b"*(", b"*('127.0.0.1', 1)", b"\xff"):
+            self.datagram(data)
+
+        self.assertEqual(self.datagram(b">127.0.0.3").recv(1024), b"?")
+
+
+class TestEndpoint(ServerTestCase):
+    """
+    Test UDP rendezvous endpoint peers and reply cache
+    """
+
+    def make_server(self):
+        return holepunch.server.Server(udp=True)
+
+    def datagram(self, message, sock=None, source_addr=("127.0.0.1", 0)):
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.settimeout(1)
+            sock.bind(source_addr)
+            self.socks.append(sock)
+
+        sock.sendto(holepunch.message.BINARY.encode(message), self.server._endpoint.sock.getsockname())
+        self.run_server()
+        return sock
+
+    def response(self, data):
+        response, _ = holepunch.message.BINARY.decode(memoryview(data))
+        return response
+
+    def test_introduce(self):
+        listen = self.datagram(holepunch.message.Message(method="<", id=1))
+        connect = self.datagram(holepunch.message.Message(method=">", body="127.0.0.1", id=2))
+
+        self.assertEqual(self.response(connect.recv(1024)).body[:2], ("127.0.0.1", listen.getsockname()[1]))
+        self.assertEqual(self.response(listen.recv(1024)).body[:2], ("127.0.0.1", connect.getsockname()[1]))
+
+    def test_reply_cache(self):
+        listen = self.datagram(holepunch.message.Message(method="<", id=1))
+        connect = self.datagram(holepunch.message.Message(method=">", body="127.0.0.1", id=2))
+        reply = connect.recv(1024)
+
+        # Retransmitted request is answered from the reply cache
+        self.datagram(holepunch.message.Message(method=">", body="127.0.0.1", id=2), connect)
+
+        self.assertEqual(connect.recv(1024), reply)
+        self.assertEqual(self.server.metrics.introductions.value, 1)
+
+        listen.recv(1024)
+        listen.settimeout(0.05)
+        with self.assertRaises(socket.timeout):
+            listen.recv(1024)
+
+    def test_shared_addr(self):
+        # Stream client and datagram peer on the same host and port
+        peer = self.datagram(holepunch.message.Message(method="<", id=1))
+        self.request(b"<", peer.getsockname())
+        addr = peer.getsockname()
+
+        self.assertEqual(len(self.server.registry), 2)
+        client = self.server.find_client(host=addr[0], port=addr[1])
+        self.assertIsInstance(client, holepunch.server.Client)
+        self.assertIsInstance(self.server.find_client(host=addr[0], port=addr[1], transport="udp"), holepunch.server.Peer)
+
+        self.datagram(holepunch.message.Message(method=".", id=2), peer)
+
+        self.assertEqual(len(self.server.registry), 1)
+        self.assertIs(self.server.find_client(host=addr[0], port=addr[1]), client)
+        self.assertIs(self.server.find_client(host=addr[0]), client)
+
+
+class TestRelayToken(ServerTestCase):
+    """
+    Test relay tokens of introductions between binary and text clients
+    """
+
+    def make_server(self):
+        return holepunch.server.Server(relay=True)
+
+    def response(self, sock):
+        response, _ = holepunch.message.BINARY.decode(memoryview(sock.recv(1024)))
+        return response
+
+    def test_binary(self):
+        binary = holepunch.message.BINARY
+        listen = self.request(binary.encode(holepunch.message.Message(method="<", id=1)))
+        connect = self.request(binary.encode(holepunch.message.Message(method=">", body="127.0.0.1", id=2)))
+
+        token = self.response(connect).body[3]
+        self.assertNotEqual(token, 0)
+        self.assertEqual(self.response(listen).body[3], token)
+
+        # Token is issued on the relay
+        self.assertIn(token, self.server.relay._tokens)
+
+    def test_text(self):
+        binary = holepunch.message.BINARY
+        listen = self.request(binary.encode(holepunch.message.Message(method="<", id=1)))
+        self.request(b">127.0.0.1")
+
+        self.assertEqual(self.response(listen).body[3], 0)
+
+
+@unittest.mock.patch.object(holepunch.config, "LISTEN_TTL", 1.0)
+@unittest.mock.patch.object(holepunch.config, "IDLE_TIMEOUT", 0.3)
+class TestExpiry(ServerTestCase):
+    """
+    Test expiry of idle and listening clients
+    """
+
+    def test_idle_timeout(self):
+        idle = self.request(b"")
+        self.assertEqual(len(self.server.registry), 1)
+
+        self.run_server(0.5)
+
+        self.assertEqual(len(self.server.registry), 0)
+        self.assertEqual(idle.recv(1024), b".")
+
+    def test_listen_ttl(self):
+        listen = self.request(b"<")
+
+        # Listening client outlives the idle timeout
+        self.run_server(0.5)
+        self.assertIsNotNone(self.server.find_client(host="127.0.0.1"))
+
+        self.run_server(0.8)
+        self.assertIsNone(self.server.find_client(host="127.0.0.1"))
+        self.assertEqual(len(self.server.registry), 0)
+        self.assertEqual(listen.recv(1024), b".")
+
+    def test_listen_heartbeat(self):
+        listen = self.request(b"<")
+
+        # Listen requests repeated within the listen TTL keep client listening
+        for _ in range(3):
+            self.run_server(0.5)
+            listen.sendall(b"<")
+
+        self.assertIsNotNone(self.server.find_client(host="127.0.0.1"))
+
+
+class Listener:
+    """
+    Listening socket failing its first accept with an error
+    """
+
+    def __init__(self, sock, error):
+        self.sock = sock
+        self.error = error
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def accept(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise OSError(error, "accept failed")
+        return self.sock.accept()
+
+
+class TestAccept(ServerTestCase):
+    """
+    Test server accept errors
+    """
+
+    def test_aborted(self):
+        self.server._sock = Listener(self.server.sock, errno.ECONNABORTED)
+
+        self.connect()
+        self.run_server(0.05)
+
+        self.assertEqual(len(self.server.registry), 1)
+
+    def test_out_of_descriptors(self):
+        self.server._sock = Listener(self.server.sock, errno.EMFILE)
+
+        self.connect()
+        self.run_server(0.05)
+
+        # Server stops accepting, connection waits in the backlog
+        self.assertEqual(len(self.server.registry), 0)
+        self.assertNotIn(self.server, [key.fileobj for key in self.server.loop.selector.get_map().values()])
+
+        self.run_server(holepunch.config.ACCEPT_BACKOFF * 2)
+
+        self.assertEqual(len(self.server.registry), 1)
+
+    def test_resume_on_close(self):
+        client = self.connect()
+        self.run_server(0.05)
+
+        self.server.pause()
+
+        client.sendall(b".")
+        self.run_server(0.01)
+
+        self.assertEqual(len(self.server.registry), 0)
+        self.assertIn(self.server, [key.fileobj for key in self.server.loop.selector.get_map().values()])
+
+
+class Socket:
+    """
+    Socket accepting at most a limit of bytes per send
+    """
+
+    def __init__(self, sock, limit):
+        self.sock = sock
+        self.limit = limit
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def send(self, data):
+        if not self.limit:
+            raise BlockingIOError(errno.EAGAIN, "send would block")
+        return self.sock.send(data[:self.limit])
+
+
+class TestWrite(ServerTestCase):
+    """
+    Test non-blocking writes through the outbound buffer
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.sock = self.connect()
+        self.run_server()
+
+        (self.client,) = self.server.registry
+        self.client.sock = Socket(self.client.sock, 0)
+
+    def events(self):
+        return self.server.loop.selector.get_key(self.client).events
+
+    def message(self, size):
+        return holepunch.message.Message(method="?", body="x" * size)
+
+    def test_partial(self):
+        self.client.sock.limit = 4
+        self.client.send(self.message(16))
+
+        # Remainder is queued and flushed when write ready
+        self.assertTrue(self.client._wbuf)
+        self.assertEqual(self.events(), holepunch.loop.EVENT_READ | holepunch.loop.EVENT_WRITE)
+
+        self.client.sock.limit = 65536
+        self.run_server()
+
+        self.assertFalse(self.client._wbuf)
+        self.assertEqual(self.events(), holepunch.loop.EVENT_READ)
+        self.assertEqual(self.sock.recv(1024), holepunch.message.TEXT.encode(self.message(16)))
+
+    def test_watermarks(self):
+        self.client.send(self.message(holepunch.config.WRITE_BUFFER_HIGH))
+
+        # Reads stop above the high watermark
+        self.assertEqual(self.events(), holepunch.loop.EVENT_WRITE)
+
+        self.client.sock.limit = len(self.client._wbuf) - holepunch.config.WRITE_BUFFER_HIGH // 2
+        self.client.handle(holepunch.loop.EVENT_WRITE)
+
+        # Reads stay stopped until the buffer drains below the low watermark
+        self.assertEqual(self.events(), holepunch.loop.EVENT_WRITE)
+
+        self.client.sock.limit = len(self.client._wbuf) - holepunch.config.WRITE_BUFFER_LOW
+        self.client.handle(holepunch.loop.EVENT_WRITE)
+
+        self.assertEqual(self.events(), holepunch.loop.EVENT_READ | holepunch.loop.EVENT_WRITE)
+
+    def test_overflow(self):
+        self.client.send(self.message(holepunch.config.WRITE_BUFFER_LIMIT))
+
+        self.assertIsNone(self.client.addr)
+        self.assertEqual(len(self.server.registry), 0)
@@ -0,0 +1,188 @@
+import socket
+import unittest
+import unittest.mock
+
+import holepunch.loop
+import holepunch.server
+import holepunch.shard
+
+
+class Channel:
+    """
+    Broker side of a worker channel recording sent messages
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.slot = pid
+        self.sock, self.peer = socket.socketpair()
+        self.sent = []
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+        self.peer.close()
+
+    def send(self, data):
+        self.sent.append(holepunch.shard.decode(data))
+
+
+class TestBroker(unittest.TestCase):
+    """
+    Test broker routing of introductions across workers
+    """
+
+    def setUp(self):
+        self.broker = holepunch.shard.Broker(workers=2)
+        self.requester = Channel(1)
+        self.owner = Channel(2)
+
+        for channel in (self.requester, self.owner):
+            self.broker._channels[channel.pid] = channel
+            self.broker._loop.register(channel, holepunch.loop.EVENT_READ, lambda events: None)
+
+    def tearDown(self):
+        for channel in list(self.broker._channels.values()):
+            self.broker._loop.unregister(channel)
+            channel.close()
+        self.broker._loop.close()
+
+    def reap(self, channel):
+        with unittest.mock.patch("os.waitpid"), unittest.mock.patch.object(self.broker, "spawn") as spawn:
+            self.broker.reap(channel)
+
+        spawn.assert_called_once_with(channel.slot)
+
+    def test_introduce(self):
+        self.broker.publish(self.owner, "127.0.0.2", 40001)
+        self.broker.introduce(self.requester, 7, "127.0.0.2", "127.0.0.3", 40002, 0, 0)
+
+        forward_token = int(self.owner.sent[0][1])
+        self.broker.reply(["*", str(forward_token), "127.0.0.2", "40001", "0", "0"])
+
+        self.assertEqual(self.requester.sent, [["*", "7", "127.0.0.2", "40001", "0", "0"]])
+
+    def test_not_found(self):
+        self.broker.introduce(self.requester, 7, "127.0.0.2", "127.0.0.3", 40002, 0, 0)
+
+        self.assertEqual(self.requester.sent, [["?", "7"]])
+
+    def test_reap_owner(self):
+        self.broker.publish(self.owner, "127.0.0.2", 40001)
+        self.broker.introduce(self.requester, 7, "127.0.0.2", "127.0.0.3", 40002, 0, 0)
+
+        self.reap(self.owner)
+
+        # Introduction pending on the exited worker is answered not found
+        self.assertEqual(self.requester.sent, [["?", "7"]])
+        self.assertEqual(self.broker._pending, {})
+        self.assertEqual(self.broker._hosts, {})
+
+    def test_reap_requester(self):
+        self.broker.publish(self.owner, "127.0.0.2", 40001)
+        self.broker.introduce(self.requester, 7, "127.0.0.2", "127.0.0.3", 40002, 0, 0)
+
+        self.reap(self.requester)
+
+        # Introduction requested by the exited worker is dropped
+        self.assertEqual(self.broker._pending, {})
+        self.assertEqual(self.requester.sent, [])
+
+
+class TestBrokerChannel(unittest.TestCase):
+    """
+    Test broker handling of malformed worker messages
+    """
+
+    def setUp(self):
+        self.broker = holepunch.shard.Broker(workers=1)
+        sock, self.worker = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.channel = holepunch.shard.BrokerChannel(self.broker, sock, 1, 0)
+        self.broker._channels[self.channel.pid] = self.channel
+
+    def tearDown(self):
+        self.channel.close()
+        self.worker.close()
+        self.broker._loop.close()
+
+    def handle(self, data):
+        self.worker.send(data)
+        self.channel.handle()
+
+    def test_wrong_number_of_fields(self):
+        self.handle(b"> 7 a b 127.0.0.3 40002 0 0")
+        self.handle(b"> 7 127.0.0.2")
+        self.handle(b"+ 127.0.0.2")
+        self.handle(b"+ 127.0.0.2 port")
+        self.handle(b"\xc3\xa9")
+
+        self.assertEqual(self.broker._hosts, {})
+        self.assertEqual(self.broker._pending, {})
+
+        # Broker still routes well formed messages
+        self.handle(b"> 7 127.0.0.2 127.0.0.3 40002 0 0")
+        self.assertEqual(holepunch.shard.decode(self.worker.recv(4096)), ["?", "7"])
+
+
+class TestRelayToken(unittest.TestCase):
+    """
+    Test relay tokens issued by workers on the relay of the broker
+    """
+
+    def test_issue(self):
+        broker = holepunch.shard.Broker(workers=1, relay=True)
+        sock, worker = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        channel = holepunch.shard.BrokerChannel(broker, sock, 1, 0)
+
+        with sock, worker:
+            holepunch.shard.Channel(worker).issue(7)
+            channel.handle()
+
+        self.assertIn(7, broker._relay._tokens)
+        broker._loop.close()
+
+
+class TestChannel(unittest.TestCase):
+    """
+    Test worker handling of connect requests to invalid hosts
+    """
+
+    def setUp(self):
+        sock, self.broker = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.broker.setblocking(False)
+        self.server = holepunch.server.Server(channel=holepunch.shard.Channel(sock))
+        self.server.addr = ("127.0.0.1", 0)
+        self.server.open()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.server.close()
+        self.broker.close()
+
+    def request(self, data):
+        sock = socket.create_connection(self.server.sock.getsockname())
+        sock.settimeout(1)
+        self.socks.append(sock)
+        sock.sendall(data)
+        for _ in range(5):
+            self.server.loop.run_once(0.01)
+        return sock
+
+    def test_invalid_host(self):
+        for data in (">a b".encode(), ">é".encode(), b">"):
+            connect = self.request(data)
+
+            self.assertEqual(connect.recv(1024), b"?")
+
+        # No introduction is requested from broker
+        with self.assertRaises(BlockingIOError):
+            self.broker.recv(4096)
+
+    def test_valid_host(self):
+        self.request(b">127.0.0.2")
+
+        self.assertEqual(holepunch.shard.decode(self.broker.recv(4096))[:3], [">", "0", "127.0.0.2"])
@@ -0,0 +1,84 @@
+import unittest
+
+import holepunch.timer
+
+
+class TestTimerWheel(unittest.TestCase):
+    """
+    Test timer wheel expiry driven by a manual clock
+    """
+
+    def setUp(self):
+        self.now = 0.0
+        self.expired = []
+
+        # 4 slots per wheel, 3 wheels: 4, 16 and 64 ticks per turn
+        self.timers = holepunch.timer.TimerWheel(resolution=1, bits=2, levels=3, clock=lambda: self.now)
+
+    def schedule(self, delay, name=None):
+        return self.timers.schedule(delay, lambda: self.expired.append((name or delay, self.now)))
+
+    def advance(self, seconds):
+        for _ in range(int(seconds)):
+            self.now += 1
+            self.timers.advance()
+
+    def test_expiry(self):
+        self.schedule(3)
+
+        self.advance(2)
+        self.assertEqual(self.expired, [])
+
+        self.advance(1)
+        self.assertEqual(self.expired, [(3, 3)])
+        self.assertEqual(len(self.timers), 0)
+
+    def test_cascade(self):
+        for delay in (1, 5, 17, 40, 63):
+            self.schedule(delay)
+
+        self.advance(64)
+
+        self.assertEqual(self.expired, [(1, 1), (5, 5), (17, 17), (40, 40), (63, 63)])
+
+    def test_beyond_last_wheel(self):
+        self.schedule(200)
+
+        self.advance(199)
+        self.assertEqual(self.expired, [])
+
+        self.advance(1)
+        self.assertEqual(self.expired, [(200, 200)])
+
+    def test_cancel(self):
+        timer = self.schedule(20)
+        self.schedule(21)
+
+        timer.cancel()
+        timer.cancel()
+        self.assertEqual(len(self.timers), 1)
+
+        self.advance(21)
+        self.assertEqual(self.expired, [(21, 21)])
+
+    def test_cancel_same_slot(self):
+        timers = []
+
+        def cancel():
+            self.expired.append("first")
+            for timer in timers:
+                timer.cancel()
+
+        timers.append(self.timers.schedule(2, cancel))
+        timers.append(self.timers.schedule(2, cancel))
+
+        self.advance(2)
+        self.assertEqual(self.expired, ["first"])
+        self.assertEqual(len(self.timers), 0)
+
+    def test_timeout(self):
+        self.assertIsNone(self.timers.timeout())
+
+        self.schedule(10)
+        self.now = 0.25
+        self.assertEqual(self.timers.timeout(), 0.75)
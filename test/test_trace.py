@@ -0,0 +1,82 @@
+import logging
+import queue
+import unittest
+
+import holepunch.trace
+
+
+class Handler(logging.Handler):
+    """
+    Handler keeping trace records
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        if record.name == holepunch.trace.LOGGER:
+            self.records.append(record)
+
+
+class TestRing(unittest.TestCase):
+    """
+    Test bounded ring dropping the oldest records
+    """
+
+    def test_overflow(self):
+        ring = holepunch.trace.Ring(size=3, interval=0)
+        for item in range(5):
+            ring.put_nowait(item)
+
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.dropped, 2)
+        self.assertEqual([ring.get() for _ in range(3)], [2, 3, 4])
+
+        with self.assertRaises(queue.Empty):
+            ring.get(block=False)
+
+
+class TestTracer(unittest.TestCase):
+    """
+    Test sampled trace events formatted by the listener thread
+    """
+
+    def setUp(self):
+        level = logging.getLogger().level
+        self.addCleanup(logging.getLogger().setLevel, level)
+
+        self.handler = Handler()
+        self.tracer = holepunch.trace.Tracer()
+        self.tracer.open(self.handler)
+        self.addCleanup(self.tracer.close)
+
+    def test_prepare(self):
+        self.tracer.configure(level="INFO", sample=1)
+
+        self.tracer.event("Open server-client", addr=("203.0.113.7", 40001))
+        self.tracer.close()
+
+        record, = self.handler.records
+        self.assertEqual(record.getMessage(), "Open server-client addr=('203.0.113.7', 40001)")
+        self.assertEqual(record.trace, {"addr": ("203.0.113.7", 40001)})
+
+    def test_sampling(self):
+        self.tracer.configure(level="INFO", sample=3)
+
+        for id in range(7):
+            self.tracer.event("Event", id=id)
+        self.tracer.close()
+
+        # One event of every sample is recorded
+        self.assertEqual([record.trace["id"] for record in self.handler.records], [2, 5])
+
+    def test_disabled(self):
+        self.tracer.configure(level="WARNING")
+        self.assertFalse(self.tracer.enabled)
+
+        self.tracer.event("Event")
+        self.tracer.close()
+
+        self.assertEqual(self.handler.records, [])
+        self.assertEqual(len(self.tracer.ring), 0)
@@ -0,0 +1,119 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import holepunch.client
+import holepunch.transfer
+
+
+class TestTransfer(unittest.TestCase):
+    """
+    Test file transfer and resume between stream clients of a socket pair
+    """
+
+    def setUp(self):
+        self.sender = holepunch.client.TCPClient()
+        self.receiver = holepunch.client.TCPClient()
+        self.sender.sock, self.receiver.sock = socket.socketpair()
+        self.receiver.sock.settimeout(5)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        self.data = bytes(range(256)) * 4096
+        self.source = self.path("source")
+        with open(self.source, "wb") as file:
+            file.write(self.data)
+
+    def tearDown(self):
+        self.sender.sock.close()
+        self.receiver.sock.close()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def read(self, path):
+        with open(path, "rb") as file:
+            return file.read()
+
+    def transfer(self, path):
+        reports = []
+        thread = threading.Thread(target=lambda: reports.append(self.sender.send_file(self.source)))
+        thread.start()
+
+        report = self.receiver.recv_file(path)
+        thread.join()
+
+        self.assertEqual(reports[0]["bytes"], report["bytes"])
+        return report
+
+    def test_transfer(self):
+        report = self.transfer(self.path("dest"))
+
+        self.assertEqual(self.read(self.path("dest")), self.data)
+        self.assertEqual((report["size"], report["offset"], report["bytes"]), (len(self.data), 0, len(self.data)))
+
+    def test_directory(self):
+        os.mkdir(self.path("received"))
+
+        report = self.transfer(self.path("received"))
+
+        # File name of the offer is received into the directory
+        self.assertEqual(report["path"], os.path.join(self.path("received"), "source"))
+        self.assertEqual(self.read(report["path"]), self.data)
+
+    def test_resume(self):
+        with open(self.path("dest"), "wb") as file:
+            file.write(self.data[:100000])
+
+        report = self.transfer(self.path("dest"))
+
+        self.assertEqual(self.read(self.path("dest")), self.data)
+        self.assertEqual((report["offset"], report["bytes"]), (100000, len(self.data) - 100000))
+
+    def test_larger_destination(self):
+        with open(self.path("dest"), "wb") as file:
+            file.write(b"x" * (len(self.data) + 1))
+
+        report = self.transfer(self.path("dest"))
+
+        # Destination is not a part of the offered file, it is overwritten
+        self.assertEqual(report["offset"], 0)
+        self.assertEqual(self.read(self.path("dest")), self.data)
+
+    def test_without_sendfile(self):
+        with unittest.mock.patch.dict(os.__dict__):
+            os.__dict__.pop("sendfile", None)
+            self.transfer(self.path("dest"))
+
+        self.assertEqual(self.read(self.path("dest")), self.data)
+
+    def test_interrupted(self):
+        def interrupt():
+            self.sender.send_frame(holepunch.transfer.OFFER.pack(len(self.data)), b"source")
+            offset = holepunch.transfer.recv_offset(self.sender)
+            self.sender.sock.sendall(self.data[offset:offset + 50000])
+            self.sender.sock.shutdown(socket.SHUT_WR)
+
+        thread = threading.Thread(target=interrupt)
+        thread.start()
+
+        with self.assertRaises(ConnectionError):
+            self.receiver.recv_file(self.path("dest"))
+        thread.join()
+
+        # Bytes received are kept, a new transfer resumes from them
+        self.assertEqual(self.read(self.path("dest")), self.data[:50000])
+
+        self.sender.sock.close()
+        self.receiver.sock.close()
+        self.sender.sock, self.receiver.sock = socket.socketpair()
+        self.sender._frames = self.receiver._frames = None
+
+        report = self.transfer(self.path("dest"))
+
+        self.assertEqual(report["offset"], 50000)
+        self.assertEqual(self.read(self.path("dest")), self.data)
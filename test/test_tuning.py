@@ -0,0 +1,135 @@
+import json
+import os
+import resource
+import socket
+import tempfile
+import unittest
+import unittest.mock
+
+import holepunch.tuning
+
+
+class TestParse(unittest.TestCase):
+    """
+    Test parsing of tuning option values
+    """
+
+    def test_parse(self):
+        self.assertEqual(holepunch.tuning.parse("backlog", "4096"), 4096)
+        self.assertEqual(holepunch.tuning.parse("nodelay", "on"), True)
+        self.assertEqual(holepunch.tuning.parse("nodelay", "0"), False)
+        self.assertEqual(holepunch.tuning.parse("sndbuf", 16384.0), 16384)
+
+    def test_malformed(self):
+        for option, value in (("color", "1"), ("backlog", "many"), ("nodelay", "maybe")):
+            with self.assertRaises(ValueError):
+                holepunch.tuning.parse(option, value)
+
+
+class TestProfile(unittest.TestCase):
+    """
+    Test presets, overrides and options applied to sockets
+    """
+
+    def test_preset(self):
+        profile = holepunch.tuning.Profile("low-latency", backlog="64")
+
+        self.assertEqual(profile.options["nodelay"], True)
+        self.assertEqual(profile.options["sndbuf"], holepunch.tuning.PRESETS["default"]["sndbuf"])
+        self.assertEqual(profile.backlog, 64)
+
+        with self.assertRaises(ValueError):
+            holepunch.tuning.Profile("fastest")
+
+    def test_listen(self):
+        profile = holepunch.tuning.Profile(nodelay=True, keepalive=30, rcvbuf=65536)
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            profile.listen(sock)
+
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 1)
+            self.assertEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE), 1)
+            self.assertGreaterEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 65536)
+
+
+@unittest.mock.patch.object(holepunch.tuning, "PROFILE", None)
+class TestLoad(unittest.TestCase):
+    """
+    Test profile loaded from preset, file, environment and command line
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        self.file = os.path.join(self.directory.name, "tuning.json")
+        with open(self.file, "w") as file:
+            json.dump({"profile": "high-fanout", "backlog": 1024, "nodelay": True}, file)
+
+    def test_default(self):
+        profile = holepunch.tuning.load(environ={})
+
+        self.assertEqual(profile.name, "default")
+        self.assertIs(holepunch.tuning.PROFILE, profile)
+
+    def test_file(self):
+        profile = holepunch.tuning.load(path=self.file, environ={})
+
+        self.assertEqual(profile.name, "high-fanout")
+        self.assertEqual((profile.backlog, profile.options["nodelay"]), (1024, True))
+
+    def test_overrides(self):
+        environ = {
+            "HOLEPUNCH_TUNING": "low-latency",
+            "HOLEPUNCH_TUNING_FILE": self.file,
+            "HOLEPUNCH_TUNING_BACKLOG": "2048",
+            "HOLEPUNCH_TUNING_NODELAY": "off",
+        }
+
+        # Environment overrides the file, command line overrides both
+        profile = holepunch.tuning.load(environ=environ)
+        self.assertEqual(profile.name, "low-latency")
+        self.assertEqual((profile.backlog, profile.options["nodelay"]), (2048, False))
+
+        profile = holepunch.tuning.load("default", overrides={"backlog": "4096"}, environ=environ)
+        self.assertEqual(profile.name, "default")
+        self.assertEqual(profile.backlog, 4096)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            holepunch.tuning.load(environ={"HOLEPUNCH_TUNING_COLOR": "1"})
+
+        with self.assertRaises(OSError):
+            holepunch.tuning.load(path=os.path.join(self.directory.name, "missing.json"), environ={})
+
+
+class TestLimits(unittest.TestCase):
+    """
+    Test open file descriptor limit raised by the tuning profile
+    """
+
+    def limits(self, nofile, soft=1024, hard=4096):
+        with unittest.mock.patch.object(resource, "getrlimit", return_value=(soft, hard)), \
+                unittest.mock.patch.object(resource, "setrlimit") as setrlimit:
+            holepunch.tuning.Profile(nofile=nofile).limits()
+
+        return [call.args[1] for call in setrlimit.call_args_list]
+
+    def test_default(self):
+        # Process limit is kept unless tuned
+        self.assertEqual(holepunch.tuning.Profile().options["nofile"], 0)
+        self.assertEqual(self.limits(0), [])
+
+    def test_hard(self):
+        self.assertEqual(self.limits(-1), [(4096, 4096)])
+        self.assertEqual(holepunch.tuning.Profile("high-fanout").options["nofile"], -1)
+
+    def test_capped(self):
+        self.assertEqual(self.limits(2048), [(2048, 4096)])
+        self.assertEqual(self.limits(8192), [(4096, 4096)])
+
+    def test_never_lowered(self):
+        self.assertEqual(self.limits(512), [])
+        self.assertEqual(self.limits(-1, soft=4096), [])
+        self.assertEqual(self.limits(-1, soft=resource.RLIM_INFINITY, hard=resource.RLIM_INFINITY), [])